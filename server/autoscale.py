@@ -0,0 +1,94 @@
+import os
+import numpy as np
+import cv2
+from preprocessing import MAX_RESIZE_PIXELS, to_gray
+from text_gate import MAX_CANDIDATES, character_boxes, text_runs
+
+# Scale images automatically unless a request says otherwise
+AUTOSCALE_DEFAULT = os.environ.get('OCR_AUTOSCALE', '0').lower() in ('true', '1', 't')
+
+# Character height in pixels the image is scaled towards, per quality; larger text costs more detector
+# compute, smaller text loses recognition accuracy
+AUTOSCALE_TARGETS = {
+    'fast': int(os.environ.get('OCR_AUTOSCALE_TARGET_FAST', 16)),
+    'standard': int(os.environ.get('OCR_AUTOSCALE_TARGET', 24)),
+    'best': int(os.environ.get('OCR_AUTOSCALE_TARGET_BEST', 32)),
+}
+# Text within this factor of the target is left alone
+AUTOSCALE_TOLERANCE = float(os.environ.get('OCR_AUTOSCALE_TOLERANCE', 1.3))
+AUTOSCALE_MAX_UPSCALE = float(os.environ.get('OCR_AUTOSCALE_MAX_UPSCALE', 3.0))
+# Text height is measured on a copy whose longest side is at most this many pixels
+AUTOSCALE_ESTIMATE_MAX_SIDE = int(os.environ.get('OCR_AUTOSCALE_ESTIMATE_MAX_SIDE', 2048))
+
+# Characters that must be found before their height is trusted
+MIN_CHARACTERS = 5
+# Smallest side a downscaled image may have
+MIN_SIDE = 32
+
+
+def estimate_text_height(img):
+    """Area-weighted median height of the characters in text runs, at the image's own scale, or None if too few."""
+    gray = to_gray(img)
+    height, width = gray.shape
+    scale = min(1.0, AUTOSCALE_ESTIMATE_MAX_SIDE / float(max(height, width)))
+    if scale < 1:
+        gray = cv2.resize(gray, None, fx=scale, fy=scale, interpolation=cv2.INTER_AREA)
+
+    boxes = character_boxes(gray, cv2.Canny(gray, 50, 150))
+    # Very busy images skip the run analysis; their character-like blobs are enough for a median
+    if len(boxes) <= MAX_CANDIDATES:
+        boxes = text_runs(boxes)
+    if len(boxes) < MIN_CHARACTERS:
+        return None
+
+    # Weight by box area so specks of noise that happen to line up cannot outvote the glyphs
+    heights = boxes[:, 3].astype(np.float64)
+    order = np.argsort(heights)
+    weights = np.cumsum((boxes[:, 2] * boxes[:, 3]).astype(np.float64)[order])
+    median = heights[order][np.searchsorted(weights, weights[-1] / 2)]
+    return float(median) / scale
+
+
+def choose_scale(text_height, shape, quality):
+    """Scale factor that brings text_height to the quality's target, or 1.0 when it is close enough."""
+    if not text_height:
+        return 1.0
+    scale = AUTOSCALE_TARGETS.get(quality, AUTOSCALE_TARGETS['standard']) / text_height
+    if 1 / AUTOSCALE_TOLERANCE <= scale <= AUTOSCALE_TOLERANCE:
+        return 1.0
+
+    height, width = shape[:2]
+    scale = max(scale, MIN_SIDE / float(min(height, width)))
+    scale = min(scale, AUTOSCALE_MAX_UPSCALE)
+    if scale > 1 and height * width * scale * scale > MAX_RESIZE_PIXELS:
+        scale = (MAX_RESIZE_PIXELS / float(height * width)) ** 0.5
+    return 1.0 if abs(scale - 1.0) < 0.05 else scale
+
+
+def autoscale_image(img, quality):
+    """Resize img so its dominant text height lands on the quality's target.
+
+    Returns (image, scale, info). Boxes found on the returned image are divided by scale, the exact factor
+    the image was resized by, to map them back onto img; info reports the measured text height and the
+    scale rounded for responses.
+    """
+    text_height = estimate_text_height(img)
+    scale = choose_scale(text_height, img.shape, quality)
+    info = {'text_height': round(text_height, 1) if text_height else None, 'scale': round(scale, 3)}
+    if scale == 1.0:
+        return img, scale, info
+    interpolation = cv2.INTER_CUBIC if scale > 1 else cv2.INTER_AREA
+    return cv2.resize(img, None, fx=scale, fy=scale, interpolation=interpolation), scale, info
+
+
+def unscale_box(box, scale):
+    return [[int(round(x / scale)), int(round(y / scale))] for x, y in box]
+
+
+def unscale_result(result, scale):
+    """Map the boxes of EasyOCR regions found on a scaled image back to the original image."""
+    if scale == 1.0:
+        return result
+    # detail=0 results are bare strings without boxes
+    return [region if isinstance(region, str) else [unscale_box(region[0], scale)] + list(region[1:])
+            for region in result]
@@ -0,0 +1,43 @@
+"""Microbenchmark for the preserve_layout reconstruction in layout.py.
+
+Times layout.layout_text against the original per-box implementation from 100 to 10k regions. That
+the two produce the same text is checked by tests/test_layout.py, which also holds the reference.
+
+    python benchmarks/bench_layout.py [--sizes 100,1000,10000] [--repeat 5]
+"""
+import os
+import sys
+import time
+import argparse
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from layout import layout_text  # noqa: E402
+from tests.test_layout import legacy_layout_text, synthetic_regions  # noqa: E402
+
+
+def best_time(fn, result, repeat):
+    timings = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        fn(result)
+        timings.append(time.perf_counter() - start)
+    return min(timings)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--sizes', default='100,1000,10000')
+    parser.add_argument('--repeat', type=int, default=5)
+    args = parser.parse_args()
+
+    print(f"{'regions':>8} {'legacy ms':>10} {'layout ms':>10} {'speedup':>8}")
+    for size in (int(s) for s in args.sizes.split(',')):
+        result = synthetic_regions(size, seed=size)
+        legacy = best_time(legacy_layout_text, result, args.repeat)
+        vectorized = best_time(layout_text, result, args.repeat)
+        print(f"{size:>8} {legacy * 1000:>10.2f} {vectorized * 1000:>10.2f} {legacy / vectorized:>7.1f}x")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,164 @@
+import os
+import re
+import json
+import time
+import hashlib
+import logging
+import threading
+from collections import OrderedDict
+from functools import lru_cache
+from typing import Any, Dict, List, Optional, Tuple
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+
+def normalize_messages(messages: List[Dict[str, str]]) -> List[Tuple[str, str]]:
+    """Role and content of each message with runs of whitespace collapsed"""
+    return [(msg.get("role", ""), re.sub(r"\s+", " ", msg.get("content", "")).strip()) for msg in messages]
+
+
+def history_key(model: str, messages: List[Tuple[str, str]]) -> str:
+    return hashlib.sha256(json.dumps([model, messages]).encode("utf-8")).hexdigest()
+
+
+class CachedResponse:
+    def __init__(self, response: str, metadata: Dict[str, Any], context_key: str, embedding: Optional[np.ndarray]):
+        self.response = response
+        self.metadata = metadata
+        self.context_key = context_key  # Model plus every message before the final user turn
+        self.embedding = embedding  # Unit-length embedding of the final user turn, for the semantic tier
+        self.created = time.time()
+
+
+class ChatResponseCache:
+    """Chat responses keyed by model and normalized history, with an optional semantic tier.
+
+    The exact tier needs the whole normalized history to match. The semantic tier needs everything
+    before the final user message to match exactly and the final message to be at least
+    similarity_threshold cosine-similar to a cached one, so a near-duplicate question about the same
+    document can be answered from the cache, while the same question about a different document cannot.
+    """
+    def __init__(self, max_entries: int = 0, ttl: float = 3600, semantic: bool = False,
+                 similarity_threshold: float = 0.92, embedding_model: str = "sentence-transformers/all-MiniLM-L6-v2"):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.semantic = semantic
+        self.similarity_threshold = similarity_threshold
+        self.embedding_model_name = embedding_model
+        self.embedding_model = None
+        self.entries: "OrderedDict[str, CachedResponse]" = OrderedDict()
+        self.lock = threading.Lock()
+        self.model_lock = threading.Lock()
+        self.hits = 0
+        self.semantic_hits = 0
+        self.misses = 0
+        self.evictions = 0
+        # Lookups and stores of the same question embed it only once
+        self.embed = lru_cache(maxsize=256)(self._embed)
+
+    @property
+    def enabled(self) -> bool:
+        return self.max_entries > 0
+
+    def _embed(self, text: str) -> Optional[np.ndarray]:
+        with self.model_lock:
+            if self.embedding_model is None:
+                try:
+                    # Imported here; sentence-transformers pulls in torch
+                    from sentence_transformers import SentenceTransformer
+                    self.embedding_model = SentenceTransformer(self.embedding_model_name)
+                except Exception as e:
+                    logger.warning(f"Semantic chat cache disabled, could not load {self.embedding_model_name}: {e}")
+                    self.semantic = False
+                    return None
+            model = self.embedding_model
+        return np.asarray(model.encode(text, normalize_embeddings=True), dtype=np.float32)
+
+    @staticmethod
+    def split_history(model: str, messages: List[Dict[str, str]]) -> Tuple[str, str, Optional[str]]:
+        """Return (exact key, context key, final user message or None)"""
+        normalized = normalize_messages(messages)
+        if normalized and normalized[-1][0] == "user":
+            return history_key(model, normalized), history_key(model, normalized[:-1]), normalized[-1][1]
+        return history_key(model, normalized), history_key(model, normalized), None
+
+    def _expire(self) -> None:
+        # Callers hold self.lock; entries are in insertion/use order, not creation order, so scan them all
+        cutoff = time.time() - self.ttl
+        for key in [key for key, entry in self.entries.items() if entry.created < cutoff]:
+            del self.entries[key]
+            self.evictions += 1
+
+    def get(self, model: str, messages: List[Dict[str, str]]) -> Optional[Tuple[str, Dict[str, Any]]]:
+        """Return (response, metadata) for a cached answer, with metadata marking the hit, or None"""
+        if not self.enabled:
+            return None
+        key, context_key, question = self.split_history(model, messages)
+        with self.lock:
+            self._expire()
+            entry = self.entries.get(key)
+            if entry is not None:
+                self.entries.move_to_end(key)
+                self.hits += 1
+                return entry.response, dict(entry.metadata, cache="exact")
+            candidates = [(k, e) for k, e in self.entries.items()
+                          if e.context_key == context_key and e.embedding is not None]
+
+        if self.semantic and question and candidates:
+            embedding = self.embed(question)
+            if embedding is not None:
+                similarities = np.stack([e.embedding for _, e in candidates]) @ embedding
+                best = int(np.argmax(similarities))
+                if similarities[best] >= self.similarity_threshold:
+                    best_key, entry = candidates[best]
+                    with self.lock:
+                        if best_key in self.entries:
+                            self.entries.move_to_end(best_key)
+                        self.hits += 1
+                        self.semantic_hits += 1
+                    return entry.response, dict(entry.metadata, cache="semantic",
+                                                 similarity=round(float(similarities[best]), 4))
+
+        with self.lock:
+            self.misses += 1
+        return None
+
+    def put(self, model: str, messages: List[Dict[str, str]], response: str, metadata: Dict[str, Any]) -> None:
+        if not self.enabled or not metadata or "error" in metadata:
+            return
+        key, context_key, question = self.split_history(model, messages)
+        embedding = self.embed(question) if self.semantic and question else None
+        with self.lock:
+            self.entries[key] = CachedResponse(response, metadata, context_key, embedding)
+            self.entries.move_to_end(key)
+            while len(self.entries) > self.max_entries:
+                self.entries.popitem(last=False)
+                self.evictions += 1
+
+    def stats(self) -> Dict[str, Any]:
+        with self.lock:
+            lookups = self.hits + self.misses
+            return {
+                "enabled": self.enabled,
+                "semantic": self.semantic,
+                "entries": len(self.entries),
+                "max_entries": self.max_entries,
+                "ttl": self.ttl,
+                "hits": self.hits,
+                "semantic_hits": self.semantic_hits,
+                "misses": self.misses,
+                "evictions": self.evictions,
+                "hit_rate": round(self.hits / lookups, 3) if lookups else 0.0
+            }
+
+
+def create_chat_cache() -> ChatResponseCache:
+    """Build the chat response cache from environment configuration (disabled unless CHAT_CACHE_MAX_ENTRIES is set)"""
+    return ChatResponseCache(
+        max_entries=int(os.environ.get("CHAT_CACHE_MAX_ENTRIES", 0)),
+        ttl=float(os.environ.get("CHAT_CACHE_TTL", 3600)),
+        semantic=os.environ.get("CHAT_CACHE_SEMANTIC", "0").lower() in ("true", "1", "t"),
+        similarity_threshold=float(os.environ.get("CHAT_CACHE_SIMILARITY", 0.92)),
+        embedding_model=os.environ.get("CHAT_CACHE_EMBEDDING_MODEL", "sentence-transformers/all-MiniLM-L6-v2")
+    )
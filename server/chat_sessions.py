@@ -0,0 +1,108 @@
+import os
+import time
+import logging
+import threading
+from collections import OrderedDict
+from typing import Any, Dict, List, Optional
+
+logger = logging.getLogger(__name__)
+
+
+def cache_nbytes(cache: Any) -> int:
+    """Bytes held by the key/value tensors of a transformers cache object"""
+    if hasattr(cache, "layers"):
+        tensors = [t for layer in cache.layers for t in (getattr(layer, "keys", None), getattr(layer, "values", None))]
+    elif hasattr(cache, "key_cache"):
+        tensors = list(cache.key_cache) + list(cache.value_cache)
+    else:
+        tensors = [t for layer in cache for t in layer]
+    return sum(t.numel() * t.element_size() for t in tensors if t is not None and hasattr(t, "numel"))
+
+
+def common_prefix_length(a: List[int], b: List[int]) -> int:
+    length = min(len(a), len(b))
+    for i in range(length):
+        if a[i] != b[i]:
+            return i
+    return length
+
+
+class SessionEntry:
+    def __init__(self, token_ids: List[int], cache: Any):
+        self.token_ids = token_ids  # Tokens whose keys and values are held in cache
+        self.cache = cache
+        self.size = cache_nbytes(cache)
+        self.last_used = time.time()
+
+
+class SessionCache:
+    """KV caches of local-model conversations, keyed by conversation id and LRU-evicted under a memory budget"""
+    def __init__(self, max_sessions: int = 16, max_bytes: int = 512 * 1024 * 1024):
+        self.max_sessions = max_sessions
+        self.max_bytes = max_bytes
+        self.entries: "OrderedDict[str, SessionEntry]" = OrderedDict()
+        self.lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.reused_tokens = 0
+        self.prefilled_tokens = 0
+
+    @property
+    def enabled(self) -> bool:
+        return self.max_sessions > 0 and self.max_bytes > 0
+
+    def take(self, conversation_id: str) -> Optional[SessionEntry]:
+        """Remove and return a conversation's cache; generation mutates it, so only one request may hold it"""
+        with self.lock:
+            entry = self.entries.pop(conversation_id, None)
+            if entry is None:
+                self.misses += 1
+            else:
+                self.hits += 1
+            return entry
+
+    def store(self, conversation_id: str, token_ids: List[int], cache: Any) -> None:
+        if not self.enabled:
+            return
+        entry = SessionEntry(token_ids, cache)
+        if entry.size > self.max_bytes:
+            logger.info(f"KV cache for conversation {conversation_id} exceeds the budget; not kept")
+            return
+        with self.lock:
+            self.entries[conversation_id] = entry
+            self.entries.move_to_end(conversation_id)
+            while len(self.entries) > self.max_sessions or self._total_bytes() > self.max_bytes:
+                evicted_id, _ = self.entries.popitem(last=False)
+                self.evictions += 1
+                logger.info(f"Evicted KV cache for conversation {evicted_id}")
+
+    def record(self, reused: int, prefilled: int) -> None:
+        with self.lock:
+            self.reused_tokens += reused
+            self.prefilled_tokens += prefilled
+
+    def _total_bytes(self) -> int:
+        return sum(entry.size for entry in self.entries.values())
+
+    def stats(self) -> Dict[str, Any]:
+        with self.lock:
+            return {
+                "sessions": len(self.entries),
+                "max_sessions": self.max_sessions,
+                "bytes": self._total_bytes(),
+                "max_bytes": self.max_bytes,
+                "hits": self.hits,
+                "misses": self.misses,
+                "evictions": self.evictions,
+                "reused_tokens": self.reused_tokens,
+                "prefilled_tokens": self.prefilled_tokens
+            }
+
+
+def create_session_cache() -> SessionCache:
+    """Build the session cache from environment configuration"""
+    return SessionCache(
+        max_sessions=int(os.environ.get("LOCAL_KV_CACHE_SESSIONS", 16)),
+        max_bytes=int(float(os.environ.get("LOCAL_KV_CACHE_MB", 512)) * 1024 * 1024)
+    )
@@ -1,28 +1,92 @@
 import os
 import time
+import hashlib
 import logging
-from typing import List, Dict, Any, Optional, Tuple
+import threading
+from collections import OrderedDict
+from importlib.util import find_spec
+from typing import List, Dict, Any, Optional, Tuple, Iterator
+from chat_sessions import create_session_cache, common_prefix_length
+from generation_batcher import create_generation_batcher
+from chat_cache import create_chat_cache
 
 # Setup logging
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
-# Try importing Anthropic library for Claude API
-try:
-    import anthropic
-    ANTHROPIC_AVAILABLE = True
-except ImportError:
+# Check for the Anthropic library for Claude API; it is imported when the first client is created
+ANTHROPIC_AVAILABLE = find_spec("anthropic") is not None
+if not ANTHROPIC_AVAILABLE:
     logger.warning("Anthropic library not found. API mode will be unavailable.")
-    ANTHROPIC_AVAILABLE = False
-
-# Try importing libraries for local model
-try:
-    import torch
-    from transformers import AutoModelForCausalLM, AutoTokenizer, pipeline
-    LOCAL_MODEL_AVAILABLE = torch.cuda.is_available()  # Check if GPU is available
-except ImportError:
+
+# Libraries for the local model are only looked up here; torch and transformers take seconds and hundreds
+# of MB to import, so they are imported when the model is first loaded
+LOCAL_MODEL_AVAILABLE = find_spec("torch") is not None and find_spec("transformers") is not None
+if not LOCAL_MODEL_AVAILABLE:
     logger.warning("Transformers/torch libraries not found. Local model will be unavailable.")
-    LOCAL_MODEL_AVAILABLE = False
+
+# Local model states reported by /chat/health
+MODEL_UNAVAILABLE = "unavailable"
+MODEL_NOT_LOADED = "not_loaded"
+MODEL_LOADING = "loading"
+MODEL_READY = "ready"
+MODEL_FAILED = "failed"
+
+API_MODEL = "claude-3-sonnet-20240229"
+API_MAX_TOKENS = 1000
+
+LOCAL_GENERATION_ARGS = {"max_new_tokens": 500, "temperature": 0.7, "do_sample": True, "top_p": 0.95}
+
+class ApiClientCache:
+    """Long-lived API clients keyed by a hash of the API key, so each key keeps its connection pool"""
+    def __init__(self, max_clients: int = 8, base_url: Optional[str] = None):
+        self.max_clients = max_clients
+        self.base_url = base_url  # Point at a stub server in tests
+        self.clients: "OrderedDict[str, Any]" = OrderedDict()
+        self.lock = threading.Lock()
+        self.created = 0
+        self.hits = 0
+        self.evictions = 0
+
+    @staticmethod
+    def key_hash(api_key: str) -> str:
+        # Raw keys are never kept as dictionary keys
+        return hashlib.sha256(api_key.encode("utf-8")).hexdigest()
+
+    def get(self, api_key: str) -> Any:
+        """Return the client for this key, creating it (and evicting the least recently used) if needed"""
+        key = self.key_hash(api_key)
+        with self.lock:
+            client = self.clients.get(key)
+            if client is not None:
+                self.clients.move_to_end(key)
+                self.hits += 1
+                return client
+
+            import anthropic
+            options = {"api_key": api_key}
+            if self.base_url:
+                options["base_url"] = self.base_url
+            client = anthropic.Anthropic(**options)
+            self.clients[key] = client
+            self.created += 1
+
+            # Evicted clients are only dropped, not closed, since another request may still be streaming
+            # through one; the connection pool closes when the client is garbage collected
+            while len(self.clients) > self.max_clients:
+                self.clients.popitem(last=False)
+                self.evictions += 1
+            return client
+
+    def stats(self) -> Dict[str, Any]:
+        with self.lock:
+            return {
+                "clients": len(self.clients),
+                "max_clients": self.max_clients,
+                "created": self.created,
+                "hits": self.hits,
+                "evictions": self.evictions
+            }
 
 class Message:
     def __init__(self, role: str, content: str):
@@ -33,13 +97,31 @@ class Message:
         return {"role": self.role, "content": self.content}
 
 class ClaudeService:
-    def __init__(self, api_key: Optional[str] = None, local_model_path: str = "TinyLlama/TinyLlama-1.1B-Chat-v1.0"):
+    def __init__(self, api_key: Optional[str] = None, local_model_path: Optional[str] = None):
         self.api_key = api_key
         self.client = None
         self.local_model = None
         self.local_tokenizer = None
-        self.local_model_path = local_model_path
+        self.local_model_path = local_model_path or os.environ.get("LOCAL_MODEL_PATH", "TinyLlama/TinyLlama-1.1B-Chat-v1.0")
         self.model_loaded = False
+        self.model_state = MODEL_NOT_LOADED if LOCAL_MODEL_AVAILABLE else MODEL_UNAVAILABLE
+        self.model_error = None
+        self.load_lock = threading.Lock()
+        self.start_lock = threading.Lock()  # makes checking and claiming a background load one step
+        # int8 dynamic quantization of the linear layers when running on the CPU ("none" to disable)
+        self.cpu_quantization = os.environ.get("LOCAL_MODEL_QUANTIZE", "int8").lower()
+        # Per-conversation KV caches so each local turn only prefills the new tokens
+        self.sessions = create_session_cache()
+        # All local generation runs on the batcher's thread, which also keeps the model single-threaded
+        self.batcher = create_generation_batcher(self.run_local_batch)
+        self.stats_lock = threading.Lock()
+        self.response_cache = create_chat_cache()
+        self.generated_tokens = 0
+        self.generation_seconds = 0.0
+        self.clients = ApiClientCache(
+            max_clients=int(os.environ.get("CLAUDE_CLIENT_CACHE_SIZE", 8)),
+            base_url=os.environ.get("CLAUDE_API_BASE_URL") or None
+        )
 
     def init_api_client(self, api_key: Optional[str] = None) -> bool:
         """Initialize the Claude API client with the provided API key"""
@@ -54,64 +136,120 @@ class ClaudeService:
                 return False
                 
             self.api_key = key_to_use
-            self.client = anthropic.Anthropic(api_key=key_to_use)
+            self.client = self.clients.get(key_to_use)
             return True
         except Exception as e:
             logger.error(f"Failed to initialize Claude API client: {e}")
             return False
 
     def load_local_model(self) -> bool:
-        """Load a local model for offline use"""
+        """Load a local model for offline use, waiting for a background load already in progress"""
         if not LOCAL_MODEL_AVAILABLE:
-            logger.error("Required libraries missing or GPU unavailable. Cannot load local model.")
+            logger.error("Required libraries missing. Cannot load local model.")
             return False
+        
+        with self.load_lock:
+            if self.model_loaded:
+                return True
             
-        try:
-            logger.info(f"Loading local model from {self.local_model_path}")
-            self.local_tokenizer = AutoTokenizer.from_pretrained(self.local_model_path)
-            
-            # Use lower precision for efficiency
-            self.local_model = AutoModelForCausalLM.from_pretrained(
-                self.local_model_path, 
-                torch_dtype=torch.float16 if torch.cuda.is_available() else torch.float32,
-                device_map="auto" if torch.cuda.is_available() else None
-            )
-            
-            self.model_loaded = True
-            logger.info("Local model loaded successfully")
-            return True
-        except Exception as e:
-            logger.error(f"Failed to load local model: {e}")
-            return False
+            try:
+                self.model_state = MODEL_LOADING
+                start_time = time.time()
+                import torch
+                from transformers import AutoModelForCausalLM, AutoTokenizer
+                
+                logger.info(f"Loading local model from {self.local_model_path}")
+                self.local_tokenizer = AutoTokenizer.from_pretrained(self.local_model_path)
+                # Batched prompts are padded on the left so every row continues from its last token
+                self.local_tokenizer.padding_side = "left"
+                if self.local_tokenizer.pad_token is None:
+                    self.local_tokenizer.pad_token = self.local_tokenizer.eos_token
+                
+                # Use lower precision for efficiency; low_cpu_mem_usage memory-maps safetensors weights
+                # instead of building a randomly initialised model first
+                use_gpu = torch.cuda.is_available()
+                model = AutoModelForCausalLM.from_pretrained(
+                    self.local_model_path, 
+                    torch_dtype=torch.float16 if use_gpu else torch.float32,
+                    device_map="auto" if use_gpu else None,
+                    low_cpu_mem_usage=True
+                )
+                model.eval()
+                
+                if not use_gpu and self.cpu_quantization == "int8":
+                    # Store linear weights as int8 and quantize activations on the fly: roughly a quarter
+                    # of the float32 weight memory and faster matmuls on CPUs without a GPU
+                    model = torch.ao.quantization.quantize_dynamic(model, {torch.nn.Linear}, dtype=torch.qint8,
+                                                                   inplace=True)
+                
+                self.local_model = model
+                self.model_loaded = True
+                self.model_state = MODEL_READY
+                self.model_error = None
+                logger.info(f"Local model loaded in {time.time() - start_time:.1f}s "
+                            f"({'GPU' if use_gpu else 'CPU, ' + self.cpu_quantization})")
+                return True
+            except Exception as e:
+                logger.error(f"Failed to load local model: {e}")
+                self.model_state = MODEL_FAILED
+                self.model_error = str(e)
+                return False
+
+    def start_loading_local_model(self) -> str:
+        """Load the local model on a background thread if it is not loaded yet; returns the model state"""
+        with self.start_lock:
+            if self.model_state != MODEL_NOT_LOADED:
+                return self.model_state
+            self.model_state = MODEL_LOADING
+        thread = threading.Thread(target=self.load_local_model, name="local-model-load", daemon=True)
+        thread.start()
+        return MODEL_LOADING
             
-    def generate_response_api(self, messages: List[Dict[str, str]]) -> Tuple[str, Dict[str, Any]]:
+    def get_api_client(self, api_key: Optional[str] = None) -> Any:
+        """Return a cached client for the given key, or for the default key when none is given"""
+        if not ANTHROPIC_AVAILABLE:
+            return None
+        key_to_use = api_key or self.api_key
+        if not key_to_use:
+            return None
+        return self.clients.get(key_to_use)
+
+    @staticmethod
+    def format_api_messages(messages: List[Dict[str, str]]) -> Tuple[Optional[str], List[Dict[str, str]]]:
+        """Split messages into the system prompt and the user/assistant turns the Messages API expects"""
+        system_parts = []
+        formatted_messages = []
+        for msg in messages:
+            if msg["role"] in ("user", "assistant"):
+                formatted_messages.append({"role": msg["role"], "content": msg["content"]})
+            elif msg["role"] == "system":
+                # The API takes the system prompt as a separate parameter, not as a message
+                system_parts.append(msg["content"])
+        return "\n\n".join(system_parts) or None, formatted_messages
+
+    def api_request(self, messages: List[Dict[str, str]]) -> Dict[str, Any]:
+        """Keyword arguments for a Messages API call"""
+        system, formatted_messages = self.format_api_messages(messages)
+        request = {"model": API_MODEL, "max_tokens": API_MAX_TOKENS, "messages": formatted_messages}
+        if system:
+            request["system"] = system
+        return request
+
+    def generate_response_api(self, messages: List[Dict[str, str]],
+                              api_key: Optional[str] = None) -> Tuple[str, Dict[str, Any]]:
         """Generate a response using Claude API"""
-        if not self.client:
-            if not self.init_api_client():
-                return "Error: Claude API client not initialized. Please check your API key.", {}
+        client = self.get_api_client(api_key)
+        if not client:
+            return "Error: Claude API client not initialized. Please check your API key.", {}
         
         try:
-            # Convert messages to Claude's expected format
-            formatted_messages = []
-            for msg in messages:
-                if msg["role"] == "user":
-                    formatted_messages.append({"role": "user", "content": msg["content"]})
-                elif msg["role"] == "assistant":
-                    formatted_messages.append({"role": "assistant", "content": msg["content"]})
-                elif msg["role"] == "system":
-                    formatted_messages.append({"role": "system", "content": msg["content"]})
-
             # Make API request to Claude
             start_time = time.time()
-            response = self.client.messages.create(
-                model="claude-3-sonnet-20240229",
-                max_tokens=1000,
-                messages=formatted_messages
-            )
+            response = client.messages.create(**self.api_request(messages))
             elapsed = time.time() - start_time
             
             metadata = {
-                "model": "claude-3-sonnet-20240229",
+                "model": API_MODEL,
                 "latency": round(elapsed, 2),
                 "source": "api",
                 "usage": {
@@ -125,70 +263,266 @@ class ClaudeService:
         except Exception as e:
             logger.error(f"Error generating response from Claude API: {e}")
             return f"Error communicating with Claude: {str(e)}", {"error": str(e)}
-    
-    def generate_response_local(self, messages: List[Dict[str, str]]) -> Tuple[str, Dict[str, Any]]:
-        """Generate a response using a local model"""
-        if not self.model_loaded and not self.load_local_model():
-            return "Error: Local model could not be loaded.", {}
-            
+
+    def stream_response_api(self, messages: List[Dict[str, str]],
+                            api_key: Optional[str] = None) -> Iterator[Tuple[str, Any]]:
+        """Stream a response from Claude API.
+
+        Yields ("token", text) for each text delta as it arrives, then ("done", (response, metadata)),
+        or ("error", message) if the request fails.
+        """
+        client = self.get_api_client(api_key)
+        if not client:
+            yield "error", "Claude API client not initialized. Please check your API key."
+            return
+
         try:
-            # Format messages into a conversation the model can understand
-            conversation = ""
-            for msg in messages:
-                if msg["role"] == "system":
-                    # Include system message at the beginning
-                    conversation += f"<|system|>\n{msg['content']}\n"
-                elif msg["role"] == "user":
-                    conversation += f"<|user|>\n{msg['content']}\n"
-                elif msg["role"] == "assistant":
-                    conversation += f"<|assistant|>\n{msg['content']}\n"
-            
-            # Add the final assistant prompt
-            conversation += "<|assistant|>\n"
-            
-            # Generate response
             start_time = time.time()
-            inputs = self.local_tokenizer(conversation, return_tensors="pt")
-            
-            # Move to GPU if available
-            if torch.cuda.is_available():
-                inputs = {key: value.to('cuda') for key, value in inputs.items()}
-            
-            # Generate without gradient calculation to save memory
-            with torch.no_grad():
-                outputs = self.local_model.generate(
-                    **inputs,
-                    max_new_tokens=500,
-                    temperature=0.7,
-                    do_sample=True,
-                    top_p=0.95
-                )
-                
-            response = self.local_tokenizer.decode(outputs[0], skip_special_tokens=True)
-            
-            # Extract just the assistant's response from the generated text
-            response = response.split("<|assistant|>\n")[-1].strip()
-            
+            first_token_time = None
+            chunks = []
+            with client.messages.stream(**self.api_request(messages)) as stream:
+                for text in stream.text_stream:
+                    if first_token_time is None:
+                        first_token_time = time.time()
+                    chunks.append(text)
+                    yield "token", text
+                final_message = stream.get_final_message()
             elapsed = time.time() - start_time
-            
+
             metadata = {
-                "model": self.local_model_path,
+                "model": API_MODEL,
                 "latency": round(elapsed, 2),
-                "source": "local"
+                "time_to_first_token": round(first_token_time - start_time, 3) if first_token_time else None,
+                "source": "api",
+                "streamed": True,
+                "usage": {
+                    "input_tokens": final_message.usage.input_tokens,
+                    "output_tokens": final_message.usage.output_tokens
+                }
             }
+            yield "done", ("".join(chunks), metadata)
+
+        except Exception as e:
+            logger.error(f"Error streaming response from Claude API: {e}")
+            yield "error", f"Error communicating with Claude: {str(e)}"
+    
+    @staticmethod
+    def format_local_prompt(messages: List[Dict[str, str]]) -> str:
+        """Format messages into a conversation the model can understand"""
+        conversation = ""
+        for msg in messages:
+            if msg["role"] == "system":
+                # Include system message at the beginning
+                conversation += f"<|system|>\n{msg['content']}\n"
+            elif msg["role"] == "user":
+                conversation += f"<|user|>\n{msg['content']}\n"
+            elif msg["role"] == "assistant":
+                conversation += f"<|assistant|>\n{msg['content']}\n"
+        
+        # Add the final assistant prompt
+        return conversation + "<|assistant|>\n"
+
+    def take_session_cache(self, conversation_id: Optional[str], token_ids: List[int]) -> Tuple[Any, int]:
+        """Return (past_key_values, reused token count) for the part of the prompt this conversation already saw.
+
+        The cache is cropped to the longest prefix shared with the new prompt, so edited history (or a reply
+        that tokenizes differently once it is part of the prompt) only discards the cache from that point.
+        """
+        entry = self.sessions.take(conversation_id) if conversation_id else None
+        if entry is None:
+            return None, 0
+        
+        # At least one token has to be prefilled for generate to produce logits
+        reused = min(common_prefix_length(entry.token_ids, token_ids), len(token_ids) - 1)
+        if reused <= 0:
+            logger.info(f"History of conversation {conversation_id} changed from the start; prefilling it again")
+            return None, 0
+        cached_length = entry.cache.get_seq_length()
+        if reused < cached_length:
+            # A negative argument drops that many trailing tokens
+            entry.cache.crop(reused - cached_length)
+        return entry.cache, reused
+
+    def generate_local_single(self, messages: List[Dict[str, str]],
+                              conversation_id: Optional[str]) -> Tuple[str, Dict[str, Any]]:
+        """Generate one reply, reusing the conversation's KV cache when there is one"""
+        conversation = self.format_local_prompt(messages)
+        inputs = self.local_tokenizer(conversation, return_tensors="pt")
+        inputs = {key: value.to(self.local_model.device) for key, value in inputs.items()}
+        input_length = inputs["input_ids"].shape[-1]
+        
+        past_key_values, reused = self.take_session_cache(conversation_id, inputs["input_ids"][0].tolist())
+        if past_key_values is not None:
+            inputs["past_key_values"] = past_key_values
+        
+        outputs = self.local_model.generate(**inputs, **LOCAL_GENERATION_ARGS, return_dict_in_generate=True)
+        sequence = outputs.sequences[0]
+        
+        if conversation_id and outputs.past_key_values is not None:
+            # The cache covers every token except the last one sampled
+            cached_length = outputs.past_key_values.get_seq_length()
+            self.sessions.store(conversation_id, sequence[:cached_length].tolist(), outputs.past_key_values)
+        self.sessions.record(reused, input_length - reused)
+        
+        # Decode only the new tokens, which is the assistant's reply
+        response = self.local_tokenizer.decode(sequence[input_length:], skip_special_tokens=True).strip()
+        return response, self.local_metadata(input_length, sequence.shape[-1] - input_length, reused)
+
+    def generate_local_batch(self, requests: List[Tuple[List[Dict[str, str]], Optional[str]]]) -> List[Tuple[str, Dict[str, Any]]]:
+        """Generate replies for several conversations with one padded generate call.
+
+        Session KV caches are left untouched: rows of a padded batch cannot reuse caches of different
+        lengths, and the stored caches stay valid for the next turn of their conversations.
+        """
+        import torch
+        prompts = [self.format_local_prompt(messages) for messages, _ in requests]
+        inputs = self.local_tokenizer(prompts, return_tensors="pt", padding=True)
+        inputs = {key: value.to(self.local_model.device) for key, value in inputs.items()}
+        input_length = inputs["input_ids"].shape[-1]
+        
+        sequences = self.local_model.generate(**inputs, **LOCAL_GENERATION_ARGS,
+                                              pad_token_id=self.local_tokenizer.pad_token_id)
+        
+        # Rows that finish early are padded after their end-of-sequence token. A model without one never
+        # finishes early, so every row runs to the full length
+        eos = self.local_model.generation_config.eos_token_id
+        eos = [token for token in (eos if isinstance(eos, list) else [eos]) if token is not None]
+        eos = torch.tensor(eos, dtype=torch.long, device=sequences.device)
+        results = []
+        for row, prompt_tokens in zip(sequences, inputs["attention_mask"].sum(dim=1).tolist()):
+            generated = row[input_length:]
+            ends = torch.isin(generated, eos).nonzero()
+            output_tokens = int(ends[0]) + 1 if len(ends) else generated.shape[-1]
+            response = self.local_tokenizer.decode(generated[:output_tokens], skip_special_tokens=True).strip()
+            results.append((response, self.local_metadata(prompt_tokens, output_tokens, 0)))
+        return results
+
+    def local_metadata(self, input_tokens: int, output_tokens: int, cached_tokens: int) -> Dict[str, Any]:
+        return {
+            "model": self.local_model_path,
+            "source": "local",
+            "cached_tokens": cached_tokens,
+            "usage": {
+                "input_tokens": int(input_tokens),
+                "output_tokens": int(output_tokens)
+            }
+        }
+
+    def run_local_batch(self, requests: List[Tuple[List[Dict[str, str]], Optional[str]]]) -> List[Tuple[str, Dict[str, Any]]]:
+        """Batcher callback: a lone request keeps its session KV cache, several share one padded generate"""
+        import torch
+        start_time = time.time()
+        # Generate without gradient calculation to save memory
+        with torch.no_grad():
+            if len(requests) == 1:
+                results = [self.generate_local_single(*requests[0])]
+            else:
+                results = self.generate_local_batch(requests)
+        elapsed = time.time() - start_time
+        
+        output_tokens = sum(metadata["usage"]["output_tokens"] for _, metadata in results)
+        with self.stats_lock:
+            self.generated_tokens += output_tokens
+            self.generation_seconds += elapsed
+        for _, metadata in results:
+            metadata["batch_size"] = len(requests)
+            metadata["tokens_per_second"] = round(output_tokens / elapsed, 1) if elapsed > 0 else None
+        return results
+
+    def generate_response_local(self, messages: List[Dict[str, str]],
+                                conversation_id: Optional[str] = None) -> Tuple[str, Dict[str, Any]]:
+        """Generate a response using a local model, batched with concurrent requests"""
+        if not self.model_loaded and not self.load_local_model():
+            return "Error: Local model could not be loaded.", {}
             
+        try:
+            start_time = time.time()
+            response, metadata = self.batcher.submit((messages, conversation_id)).result()
+            metadata["latency"] = round(time.time() - start_time, 2)
             return response, metadata
             
         except Exception as e:
             logger.error(f"Error generating response from local model: {e}")
             return f"Error generating response locally: {str(e)}", {"error": str(e)}
+
+    def local_generation_stats(self) -> Dict[str, Any]:
+        stats = self.batcher.stats()
+        with self.stats_lock:
+            stats["generated_tokens"] = self.generated_tokens
+            stats["tokens_per_second"] = (round(self.generated_tokens / self.generation_seconds, 1)
+                                          if self.generation_seconds else None)
+        return stats
     
-    def generate_response(self, messages: List[Dict[str, str]], use_local: bool = False) -> Tuple[str, Dict[str, Any]]:
-        """Generate a response using either Claude API or local model"""
+    def cache_model(self, use_local: bool, api_key: Optional[str] = None) -> Optional[str]:
+        """Name that cached responses are keyed by: the local model, or the API model scoped to a hash of the key
+
+        API responses are only shared between requests made with the same key, and there is no cache entry
+        for requests without any key, which could never have been answered.
+        """
         if use_local:
-            return self.generate_response_local(messages)
+            return self.local_model_path
+        key_to_use = api_key or self.api_key
+        if not key_to_use:
+            return None
+        return f"{API_MODEL}:{ApiClientCache.key_hash(key_to_use)}"
+
+    def cached_response(self, messages: List[Dict[str, str]], cache_model: str,
+                        start_time: float) -> Optional[Tuple[str, Dict[str, Any]]]:
+        cached = self.response_cache.get(cache_model, messages)
+        if cached is None:
+            return None
+        response, metadata = cached
+        return response, dict(metadata, latency=round(time.time() - start_time, 3))
+
+    def generate_response(self, messages: List[Dict[str, str]], use_local: bool = False,
+                          api_key: Optional[str] = None, conversation_id: Optional[str] = None,
+                          use_cache: bool = True) -> Tuple[str, Dict[str, Any]]:
+        """Generate a response using either Claude API or local model, answering from the response cache when possible"""
+        start_time = time.time()
+        cache_model = self.cache_model(use_local, api_key) if use_cache else None
+        if cache_model is not None:
+            cached = self.cached_response(messages, cache_model, start_time)
+            if cached is not None:
+                return cached
+        
+        if use_local:
+            response, metadata = self.generate_response_local(messages, conversation_id=conversation_id)
+        else:
+            response, metadata = self.generate_response_api(messages, api_key=api_key)
+        
+        if cache_model is not None:
+            self.response_cache.put(cache_model, messages, response, metadata)
+        return response, metadata
+
+    def stream_response(self, messages: List[Dict[str, str]], use_local: bool = False,
+                        api_key: Optional[str] = None, conversation_id: Optional[str] = None,
+                        use_cache: bool = True) -> Iterator[Tuple[str, Any]]:
+        """Stream a response using either Claude API or local model (see stream_response_api)"""
+        start_time = time.time()
+        cache_model = self.cache_model(use_local, api_key) if use_cache else None
+        if cache_model is not None:
+            cached = self.cached_response(messages, cache_model, start_time)
+            if cached is not None:
+                response, metadata = cached
+                yield "token", response
+                yield "done", (response, dict(metadata, time_to_first_token=metadata["latency"]))
+                return
+        
+        if use_local:
+            # Local generation is not incremental, so the whole reply arrives as a single token event
+            response, metadata = self.generate_response_local(messages, conversation_id=conversation_id)
+            if "error" in metadata or not metadata:
+                yield "error", response
+                return
+            events = [("token", response),
+                      ("done", (response, dict(metadata, time_to_first_token=metadata["latency"], streamed=False)))]
         else:
-            return self.generate_response_api(messages)
+            events = self.stream_response_api(messages, api_key=api_key)
+        
+        for event, payload in events:
+            if event == "done" and cache_model is not None:
+                self.response_cache.put(cache_model, messages, *payload)
+            yield event, payload
 
 # Initialize service singleton
 claude_service = ClaudeService()
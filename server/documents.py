@@ -0,0 +1,169 @@
+import io
+import os
+import tempfile
+from importlib.util import find_spec
+import numpy as np
+import cv2
+from image_io import MAX_IMAGE_PIXELS, ImageDecodeError
+
+# PDF rendering is optional; without pypdfium2 only multi-frame TIFFs are accepted as documents
+PDF_AVAILABLE = find_spec('pypdfium2') is not None
+
+# Document limits and defaults (configurable through environment variables)
+DOCUMENT_DPI = int(os.environ.get('OCR_DOCUMENT_DPI', 200))  # Resolution PDF pages are rendered at
+DOCUMENT_MAX_PAGES = int(os.environ.get('OCR_DOCUMENT_MAX_PAGES', 200))
+DOCUMENT_WINDOW = int(os.environ.get('OCR_DOCUMENT_WINDOW', 0))  # Pages in flight at once; 0 uses the worker count
+# Where uploads are written for page tasks to open; empty uses the system temporary directory
+DOCUMENT_TMPDIR = os.environ.get('OCR_DOCUMENT_TMPDIR', '')
+
+
+class DocumentError(ValueError):
+    """Raised when an uploaded document cannot be opened or exceeds the page limit."""
+
+
+def is_pdf(data):
+    return data[:5] == b'%PDF-'
+
+
+def is_tiff(data):
+    return data[:4] in (b'II*\x00', b'MM\x00*')
+
+
+def is_document(data):
+    """Whether the upload is a PDF or TIFF, which may hold several pages."""
+    return is_pdf(data) or is_tiff(data)
+
+
+def read_header(source):
+    """First bytes of an upload given as bytes or as a path to it."""
+    if isinstance(source, (bytes, bytearray, memoryview)):
+        return bytes(source[:8])
+    with open(source, 'rb') as file:
+        return file.read(8)
+
+
+def spool_document(data):
+    """Write an upload to a temporary file once, so page tasks get its path instead of a copy of its bytes."""
+    with tempfile.NamedTemporaryFile(prefix='ocr-document-', dir=DOCUMENT_TMPDIR or None, delete=False) as file:
+        file.write(data)
+        return file.name
+
+
+def fit_scale(width, height, scale):
+    """Largest scale up to the requested one that keeps the page under the pixel limit."""
+    pixels = width * scale * height * scale
+    if pixels > MAX_IMAGE_PIXELS:
+        scale *= (MAX_IMAGE_PIXELS / pixels) ** 0.5
+    return scale
+
+
+class PdfDocument:
+    """PDF opened from bytes or a path; pages are rendered one at a time on request."""
+
+    def __init__(self, source):
+        import pypdfium2
+        try:
+            self.pdf = pypdfium2.PdfDocument(source)
+        except pypdfium2.PdfiumError as e:
+            raise DocumentError(f'Failed to open PDF: {e}')
+
+    def __len__(self):
+        return len(self.pdf)
+
+    def render(self, index, dpi=None):
+        """Rasterize one page to a BGR image, returning (image, dpi actually used)."""
+        page = self.pdf[index]
+        try:
+            width, height = page.get_size()  # In points, 72 per inch
+            scale = fit_scale(width, height, (dpi or DOCUMENT_DPI) / 72)
+            bitmap = page.render(scale=scale)
+            img = bitmap.to_numpy().copy()
+        finally:
+            page.close()
+        if img.ndim == 3 and img.shape[2] == 4:
+            img = cv2.cvtColor(img, cv2.COLOR_BGRA2BGR)
+        return img, round(scale * 72)
+
+    def close(self):
+        self.pdf.close()
+
+
+class TiffDocument:
+    """Multi-frame TIFF; frames are decoded one at a time on request."""
+
+    def __init__(self, source):
+        from PIL import Image
+        try:
+            self.image = Image.open(source if isinstance(source, str) else io.BytesIO(source))
+        except Exception as e:
+            raise DocumentError(f'Failed to open TIFF: {e}')
+
+    def __len__(self):
+        return getattr(self.image, 'n_frames', 1)
+
+    def render(self, index, dpi=None):
+        """Decode one frame to a BGR image, returning (image, resolution from the file or dpi)."""
+        self.image.seek(index)
+        frame = self.image
+        if frame.width * frame.height > MAX_IMAGE_PIXELS:
+            raise DocumentError(
+                f'Page {index + 1} is {frame.width}x{frame.height} which exceeds the maximum of {MAX_IMAGE_PIXELS} pixels')
+        img = cv2.cvtColor(np.asarray(frame.convert('RGB')), cv2.COLOR_RGB2BGR)
+        resolution = frame.info.get('dpi')
+        return img, dpi or (round(resolution[0]) if resolution else None)
+
+    def close(self):
+        self.image.close()
+
+
+def open_document(source):
+    """Open a PDF or TIFF upload, given as bytes or a path, without decoding any page."""
+    header = read_header(source)
+    if is_pdf(header):
+        if not PDF_AVAILABLE:
+            raise DocumentError('PDF support requires pypdfium2 to be installed')
+        document = PdfDocument(source)
+    elif is_tiff(header):
+        document = TiffDocument(source)
+    else:
+        raise ImageDecodeError('Not a PDF or TIFF document')
+
+    if len(document) > DOCUMENT_MAX_PAGES:
+        page_count = len(document)
+        document.close()
+        raise DocumentError(f'Document has {page_count} pages which exceeds the maximum of {DOCUMENT_MAX_PAGES}')
+    return document
+
+
+def page_count(source):
+    document = open_document(source)
+    try:
+        return len(document)
+    finally:
+        document.close()
+
+
+def render_page(source, index, dpi=None):
+    """Open a document and rasterize only the requested page; workers call this so no page crosses processes.
+
+    Given the path of a spooled upload, only the file's structure and the page itself are read.
+    """
+    document = open_document(source)
+    try:
+        return document.render(index, dpi)
+    finally:
+        document.close()
+
+
+def merge_pages(pages, quality):
+    """Combine per-page /ocr bodies into one body, keeping each page's result under 'pages'."""
+    confidences = [page['confidence'] for page in pages if page.get('words')]
+    return {
+        'text': '\n\n'.join(page['text'] for page in pages).strip(),
+        'confidence': sum(confidences) / len(confidences) if confidences else 0,
+        'words': sum(page.get('words', 0) for page in pages),
+        'engine': 'easyocr',
+        'quality': quality,
+        'page_count': len(pages),
+        'pages': pages
+    }
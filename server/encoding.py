@@ -0,0 +1,138 @@
+import os
+import gzip
+import json
+import base64
+from importlib.util import find_spec
+import numpy as np
+
+# MessagePack responses are optional; without the msgpack package only JSON is offered
+MSGPACK_AVAILABLE = find_spec('msgpack') is not None
+
+RESPONSE_FORMATS = ('json', 'packed', 'msgpack')
+MSGPACK_MIMETYPES = ('application/msgpack', 'application/x-msgpack', 'application/vnd.msgpack')
+
+# Responses smaller than this are sent uncompressed; gzip gains little on them
+COMPRESS_MIN_BYTES = int(os.environ.get('OCR_COMPRESS_MIN_BYTES', 1024))
+COMPRESS_LEVEL = int(os.environ.get('OCR_COMPRESS_LEVEL', 6))
+COMPRESS_MIMETYPES = ('application/json', 'application/msgpack', 'text/plain')
+
+INT16_MIN, INT16_MAX = np.iinfo(np.int16).min, np.iinfo(np.int16).max
+
+
+def parse_format(value, accept=None):
+    """Pick a response format from an explicit format value, else from the request's Accept header.
+
+    An explicit 'msgpack' without the package installed raises ValueError; an Accept header that merely
+    prefers MessagePack falls back to JSON.
+    """
+    value = str(value or '').lower()
+    if value:
+        if value not in RESPONSE_FORMATS:
+            raise ValueError(f"Unknown format '{value}', expected one of {', '.join(RESPONSE_FORMATS)}")
+        if value == 'msgpack' and not MSGPACK_AVAILABLE:
+            raise ValueError('MessagePack responses require the msgpack package to be installed')
+        return value
+    if accept is not None and MSGPACK_AVAILABLE:
+        # JSON comes first so wildcard Accept headers keep getting JSON
+        best = accept.best_match(('application/json',) + MSGPACK_MIMETYPES)
+        if best in MSGPACK_MIMETYPES:
+            return 'msgpack'
+    return 'json'
+
+
+def pack_regions(regions):
+    """Columnar form of structured regions: boxes as one little-endian integer array of
+    (count, 4 points, x/y), confidences as float32, and the texts as a list.
+
+    Boxes use int16 unless a coordinate falls outside its range, in which case int32 is used; the
+    dtype is named in 'box_dtype'. Regions without a confidence get NaN.
+    """
+    boxes = [region['box'] for region in regions]
+    if boxes and all(len(box) == 4 for box in boxes):
+        points = np.rint(np.asarray(boxes, dtype=np.float64)).reshape(len(boxes), 4, 2)
+    else:
+        # Ragged polygons only come from custom recognizers; keep their bounding rectangles
+        points = np.array([[[min(x for x, _ in box), min(y for _, y in box)],
+                            [max(x for x, _ in box), min(y for _, y in box)],
+                            [max(x for x, _ in box), max(y for _, y in box)],
+                            [min(x for x, _ in box), max(y for _, y in box)]] for box in boxes],
+                          dtype=np.float64).reshape(-1, 4, 2)
+    fits = points.size == 0 or (points.min() >= INT16_MIN and points.max() <= INT16_MAX)
+    dtype = '<i2' if fits else '<i4'
+    confidences = np.fromiter((region.get('confidence', np.nan) for region in regions), dtype='<f4',
+                              count=len(regions))
+    return {
+        'count': len(regions),
+        'box_dtype': 'int16' if fits else 'int32',
+        'boxes': points.astype(dtype).tobytes(),
+        'confidences': confidences.tobytes(),
+        'texts': [region['text'] for region in regions]
+    }
+
+
+def pack_lines(lines):
+    """Columnar form of line groups: line texts plus member region indices as int32 'regions', split
+    by the int32 'offsets' array (line i holds regions[offsets[i]:offsets[i + 1]])."""
+    counts = [len(line['regions']) for line in lines]
+    offsets = np.concatenate(([0], np.cumsum(counts, dtype=np.int64))).astype('<i4')
+    members = np.fromiter((index for line in lines for index in line['regions']), dtype='<i4',
+                          count=int(offsets[-1]))
+    return {
+        'texts': [line['text'] for line in lines],
+        'offsets': offsets.tobytes(),
+        'regions': members.tobytes()
+    }
+
+
+def pack_body(body):
+    """Copy of an OCR body with structured regions and lines in columnar form, including document pages."""
+    packed = dict(body)
+    if isinstance(body.get('regions'), list):
+        packed['regions'] = pack_regions(body['regions'])
+    if isinstance(body.get('lines'), list):
+        packed['lines'] = pack_lines(body['lines'])
+    for key in ('pages', 'results'):
+        if isinstance(body.get(key), list):
+            packed[key] = [pack_body(item) if isinstance(item, dict) else item for item in body[key]]
+    return packed
+
+
+def base64_default(value):
+    if isinstance(value, bytes):
+        return base64.b64encode(value).decode('ascii')
+    # NumPy scalars that slipped into a body
+    if hasattr(value, 'item'):
+        return value.item()
+    raise TypeError(f'Object of type {type(value).__name__} is not JSON serializable')
+
+
+def encode_body(body, response_format='json'):
+    """Serialize a response body, returning (bytes, mimetype).
+
+    'json' leaves the body as is; 'packed' and 'msgpack' turn structured output into columnar arrays,
+    base64-encoded in JSON and raw binary in MessagePack.
+    """
+    if response_format == 'json':
+        return json.dumps(body, separators=(',', ':'), default=base64_default).encode('utf-8'), 'application/json'
+    packed = pack_body(body)
+    if response_format == 'msgpack':
+        import msgpack
+        return msgpack.packb(packed, use_bin_type=True, default=base64_default), 'application/msgpack'
+    return json.dumps(packed, separators=(',', ':'), default=base64_default).encode('utf-8'), 'application/json'
+
+
+def compress_response(response, accept_encodings):
+    """Gzip a buffered response in place when the client accepts it and it is worth compressing."""
+    if (response.direct_passthrough or response.is_streamed or response.status_code < 200
+            or response.status_code in (204, 304) or 'Content-Encoding' in response.headers
+            or response.mimetype not in COMPRESS_MIMETYPES):
+        return response
+    response.vary.add('Accept-Encoding')
+    if not accept_encodings['gzip'] and not accept_encodings['x-gzip']:
+        return response
+    data = response.get_data()
+    if len(data) < COMPRESS_MIN_BYTES:
+        return response
+    response.set_data(gzip.compress(data, compresslevel=COMPRESS_LEVEL))
+    response.headers['Content-Encoding'] = 'gzip'
+    return response
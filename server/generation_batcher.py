@@ -0,0 +1,94 @@
+import os
+import time
+import queue
+import logging
+import threading
+from concurrent.futures import Future
+from typing import Any, Callable, Dict, List
+from metrics import chat_batch_size
+
+logger = logging.getLogger(__name__)
+
+
+class GenerationBatcher:
+    """Gathers requests that arrive within a short window and runs them through one call of run_batch.
+
+    A single worker thread makes every call, so the model behind run_batch is never used concurrently.
+    run_batch receives a list of items and must return one result per item, in order.
+    """
+    def __init__(self, run_batch: Callable[[List[Any]], List[Any]], max_batch_size: int = 8, max_wait: float = 0.02):
+        self.run_batch = run_batch
+        self.max_batch_size = max(1, max_batch_size)
+        self.max_wait = max_wait
+        self.queue: "queue.Queue[tuple]" = queue.Queue()
+        self.lock = threading.Lock()
+        self.thread = None
+        self.batches = 0
+        self.items = 0
+        self.batch_sizes: Dict[int, int] = {}
+
+    def _ensure_started(self) -> None:
+        with self.lock:
+            if self.thread is None:
+                self.thread = threading.Thread(target=self._work, name="local-generation", daemon=True)
+                self.thread.start()
+
+    def submit(self, item: Any) -> Future:
+        self._ensure_started()
+        future: Future = Future()
+        self.queue.put((item, future))
+        return future
+
+    def _collect(self) -> List[tuple]:
+        # Block for the first request, then wait at most max_wait for others to join it
+        batch = [self.queue.get()]
+        deadline = time.monotonic() + self.max_wait
+        while len(batch) < self.max_batch_size:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                break
+            try:
+                batch.append(self.queue.get(timeout=remaining))
+            except queue.Empty:
+                break
+        return batch
+
+    def _work(self) -> None:
+        while True:
+            batch = self._collect()
+            with self.lock:
+                self.batches += 1
+                self.items += len(batch)
+                self.batch_sizes[len(batch)] = self.batch_sizes.get(len(batch), 0) + 1
+            chat_batch_size.observe(len(batch))
+
+            try:
+                results = self.run_batch([item for item, _ in batch])
+            except Exception as e:
+                logger.error(f"Batched generation failed: {e}")
+                for _, future in batch:
+                    future.set_exception(e)
+                continue
+            for (_, future), result in zip(batch, results):
+                future.set_result(result)
+
+    def stats(self) -> Dict[str, Any]:
+        with self.lock:
+            return {
+                "max_batch_size": self.max_batch_size,
+                "max_wait_ms": round(self.max_wait * 1000, 1),
+                "queued": self.queue.qsize(),
+                "batches": self.batches,
+                "requests": self.items,
+                "average_batch_size": round(self.items / self.batches, 2) if self.batches else None,
+                "batch_sizes": dict(sorted(self.batch_sizes.items()))
+            }
+
+
+def create_generation_batcher(run_batch: Callable[[List[Any]], List[Any]]) -> GenerationBatcher:
+    """Build the local generation batcher from environment configuration"""
+    return GenerationBatcher(
+        run_batch,
+        max_batch_size=int(os.environ.get("LOCAL_BATCH_MAX_SIZE", 8)),
+        max_wait=float(os.environ.get("LOCAL_BATCH_MAX_WAIT_MS", 20)) / 1000
+    )
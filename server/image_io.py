@@ -0,0 +1,120 @@
+import io
+import os
+import struct
+import numpy as np
+import cv2
+from flask import Request
+
+# Upload limits (configurable through environment variables)
+MAX_UPLOAD_BYTES = int(float(os.environ.get('OCR_MAX_UPLOAD_MB', 25)) * 1024 * 1024)
+MAX_REQUEST_BYTES = int(float(os.environ.get('OCR_MAX_REQUEST_MB', 200)) * 1024 * 1024)  # Whole body, e.g. a batch
+MAX_IMAGE_PIXELS = int(os.environ.get('OCR_MAX_IMAGE_PIXELS', 50_000_000))
+
+
+class ImageTooLargeError(ValueError):
+    """Raised when an upload exceeds the configured byte or pixel limits."""
+
+
+class ImageDecodeError(ValueError):
+    """Raised when uploaded bytes cannot be decoded as an image."""
+
+
+class InMemoryRequest(Request):
+    """Request that keeps uploaded files in memory instead of spooling them to temp files."""
+
+    def _get_file_stream(self, total_content_length, content_type, filename=None, content_length=None):
+        # Body size is already capped by MAX_CONTENT_LENGTH, so buffering in memory is bounded
+        return io.BytesIO()
+
+
+def _png_size(data):
+    if data[:8] == b'\x89PNG\r\n\x1a\n' and data[12:16] == b'IHDR':
+        return struct.unpack('>II', data[16:24])
+    return None
+
+
+def _gif_size(data):
+    if data[:6] in (b'GIF87a', b'GIF89a'):
+        return struct.unpack('<HH', data[6:10])
+    return None
+
+
+def _bmp_size(data):
+    if data[:2] == b'BM' and len(data) >= 26:
+        width, height = struct.unpack('<ii', data[18:26])
+        return abs(width), abs(height)
+    return None
+
+
+def _webp_size(data):
+    if data[:4] != b'RIFF' or data[8:12] != b'WEBP':
+        return None
+    chunk = data[12:16]
+    if chunk == b'VP8X' and len(data) >= 30:
+        width = int.from_bytes(data[24:27], 'little') + 1
+        height = int.from_bytes(data[27:30], 'little') + 1
+        return width, height
+    if chunk == b'VP8 ' and len(data) >= 30:
+        width, height = struct.unpack('<HH', data[26:30])
+        return width & 0x3FFF, height & 0x3FFF
+    if chunk == b'VP8L' and len(data) >= 25:
+        bits = int.from_bytes(data[21:25], 'little')
+        return (bits & 0x3FFF) + 1, ((bits >> 14) & 0x3FFF) + 1
+    return None
+
+
+def _jpeg_size(data):
+    if data[:2] != b'\xff\xd8':
+        return None
+    offset = 2
+    while offset + 9 < len(data):
+        if data[offset] != 0xFF:
+            return None
+        marker = data[offset + 1]
+        # Start-of-frame markers carry the image dimensions
+        if marker in (0xC0, 0xC1, 0xC2, 0xC3, 0xC5, 0xC6, 0xC7, 0xC9, 0xCA, 0xCB, 0xCD, 0xCE, 0xCF):
+            height, width = struct.unpack('>HH', data[offset + 5:offset + 9])
+            return width, height
+        segment_length = struct.unpack('>H', data[offset + 2:offset + 4])[0]
+        offset += 2 + segment_length
+    return None
+
+
+def get_image_size(data):
+    """Read (width, height) from the image header without decoding, or None if the format is unknown."""
+    for reader in (_png_size, _jpeg_size, _gif_size, _bmp_size, _webp_size):
+        try:
+            size = reader(data)
+        except struct.error:
+            size = None
+        if size:
+            return size
+    return None
+
+
+def check_image_limits(data):
+    """Reject uploads above the byte or pixel limits before any full decode happens."""
+    if len(data) > MAX_UPLOAD_BYTES:
+        raise ImageTooLargeError(f'Image exceeds maximum upload size of {MAX_UPLOAD_BYTES} bytes')
+
+    size = get_image_size(data)
+    if size and size[0] * size[1] > MAX_IMAGE_PIXELS:
+        raise ImageTooLargeError(
+            f'Image is {size[0]}x{size[1]} which exceeds the maximum of {MAX_IMAGE_PIXELS} pixels')
+
+
+def decode_image(data):
+    """Decode raw image bytes into a BGR image, or None if the bytes are not an image."""
+    check_image_limits(data)
+
+    # Wrap the bytes without copying; imdecode reads straight from this buffer
+    buffer = np.frombuffer(memoryview(data), dtype=np.uint8)
+    if buffer.size == 0:
+        return None
+    img = cv2.imdecode(buffer, cv2.IMREAD_COLOR)
+
+    # Formats without a header we can sniff are checked after decoding
+    if img is not None and img.shape[0] * img.shape[1] > MAX_IMAGE_PIXELS:
+        raise ImageTooLargeError(
+            f'Image is {img.shape[1]}x{img.shape[0]} which exceeds the maximum of {MAX_IMAGE_PIXELS} pixels')
+    return img
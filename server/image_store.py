@@ -0,0 +1,106 @@
+import os
+import time
+import uuid
+import threading
+from collections import OrderedDict
+
+
+class StoredImage:
+    def __init__(self, image, horizontal_list, free_list, scale, options):
+        self.image = image  # Decoded image after preprocessing and autoscaling, as the detector saw it
+        self.horizontal_list = horizontal_list  # Detected boxes as [x_min, x_max, y_min, y_max]
+        self.free_list = free_list  # Detected rotated boxes as four [x, y] points
+        self.scale = scale  # Autoscale factor from the client's coordinates to image's
+        self.options = options
+        self.size = image.nbytes
+        self.last_used = time.time()
+
+
+class OcrImageStore:
+    """Decoded images and their detections kept for a while so regions can be recognized again without re-uploading."""
+
+    def __init__(self, max_images=32, max_bytes=512 * 1024 * 1024, ttl=600):
+        self.max_images = max_images
+        self.max_bytes = max_bytes
+        self.ttl = ttl  # Seconds since last use
+        self.entries = OrderedDict()  # image id -> StoredImage
+        self.size = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.lock = threading.Lock()
+
+    @property
+    def enabled(self):
+        return self.max_images > 0
+
+    def _remove(self, image_id):
+        entry = self.entries.pop(image_id)
+        self.size -= entry.size
+
+    def _expire(self):
+        cutoff = time.time() - self.ttl
+        # Entries are kept in last-use order, so expired ones are at the front
+        while self.entries:
+            image_id, entry = next(iter(self.entries.items()))
+            if entry.last_used >= cutoff:
+                break
+            self._remove(image_id)
+            self.evictions += 1
+
+    def put(self, image, horizontal_list, free_list, scale, options):
+        """Store an image with its detections and return its id, or None if it can never fit."""
+        entry = StoredImage(image, horizontal_list, free_list, scale, options)
+        if not self.enabled or entry.size > self.max_bytes:
+            return None
+        image_id = uuid.uuid4().hex
+        with self.lock:
+            self._expire()
+            self.entries[image_id] = entry
+            self.size += entry.size
+            while len(self.entries) > self.max_images or self.size > self.max_bytes:
+                self._remove(next(iter(self.entries)))
+                self.evictions += 1
+        return image_id
+
+    def get(self, image_id):
+        """Return the stored image entry, refreshing its lifetime, or None if it expired or never existed."""
+        with self.lock:
+            self._expire()
+            entry = self.entries.get(image_id)
+            if entry is None:
+                self.misses += 1
+                return None
+            entry.last_used = time.time()
+            self.entries.move_to_end(image_id)
+            self.hits += 1
+            return entry
+
+    def delete(self, image_id):
+        with self.lock:
+            if image_id not in self.entries:
+                return False
+            self._remove(image_id)
+            return True
+
+    def stats(self):
+        with self.lock:
+            return {
+                'images': len(self.entries),
+                'max_images': self.max_images,
+                'bytes': self.size,
+                'max_bytes': self.max_bytes,
+                'ttl': self.ttl,
+                'hits': self.hits,
+                'misses': self.misses,
+                'evictions': self.evictions,
+            }
+
+
+def create_image_store():
+    """Build the region image store from environment configuration."""
+    return OcrImageStore(
+        max_images=int(os.environ.get('OCR_REGION_MAX_IMAGES', 32)),
+        max_bytes=int(float(os.environ.get('OCR_REGION_MAX_MB', 512)) * 1024 * 1024),
+        ttl=int(os.environ.get('OCR_REGION_TTL', 600)),
+    )
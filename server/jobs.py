@@ -0,0 +1,213 @@
+import os
+import json
+import time
+import uuid
+import queue
+import sqlite3
+import threading
+import traceback
+from worker_pool import QueueFullError
+
+JOB_QUEUED = 'queued'
+JOB_RUNNING = 'running'
+JOB_DONE = 'done'
+JOB_FAILED = 'failed'
+JOB_CANCELLED = 'cancelled'
+FINISHED_STATES = (JOB_DONE, JOB_FAILED, JOB_CANCELLED)
+
+
+class OcrJob:
+    def __init__(self, job_id, options, data=None, status=JOB_QUEUED, result=None, error=None,
+                 created=None, updated=None):
+        self.id = job_id
+        self.options = options
+        self.data = data  # Encoded image, dropped once the job finishes
+        self.status = status
+        self.result = result
+        self.error = error
+        self.created = created or time.time()
+        self.updated = updated or self.created
+
+    def to_dict(self):
+        job = {
+            'job_id': self.id,
+            'status': self.status,
+            'created': self.created,
+            'updated': self.updated,
+        }
+        if self.result is not None:
+            job['result'] = self.result
+        if self.error is not None:
+            job['error'] = self.error
+        return job
+
+
+class OcrJobQueue:
+    """In-process queue of OCR jobs drained by background threads, optionally persisted to SQLite."""
+
+    def __init__(self, runner, workers=2, max_queued=1000, ttl=3600, db_path=None):
+        self.runner = runner  # runner(data, options) -> response body
+        self.workers = workers
+        self.max_queued = max_queued
+        self.ttl = ttl
+        self.db_path = db_path
+        self.jobs = {}
+        self.queue = queue.Queue()
+        self.lock = threading.Lock()
+        self.db = None
+        self.threads = []
+
+    def start(self):
+        """Start the worker threads now, resuming jobs the database holds as queued or running.
+
+        Otherwise they start on the first submit, get or cancel, and persisted jobs wait until then.
+        """
+        self._ensure_started()
+
+    def _ensure_started(self):
+        # Threads and the database are opened lazily so importing the module stays side-effect free
+        with self.lock:
+            if self.threads:
+                return
+            if self.db_path:
+                self._open_db()
+            for index in range(self.workers):
+                thread = threading.Thread(target=self._work, name=f'ocr-job-{index}', daemon=True)
+                thread.start()
+                self.threads.append(thread)
+
+    def _open_db(self):
+        directory = os.path.dirname(self.db_path)
+        if directory and not os.path.exists(directory):
+            os.makedirs(directory)
+        self.db = sqlite3.connect(self.db_path, check_same_thread=False)
+        self.db.execute(
+            'CREATE TABLE IF NOT EXISTS ocr_jobs (id TEXT PRIMARY KEY, status TEXT NOT NULL, '
+            'options TEXT NOT NULL, data BLOB, result TEXT, error TEXT, created REAL, updated REAL)'
+        )
+        self.db.commit()
+
+        # Reload stored jobs; anything interrupted mid-run is queued again
+        rows = self.db.execute(
+            'SELECT id, status, options, data, result, error, created, updated FROM ocr_jobs ORDER BY created'
+        ).fetchall()
+        for job_id, status, options, data, result, error, created, updated in rows:
+            job = OcrJob(job_id, json.loads(options), data, status,
+                         json.loads(result) if result else None, error, created, updated)
+            if job.status == JOB_RUNNING:
+                job.status = JOB_QUEUED
+            self.jobs[job_id] = job
+            if job.status == JOB_QUEUED:
+                self.queue.put(job_id)
+        print(f"Restored {len(rows)} OCR jobs from {self.db_path}")
+
+    def _save(self, job):
+        if self.db is None:
+            return
+        self.db.execute(
+            'INSERT OR REPLACE INTO ocr_jobs (id, status, options, data, result, error, created, updated) '
+            'VALUES (?, ?, ?, ?, ?, ?, ?, ?)',
+            (job.id, job.status, json.dumps(job.options), job.data,
+             json.dumps(job.result) if job.result is not None else None, job.error, job.created, job.updated)
+        )
+        self.db.commit()
+
+    def _set(self, job, **fields):
+        # Callers hold self.lock
+        for name, value in fields.items():
+            setattr(job, name, value)
+        job.updated = time.time()
+        if job.status in FINISHED_STATES:
+            job.data = None
+        self._save(job)
+
+    def _update(self, job, **fields):
+        with self.lock:
+            self._set(job, **fields)
+
+    def _expire(self):
+        cutoff = time.time() - self.ttl
+        expired = [job_id for job_id, job in self.jobs.items()
+                   if job.status in FINISHED_STATES and job.updated < cutoff]
+        for job_id in expired:
+            del self.jobs[job_id]
+        if expired and self.db is not None:
+            self.db.executemany('DELETE FROM ocr_jobs WHERE id = ?', [(job_id,) for job_id in expired])
+            self.db.commit()
+
+    def submit(self, data, options):
+        """Queue an encoded image for OCR and return the new job id."""
+        self._ensure_started()
+        with self.lock:
+            self._expire()
+            if self.queue.qsize() >= self.max_queued:
+                raise QueueFullError(retry_after=5)
+            job = OcrJob(uuid.uuid4().hex, options, data)
+            self.jobs[job.id] = job
+            self._save(job)
+        self.queue.put(job.id)
+        return job.id
+
+    def get(self, job_id):
+        self._ensure_started()
+        with self.lock:
+            job = self.jobs.get(job_id)
+            return job.to_dict() if job is not None else None
+
+    def cancel(self, job_id):
+        """Cancel a queued job. Returns the job, or None if it does not exist."""
+        self._ensure_started()
+        with self.lock:
+            job = self.jobs.get(job_id)
+            if job is None:
+                return None
+            if job.status == JOB_QUEUED:
+                self._set(job, status=JOB_CANCELLED)
+            return job.to_dict()
+
+    def _work(self):
+        while True:
+            job_id = self.queue.get()
+            with self.lock:
+                job = self.jobs.get(job_id)
+                if job is None or job.status != JOB_QUEUED:
+                    continue
+                self._set(job, status=JOB_RUNNING)
+
+            try:
+                while True:
+                    try:
+                        result = self.runner(job.data, job.options)
+                        break
+                    except QueueFullError as e:
+                        # Back off instead of failing; jobs drain at the executor's pace
+                        time.sleep(e.retry_after)
+                self._update(job, status=JOB_DONE, result=result)
+            except Exception as e:
+                print(f"Error in OCR job {job_id}: {str(e)}")
+                print(traceback.format_exc())
+                self._update(job, status=JOB_FAILED, error=str(e))
+
+    def stats(self):
+        with self.lock:
+            counts = {}
+            for job in self.jobs.values():
+                counts[job.status] = counts.get(job.status, 0) + 1
+            return {
+                'queued': self.queue.qsize(),
+                'max_queued': self.max_queued,
+                'workers': self.workers,
+                'persistent': self.db_path is not None,
+                'jobs': counts,
+            }
+
+
+def create_job_queue(runner):
+    """Build the job queue from environment configuration."""
+    return OcrJobQueue(
+        runner,
+        workers=int(os.environ.get('OCR_JOB_WORKERS', 2)),
+        max_queued=int(os.environ.get('OCR_JOB_MAX_QUEUED', 1000)),
+        ttl=int(os.environ.get('OCR_JOB_TTL', 3600)),
+        db_path=os.environ.get('OCR_JOBS_DB') or None,
+    )
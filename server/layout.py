@@ -0,0 +1,133 @@
+import re
+from itertools import chain
+import numpy as np
+
+# Boxes whose vertical overlap with the current line exceeds this share of their height join the line
+LINE_OVERLAP_RATIO = 0.25
+# A gap of this many average character widths becomes one space
+SPACE_WIDTH_RATIO = 0.7
+MAX_SPACES = 8
+
+
+def box_extents(boxes):
+    """Return left, top, right, bottom arrays for a list of EasyOCR polygons."""
+    count = len(boxes)
+    point_count = len(boxes[0]) if count else 0
+
+    if point_count and all(len(box) == point_count for box in boxes):
+        # Flattening through fromiter is several times faster than np.asarray on nested lists
+        flat = np.fromiter(chain.from_iterable(chain.from_iterable(boxes)), dtype=np.float64,
+                           count=count * point_count * 2)
+        points = flat.reshape(count, point_count, 2)
+        xs = points[:, :, 0]
+        ys = points[:, :, 1]
+        return xs.min(axis=1), ys.min(axis=1), xs.max(axis=1), ys.max(axis=1)
+
+    # Ragged polygons (different point counts) fall back to per-box extents
+    extents = np.array([
+        (min(p[0] for p in box), min(p[1] for p in box), max(p[0] for p in box), max(p[1] for p in box))
+        for box in boxes
+    ], dtype=np.float64).reshape(-1, 4)
+    return extents[:, 0], extents[:, 1], extents[:, 2], extents[:, 3]
+
+
+def group_lines(top, bottom):
+    """Assign each box (already sorted by top) to a line, returning line ids.
+
+    A box joins the current line when its overlap with the line's lowest bottom so far is more than
+    LINE_OVERLAP_RATIO of its height. A box taller than zero can only start a new line when it reaches
+    below that line bottom, so the running line bottom is the cumulative maximum of all bottoms, reset
+    only at zero-height boxes, which always start a line of their own.
+    """
+    count = len(top)
+    if count == 0:
+        return np.zeros(0, dtype=np.int64)
+
+    height = bottom - top
+    zero_height = height <= 0
+
+    # Segmented running maximum over integer ranks (exact, unlike offsetting float coordinates):
+    # each segment is shifted above the previous one so earlier segments can never win the maximum
+    values, ranks = np.unique(bottom, return_inverse=True)
+    offset = np.cumsum(zero_height) * len(values)
+    running = values[np.maximum.accumulate(ranks.reshape(-1) + offset) - offset]
+
+    line_bottom = running[:-1]
+    current_top = top[1:]
+    current_height = height[1:]
+    overlap = np.minimum(line_bottom, bottom[1:]) - current_top
+    with np.errstate(divide='ignore', invalid='ignore'):
+        ratio = np.where(current_height > 0, overlap / np.where(current_height > 0, current_height, 1), 0.0)
+
+    breaks = np.concatenate(([0], (ratio <= LINE_OVERLAP_RATIO).astype(np.int64)))
+    return np.cumsum(breaks)
+
+
+def reconstruct_lines(result):
+    """Group OCR regions into text lines ordered top to bottom and left to right.
+
+    Returns (text_lines, line_regions), where line_regions holds the indices into result of the
+    regions on each line in reading order.
+    """
+    indices = [i for i, region in enumerate(result) if len(region) >= 2]
+    if not indices:
+        return [], []
+
+    texts = [result[i][1] for i in indices]
+    left, top, right, bottom = box_extents([result[i][0] for i in indices])
+
+    # Sort boxes by top Y position, then group them into lines
+    by_top = np.argsort(top, kind='stable')
+    line_ids = np.empty(len(indices), dtype=np.int64)
+    line_ids[by_top] = group_lines(top[by_top], bottom[by_top])
+
+    # Within each line, order left to right; ties keep their top-to-bottom order
+    order = by_top[np.lexsort((left[by_top], line_ids[by_top]))]
+    line_ids = line_ids[order]
+    left = left[order]
+    right = right[order]
+    chars = np.fromiter((len(texts[i]) for i in order), dtype=np.int64, count=len(order))
+
+    # Average character width per line, from the regions that have text
+    line_count = int(line_ids[-1]) + 1
+    width = np.where(chars > 0, right - left, 0.0)
+    total_width = np.bincount(line_ids, weights=width, minlength=line_count)
+    total_chars = np.bincount(line_ids, weights=chars, minlength=line_count)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        avg_char_width = np.where(total_chars > 0, total_width / np.where(total_chars > 0, total_chars, 1), 0.0)
+
+    # Spaces between neighbours on a line scale with the gap measured in character widths
+    starts_line = np.concatenate(([True], line_ids[1:] != line_ids[:-1]))
+    gap = left - np.concatenate(([0.0], right[:-1]))
+    space_width = avg_char_width[line_ids] * SPACE_WIDTH_RATIO
+    with np.errstate(divide='ignore', invalid='ignore'):
+        spaces = np.where(space_width > 0, np.trunc(gap / np.where(space_width > 0, space_width, 1)), 1)
+    spaces = np.clip(spaces, 1, MAX_SPACES).astype(np.int64)
+    spaces[starts_line] = 0
+
+    separators = [' ' * n for n in range(MAX_SPACES + 1)]
+    pieces = [separators[n] + texts[i] for n, i in zip(spaces.tolist(), order.tolist())]
+    bounds = np.flatnonzero(starts_line).tolist() + [len(pieces)]
+
+    region_ids = [indices[i] for i in order.tolist()]
+    text_lines = []
+    line_regions = []
+    for start, end in zip(bounds[:-1], bounds[1:]):
+        text_lines.append(''.join(pieces[start:end]))
+        line_regions.append(region_ids[start:end])
+    return text_lines, line_regions
+
+
+def layout_text(result):
+    """Rebuild the page text from OCR regions, keeping line breaks and horizontal spacing."""
+    text_lines, _ = reconstruct_lines(result)
+    return join_lines(text_lines)
+
+
+def join_lines(text_lines):
+    """Page text from reconstruct_lines' text lines."""
+    # Join lines with newlines, preserving paragraph structure
+    text = '\n'.join(text_lines)
+
+    # Preserve multiple newlines for paragraph separation
+    return re.sub(r'\n{3,}', '\n\n', text)
@@ -0,0 +1,574 @@
+import easyocr
+from easyocr.utils import get_paragraph, reformat_input
+import os
+import threading
+import traceback
+from reader_pool import create_reader_pool, parse_preload
+from image_io import ImageDecodeError, decode_image
+from documents import render_page
+from layout import join_lines, reconstruct_lines
+from tiling import readtext_tiled
+from preprocessing import run_pipeline
+from text_gate import check_text
+from autoscale import autoscale_image, unscale_box, unscale_result
+from onnx_backend import parse_backend, use_onnx
+from metrics import StageTimer
+
+# Initialize the OCR reader pool (bounded by OCR_MAX_READERS / OCR_READER_MEMORY_MB)
+reader_pool = create_reader_pool()
+
+# Recognizer batch size used for batched recognition
+OCR_BATCH_SIZE = int(os.environ.get('OCR_BATCH_SIZE', 8))
+
+# Regions recognized per step when streaming results
+OCR_STREAM_CHUNK_SIZE = int(os.environ.get('OCR_STREAM_CHUNK_SIZE', 16))
+
+def create_reader(lang, gpu=False, network_config=None, backend='torch'):
+    """Create an EasyOCR reader for the specified language, running on PyTorch or ONNX Runtime."""
+    # Map frontend language codes to EasyOCR language codes
+    lang_mapping = {
+        'eng': ['en'],
+        'spa': ['es'],
+        'fra': ['fr'],
+        'deu': ['de'],
+        'chi_sim': ['ch_sim'],
+        'jpn': ['ja'],
+        'kor': ['ko'],
+        'rus': ['ru']
+    }
+    
+    # Default to English if language not supported
+    ocr_lang = lang_mapping.get(lang, ['en'])
+    
+    print(f"Initializing EasyOCR reader for language: {ocr_lang}, backend: {backend}")
+    
+    if backend == 'onnx':
+        # Export needs the float models; the fast configuration is quantized by ONNX Runtime instead
+        reader = easyocr.Reader(ocr_lang, gpu=False, quantize=False, model_storage_directory='./models')
+        use_onnx(reader, quantize=network_config == 'fast')
+    
+    # Create reader with specific configuration if provided
+    elif network_config == 'fast':
+        # Use a simpler model for faster processing
+        reader = easyocr.Reader(ocr_lang, gpu=gpu, quantize=True, model_storage_directory='./models')
+    elif network_config == 'accurate':
+        # Use the full model for best accuracy
+        reader = easyocr.Reader(ocr_lang, gpu=gpu, quantize=False, 
+                                model_storage_directory='./models')
+    else:
+        # Default configuration
+        reader = easyocr.Reader(ocr_lang, gpu=gpu, model_storage_directory='./models')
+    
+    print(f"Successfully initialized reader for {lang}")
+    return reader
+
+def get_reader(lang, gpu=False, network_config=None, backend=None):
+    """Get or create an EasyOCR reader for the specified language.
+    
+    backend defaults to OCR_BACKEND; the ONNX Runtime backend is CPU only, so GPU readers stay on PyTorch.
+    """
+    try:
+        backend = 'torch' if gpu else parse_backend(backend)
+        cache_key = f"{lang}_{gpu}_{network_config}_{backend}"
+        return reader_pool.get(cache_key, lambda: create_reader(lang, gpu, network_config, backend))
+    except Exception as e:
+        print(f"Error creating EasyOCR reader: {str(e)}")
+        print(traceback.format_exc())
+        raise
+
+def preload_readers(blocking=False):
+    """Warm up the readers listed in OCR_PRELOAD (e.g. 'eng:standard,jpn:fast')."""
+    pairs = parse_preload(os.environ.get('OCR_PRELOAD', ''))
+    if not pairs:
+        return None
+    
+    def warm_up():
+        for lang, quality in pairs:
+            try:
+                get_reader(lang, gpu=gpu_enabled(), network_config=get_network_config(quality))
+            except Exception as e:
+                print(f"Failed to preload reader {lang}:{quality}: {str(e)}")
+    
+    if blocking:
+        warm_up()
+        return None
+    
+    # Requests that arrive mid warm-up wait on the pool's per-key lock instead of building twice
+    thread = threading.Thread(target=warm_up, name='reader-preload', daemon=True)
+    thread.start()
+    return thread
+
+def preprocess_image(img, preprocessing=None, dpi=None):
+    """Apply preprocessing to an image (may modify it in place).
+    
+    Returns (image, scale), where scale is the factor 'resize' applied, for mapping boxes back onto img.
+    """
+    if not preprocessing:
+        return img, 1.0
+    
+    processed, info = run_pipeline(img, preprocessing, dpi=dpi)
+    return processed, info.get('scale', 1.0)
+
+def get_network_config(quality):
+    """Map a quality setting to an EasyOCR network configuration."""
+    if quality == 'fast':
+        return 'fast'
+    elif quality == 'best':
+        return 'accurate'
+    return None
+
+def gpu_enabled():
+    """Determine if GPU should be used (based on environment variable)."""
+    return os.environ.get('USE_GPU', '0').lower() in ('true', '1', 't')
+
+def get_recognition_params(quality):
+    """Determine recognition parameters based on quality."""
+    paragraph = quality != 'fast'  # Group text into paragraphs for standard and best
+    detail = 0 if quality == 'fast' else 1  # Level of detection detail
+    return paragraph, detail
+
+def region_text(region):
+    """Text of one EasyOCR region; detail=0 results are bare strings rather than (box, text[, confidence])."""
+    return region if isinstance(region, str) else region[1]
+
+def layout_lines(result, preserve_layout):
+    """Text lines format_ocr_result lays the text out in, or None when it joins the regions without layout."""
+    # detail=0 results have no boxes, so there is no layout to rebuild
+    has_boxes = not any(isinstance(region, str) for region in result)
+    if preserve_layout and has_boxes and len(result) > 1:
+        text_lines, _ = reconstruct_lines(result)
+        return text_lines
+    return None
+
+def format_ocr_result(result, quality, paragraph, preserve_layout, text_lines=None):
+    """Turn raw EasyOCR output into the response body returned by /ocr.
+    
+    text_lines skips the layout pass when the caller already ran layout_lines on result.
+    """
+    if text_lines is None:
+        text_lines = layout_lines(result, preserve_layout)
+    
+    # Format the results based on whether layout preservation is enabled
+    if text_lines is not None:
+        # Improved spatial analysis for better layout preservation
+        text = join_lines(text_lines)
+        
+    elif paragraph:
+        # In paragraph mode, join the text blocks with spaces
+        text = " ".join([region_text(block) for block in result])
+    else:
+        # In non-paragraph mode, add spaces and line breaks
+        text = ""
+        for detection in result:
+            text += region_text(detection) + " "
+            if region_text(detection).endswith(('.', '?', '!')):
+                text += "\n"
+    
+    # Calculate average confidence - safely handle different result structures
+    try:
+        # Try to extract confidence scores if they exist
+        confidences = []
+        for box in result:
+            if not isinstance(box, str) and len(box) > 2 and box[2] is not None:  # Check if confidence exists
+                confidences.append(box[2])
+        
+        # Calculate average confidence if we have valid scores
+        confidence = sum(confidences) / len(confidences) if confidences else 0.5
+        print(f"Calculated confidence: {confidence}")
+    except Exception as e:
+        # Fallback to a medium confidence if calculation fails
+        print(f"Warning: Could not calculate confidence: {str(e)}")
+        confidence = 0.5
+    
+    return {
+        'text': text.strip(),
+        'confidence': confidence,
+        'words': len(result),
+        'engine': 'easyocr',
+        'quality': quality
+    }
+
+def reading_order(regions):
+    """Sort regions top to bottom, then left to right; every OCR path reports regions in this order.
+    
+    recognize's own order depends on the device (horizontal boxes before free ones on the CPU), and
+    streaming recognizes in chunks, so results are put in this order before paragraphs are grouped.
+    """
+    return sorted(regions, key=lambda region: (min(p[1] for p in region[0]), min(p[0] for p in region[0])))
+
+def finish_readtext(regions, paragraph, detail):
+    """Apply readtext's paragraph grouping and detail level to regions recognized with paragraph=False, detail=1."""
+    result = get_paragraph(regions) if paragraph else regions
+    if detail == 0:
+        result = [region[1] for region in result]
+    return result
+
+def structured_output(regions):
+    """Per-region boxes, text and confidence plus the lines the layout pass groups them into.
+    
+    Line entries list the indices into 'regions' of their members in reading order.
+    """
+    text_lines, line_regions = reconstruct_lines(regions)
+    return {
+        'regions': [region_to_dict(region) for region in regions],
+        'lines': [{'text': text, 'regions': members} for text, members in zip(text_lines, line_regions)]
+    }
+
+def run_ocr_group(reader, images, paragraph, detail, tiled=False):
+    """Run a group of images that share a reader through EasyOCR in as few passes as possible."""
+    if tiled:
+        # Tiled images are already split into recognizer-sized pieces, one image at a time
+        return [readtext_tiled(reader, img, paragraph=paragraph, detail=detail) for img in images]
+    
+    results = [None] * len(images)
+    
+    # readtext_batched needs every image in a call to have the same size,
+    # so images are sub-grouped by shape and only resized groups fall back to readtext
+    by_shape = {}
+    for index, img in enumerate(images):
+        by_shape.setdefault(img.shape, []).append(index)
+    
+    for indices in by_shape.values():
+        if len(indices) == 1:
+            index = indices[0]
+            results[index] = reader.readtext(images[index], paragraph=paragraph, detail=detail,
+                                             batch_size=OCR_BATCH_SIZE)
+        else:
+            batch = reader.readtext_batched([images[i] for i in indices], paragraph=paragraph,
+                                            detail=detail, batch_size=OCR_BATCH_SIZE)
+            for index, result in zip(indices, batch):
+                results[index] = result
+    
+    return results
+
+def readtext_staged(reader, img, paragraph, detail, timer):
+    """reader.readtext split into its detection and recognition passes so each can be timed.
+    
+    Returns (result, grayscale image, horizontal boxes, free boxes); recognition only needs the grayscale copy.
+    """
+    with timer.stage('detect'):
+        img, img_cv_grey = reformat_input(img)
+        horizontal_list, free_list = reader.detect(img, reformat=False)
+    with timer.stage('recognize'):
+        result = reader.recognize(img_cv_grey, horizontal_list[0], free_list[0], paragraph=paragraph,
+                                  detail=detail, reformat=False)
+    return result, img_cv_grey, horizontal_list[0], free_list[0]
+
+def detection_boxes(horizontal_list, free_list):
+    """Detected boxes as JSON-ready four-point polygons, horizontal boxes first (the order region ids refer to)."""
+    boxes = [[[x_min, y_min], [x_max, y_min], [x_max, y_max], [x_min, y_max]]
+             for x_min, x_max, y_min, y_max in horizontal_list]
+    boxes += [[list(point) for point in box] for box in free_list]
+    return [[[to_json_number(x), to_json_number(y)] for x, y in box] for box in boxes]
+
+def process_image_timed(data, options):
+    """Decode, preprocess and OCR one encoded image, returning (/ocr response body, stage seconds, kept).
+    
+    With options['keep_regions'], kept is (grayscale image, horizontal boxes, free boxes, resize factor)
+    for the caller to store, and the body lists the detected boxes; otherwise kept is None.
+    """
+    timer = StageTimer()
+    with timer.stage('decode'):
+        img = decode_image(data)
+    if img is None:
+        raise ImageDecodeError('Failed to decode image')
+    
+    body, kept = ocr_decoded_image(img, options, timer)
+    return body, timer.stages, kept
+
+def ocr_decoded_image(img, options, timer):
+    """Preprocess and OCR an already decoded image, returning (/ocr response body, kept)."""
+    lang = options['lang']
+    quality = options['quality']
+    preprocessing = options['preprocessing']
+    
+    # Boxes are reported on the image as uploaded
+    image_size = [img.shape[1], img.shape[0]]
+    # Factor the OCR'd image was resized by, from 'resize' preprocessing and autoscaling
+    scale = 1.0
+    
+    # Apply preprocessing if requested
+    preprocessing_info = None
+    if preprocessing:
+        with timer.stage('preprocess'):
+            img, preprocessing_info = run_pipeline(img, preprocessing, dpi=options.get('dpi'))
+        scale = preprocessing_info.get('scale', 1.0)
+        print(f"Preprocessing: {preprocessing_info}")
+    
+    text_gate = run_text_gate(img, options, timer)
+    paragraph, detail = get_recognition_params(quality)
+    structured = options.get('structured')
+    
+    kept = None
+    autoscale_info = None
+    if text_gate is not None and not text_gate['text_likely']:
+        result = []
+    else:
+        if options.get('autoscale'):
+            with timer.stage('autoscale'):
+                img, autoscale_factor, autoscale_info = autoscale_image(img, quality)
+            scale *= autoscale_factor
+        
+        # Get the EasyOCR reader with appropriate configuration
+        with timer.stage('reader'):
+            reader = get_reader(lang, gpu=gpu_enabled(), network_config=get_network_config(quality))
+        
+        print(f"Starting OCR with paragraph={paragraph}, detail={detail}")
+        
+        # Perform OCR, splitting very large images into overlapping tiles when requested
+        if options.get('tiled'):
+            # Tiles interleave detection and recognition, so they are timed as one stage
+            with timer.stage('tiled_ocr'):
+                result = readtext_tiled(reader, img, paragraph=False, detail=1)
+        else:
+            # Regions are recognized individually and grouped into paragraphs afterwards, in reading order
+            result, img_cv_grey, horizontal_list, free_list = readtext_staged(reader, img, False, 1, timer)
+            if options.get('keep_regions'):
+                kept = (img_cv_grey, [[to_json_number(v) for v in box] for box in horizontal_list],
+                        [[[to_json_number(x), to_json_number(y)] for x, y in box] for box in free_list], scale)
+        # Report boxes on the image as it was uploaded
+        result = unscale_result(result, scale)
+    
+    print(f"OCR completed with {len(result)} text regions detected")
+    
+    with timer.stage('layout'):
+        regions = reading_order(result)
+        result = finish_readtext(regions, paragraph, detail)
+        body = format_ocr_result(result, quality, paragraph, options['preserve_layout'])
+        if structured:
+            body.update(structured_output(regions))
+    if preprocessing_info is not None:
+        body['preprocessing_ms'] = preprocessing_info['timings_ms']
+    if text_gate is not None:
+        body['text_gate'] = text_gate
+    if autoscale_info is not None:
+        body['autoscale'] = autoscale_info
+    if kept is not None:
+        # Box coordinates refer to the uploaded image; later recognition maps them onto the stored resized copy
+        body['detections'] = [unscale_box(box, scale) for box in detection_boxes(kept[1], kept[2])]
+        body['image_size'] = image_size
+    return body, kept
+
+def process_document_page(path, index, options):
+    """Rasterize one page of a spooled PDF or TIFF and OCR it, returning (page body, stage seconds).
+    
+    Each call opens the document file itself, so only this page is ever decoded in the calling process.
+    """
+    timer = StageTimer()
+    with timer.stage('render'):
+        img, dpi = render_page(path, index, options.get('render_dpi'))
+    # The render resolution is the page's source resolution for the 'resize' preprocessing step
+    page_options = dict(options, dpi=options.get('dpi') or dpi, keep_regions=False)
+    body, _ = ocr_decoded_image(img, page_options, timer)
+    body['page'] = index + 1
+    body['image_size'] = [img.shape[1], img.shape[0]]
+    return body, timer.stages
+
+def run_text_gate(img, options, timer):
+    """Run the request's text gate on a preprocessed image, returning its report, or None if no gate applies.
+    
+    Requests that keep regions always run detection, since the client asked for the detected boxes.
+    """
+    method = options.get('text_gate')
+    if not method or options.get('keep_regions'):
+        return None
+    with timer.stage('text_gate'):
+        reader = None
+        if method == 'detector':
+            reader = get_reader(options['lang'], gpu=gpu_enabled(), network_config=get_network_config(options['quality']))
+        report = check_text(img, method, reader)
+    if not report['text_likely']:
+        print(f"Text gate ({method}) found no likely text, skipping recognition: {report}")
+    return report
+
+def process_image(data, options):
+    """Decode, preprocess and OCR one encoded image, returning the /ocr response body."""
+    return process_image_timed(data, options)[0]
+
+def recognize_regions(img_cv_grey, horizontal_list, free_list, options, scale=1.0):
+    """Run recognition alone on chosen boxes of an already decoded image, skipping detection.
+    
+    Boxes are on img_cv_grey; scale is the factor it was resized and autoscaled by, so results map
+    back to the coordinates /ocr reported.
+    """
+    quality = options['quality']
+    reader = get_reader(options['lang'], gpu=gpu_enabled(), network_config=get_network_config(quality))
+    
+    result = reader.recognize(img_cv_grey, horizontal_list, free_list, paragraph=False, detail=1,
+                              reformat=False, batch_size=OCR_BATCH_SIZE)
+    result = reading_order(unscale_result(result, scale))
+    
+    print(f"Region OCR completed for {len(result)} regions")
+    
+    body = format_ocr_result(result, quality, False, options['preserve_layout'])
+    body.update(structured_output(result))
+    return body
+
+def process_image_group(uploads, options_list):
+    """OCR encoded images that share language, quality, preprocessing and tiling in one batched pass.
+    
+    Returns one response body per image; images that fail to decode get an 'error' entry instead.
+    """
+    lang = options_list[0]['lang']
+    quality = options_list[0]['quality']
+    preprocessing = options_list[0]['preprocessing']
+    
+    paragraph, detail = get_recognition_params(quality)
+    
+    responses = [None] * len(uploads)
+    images = []
+    gates = []
+    scales = []
+    members = []
+    for index, data in enumerate(uploads):
+        try:
+            img = decode_image(data)
+        except ValueError as e:
+            responses[index] = {'error': str(e)}
+            continue
+        if img is None:
+            responses[index] = {'error': 'Failed to decode image'}
+            continue
+        img, scale = preprocess_image(img, preprocessing, dpi=options_list[index].get('dpi'))
+        text_gate = run_text_gate(img, options_list[index], StageTimer())
+        if text_gate is not None and not text_gate['text_likely']:
+            responses[index] = dict(format_ocr_result([], quality, paragraph, options_list[index]['preserve_layout']),
+                                    text_gate=text_gate)
+            if options_list[index].get('structured'):
+                responses[index].update(structured_output([]))
+            continue
+        if options_list[index].get('autoscale'):
+            img, autoscale_factor, _ = autoscale_image(img, quality)
+            scale *= autoscale_factor
+        images.append(img)
+        gates.append(text_gate)
+        scales.append(scale)
+        members.append(index)
+    
+    if images:
+        reader = get_reader(lang, gpu=gpu_enabled(), network_config=get_network_config(quality))
+        
+        print(f"Batch group lang={lang}, quality={quality}, preprocessing={preprocessing}: {len(images)} images")
+        
+        results = run_ocr_group(reader, images, False, 1, tiled=options_list[0].get('tiled', False))
+        for index, result, text_gate, scale in zip(members, results, gates, scales):
+            regions = reading_order(unscale_result(result, scale))
+            result = finish_readtext(regions, paragraph, detail)
+            responses[index] = format_ocr_result(result, quality, paragraph, options_list[index]['preserve_layout'])
+            if options_list[index].get('structured'):
+                responses[index].update(structured_output(regions))
+            if text_gate is not None:
+                responses[index]['text_gate'] = text_gate
+    
+    return responses
+
+def to_json_number(value):
+    """Convert NumPy scalars in EasyOCR output to plain Python numbers."""
+    return value.item() if hasattr(value, 'item') else value
+
+def region_to_dict(region):
+    """Serialize one EasyOCR region (box, text[, confidence]) for JSON responses."""
+    item = {
+        'box': [[to_json_number(x), to_json_number(y)] for x, y in region[0]],
+        'text': region[1],
+    }
+    if len(region) > 2 and region[2] is not None:
+        item['confidence'] = to_json_number(region[2])
+    return item
+
+def stream_ocr(data, options, chunk_size=OCR_STREAM_CHUNK_SIZE):
+    """OCR one encoded image progressively, yielding (event, payload) pairs.
+    
+    Detection runs once, then regions are recognized in top-to-bottom chunks and emitted as 'region'
+    events; tiled OCR interleaves detection and recognition, so its regions all arrive once every tile is
+    done. With preserve_layout, 'line' events then carry the lines of the laid out text, taken from the
+    same layout pass as the closing 'done' event, which carries the same body /ocr would return. Lines
+    wait for the last region because paragraph grouping (standard and best) can still merge regions
+    into earlier lines.
+    """
+    img = decode_image(data)
+    if img is None:
+        raise ImageDecodeError('Failed to decode image')
+    
+    quality = options['quality']
+    preserve_layout = options['preserve_layout']
+    img, scale = preprocess_image(img, options['preprocessing'], dpi=options.get('dpi'))
+    paragraph, detail = get_recognition_params(quality)
+    
+    text_gate = run_text_gate(img, options, StageTimer())
+    if text_gate is not None and not text_gate['text_likely']:
+        yield 'start', {'regions': 0}
+        body = dict(format_ocr_result([], quality, paragraph, preserve_layout), text_gate=text_gate)
+        if options.get('structured'):
+            body.update(structured_output([]))
+        yield 'done', body
+        return
+    
+    autoscale_info = None
+    if options.get('autoscale'):
+        img, autoscale_factor, autoscale_info = autoscale_image(img, quality)
+        scale *= autoscale_factor
+    
+    reader = get_reader(options['lang'], gpu=gpu_enabled(), network_config=get_network_config(quality))
+    
+    if options.get('tiled'):
+        regions = unscale_result(readtext_tiled(reader, img, paragraph=False, detail=1), scale)
+        yield 'start', {'regions': len(regions)}
+        for region in regions:
+            yield 'region', region_to_dict(region)
+    else:
+        regions = yield from stream_regions(reader, img, scale, chunk_size)
+    
+    # Same post-processing /ocr applies, so the final body matches it
+    regions = reading_order(regions)
+    result = finish_readtext(regions, paragraph, detail)
+    
+    print(f"Streaming OCR completed with {len(result)} text regions detected")
+    
+    text_lines = layout_lines(result, preserve_layout)
+    for index, text in enumerate(text_lines or []):
+        yield 'line', {'index': index, 'text': text}
+    
+    body = format_ocr_result(result, quality, paragraph, preserve_layout, text_lines)
+    if options.get('structured'):
+        body.update(structured_output(regions))
+    if text_gate is not None:
+        body['text_gate'] = text_gate
+    if autoscale_info is not None:
+        body['autoscale'] = autoscale_info
+    yield 'done', body
+
+def stream_regions(reader, img, scale, chunk_size):
+    """Detect once, then recognize regions in top-to-bottom chunks, yielding 'start' and 'region' events.
+    
+    Returns the recognized regions, unscaled by scale, in the order they were emitted.
+    """
+    horizontal_list, free_list = reader.detect(img)
+    horizontal_list, free_list = horizontal_list[0], free_list[0]
+    
+    # Order detections by top edge; horizontal boxes are [x_min, x_max, y_min, y_max], free boxes are 4 points
+    detections = [(box[2], 'horizontal', box) for box in horizontal_list]
+    detections += [(min(p[1] for p in box), 'free', box) for box in free_list]
+    detections.sort(key=lambda item: item[0])
+    
+    yield 'start', {'regions': len(detections)}
+    
+    regions = []
+    for start in range(0, len(detections), chunk_size):
+        chunk = detections[start:start + chunk_size]
+        recognized = reader.recognize(
+            img,
+            horizontal_list=[box for _, kind, box in chunk if kind == 'horizontal'],
+            free_list=[box for _, kind, box in chunk if kind == 'free'],
+            paragraph=False,
+            detail=1,
+            batch_size=OCR_BATCH_SIZE
+        )
+        # recognize returns horizontal boxes before free ones; restore top-to-bottom order
+        recognized.sort(key=lambda region: min(p[1] for p in region[0]))
+        recognized = unscale_result(recognized, scale)
+        
+        for region in recognized:
+            yield 'region', region_to_dict(region)
+        regions.extend(recognized)
+    return regions
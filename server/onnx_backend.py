@@ -0,0 +1,199 @@
+import os
+import threading
+from importlib.util import find_spec
+import numpy as np
+
+# ONNX Runtime is optional; without it every reader keeps running on PyTorch
+ONNX_AVAILABLE = find_spec('onnxruntime') is not None
+
+# Inference backend for new readers: torch (EasyOCR's own eager PyTorch models) or onnx
+OCR_BACKEND = os.environ.get('OCR_BACKEND', 'torch').lower()
+OCR_BACKENDS = ('torch', 'onnx')
+
+# Exported models are written here once and reused by every process
+ONNX_MODEL_DIR = os.environ.get('OCR_ONNX_MODEL_DIR', './models')
+# Threads per inference; 0 follows OMP_NUM_THREADS, which process workers set, or lets ONNX Runtime decide
+ONNX_INTRA_OP_THREADS = int(os.environ.get('OCR_ONNX_INTRA_OP_THREADS', 0))
+ONNX_INTER_OP_THREADS = int(os.environ.get('OCR_ONNX_INTER_OP_THREADS', 1))
+# Idle threads spin for new work; turn off when workers share cores, where spinning steals their time
+ONNX_ALLOW_SPINNING = os.environ.get('OCR_ONNX_ALLOW_SPINNING', '1').lower() in ('true', '1', 't')
+# The memory arena grows to the largest image seen and never shrinks, since every image has a different
+# input shape; without it buffers are returned after each run, at a small cost in detection time
+ONNX_MEM_ARENA = os.environ.get('OCR_ONNX_MEM_ARENA', '0').lower() in ('true', '1', 't')
+
+ONNX_OPSET = 17
+# Exported outputs must match PyTorch this closely on the export input, or the model stays on PyTorch
+EXPORT_TOLERANCE = 1e-3
+# Op types quantized for readers that ask for quantization, matching torch's dynamic quantization of
+# Linear and LSTM layers; quantizing the convolutions as well makes them slower on CPU
+QUANTIZED_OP_TYPES = ['MatMul', 'Gemm', 'LSTM']
+
+export_lock = threading.Lock()
+
+
+def parse_backend(value):
+    """Normalize a backend name, falling back to PyTorch for unknown names or a missing onnxruntime."""
+    value = str(value or OCR_BACKEND).lower()
+    if value not in OCR_BACKENDS:
+        print(f"Unknown OCR backend '{value}', using torch")
+        return 'torch'
+    if value == 'onnx' and not ONNX_AVAILABLE:
+        print("OCR backend 'onnx' requires onnxruntime to be installed, using torch")
+        return 'torch'
+    return value
+
+
+class OnnxModel:
+    """Stands in for one of EasyOCR's PyTorch modules, running its exported graph with ONNX Runtime.
+
+    EasyOCR calls the module with torch tensors and reads a torch tensor back, so the input and the
+    graph's single output are converted at the boundary; any extra call arguments (the recognizer's
+    unused text input) are ignored.
+    """
+
+    def __init__(self, path):
+        import onnxruntime
+        self.path = path
+        self.nbytes = os.path.getsize(path)
+        self.session = onnxruntime.InferenceSession(path, session_options(),
+                                                    providers=['CPUExecutionProvider'])
+        self.input_name = self.session.get_inputs()[0].name
+
+    def __call__(self, input, *args):
+        import torch
+        output = self.session.run(None, {self.input_name: input.detach().cpu().numpy()})[0]
+        return torch.from_numpy(output)
+
+    def eval(self):
+        return self
+
+
+class OnnxDetector(OnnxModel):
+    """CRAFT detector session; EasyOCR unpacks (score maps, feature), and the feature map is not exported."""
+
+    def __call__(self, input, *args):
+        return super().__call__(input), None
+
+
+def session_options():
+    import onnxruntime
+    options = onnxruntime.SessionOptions()
+    options.intra_op_num_threads = ONNX_INTRA_OP_THREADS or int(os.environ.get('OMP_NUM_THREADS', 0))
+    options.inter_op_num_threads = ONNX_INTER_OP_THREADS
+    options.execution_mode = onnxruntime.ExecutionMode.ORT_SEQUENTIAL
+    options.enable_cpu_mem_arena = ONNX_MEM_ARENA
+    options.graph_optimization_level = onnxruntime.GraphOptimizationLevel.ORT_ENABLE_ALL
+    options.add_session_config_entry('session.intra_op.allow_spinning', '1' if ONNX_ALLOW_SPINNING else '0')
+    return options
+
+
+def recognizer_graph(model):
+    """Wrap an EasyOCR recognizer (generation 1 or 2) in a module with an exportable forward pass."""
+    import torch
+
+    class RecognizerGraph(torch.nn.Module):
+        def __init__(self):
+            super().__init__()
+            self.model = model
+
+        def forward(self, input):
+            feature = self.model.FeatureExtraction(input).permute(0, 3, 1, 2)  # [b, c, h, w] -> [b, w, c, h]
+            # Same as the model's AdaptiveAvgPool2d((None, 1)), which cannot be exported with a dynamic width
+            feature = feature.mean(dim=3)
+            contextual = self.model.SequenceModeling(feature)
+            return self.model.Prediction(contextual.contiguous())
+
+    return RecognizerGraph().eval()
+
+
+def detector_graph(model):
+    """Wrap the CRAFT detector so only the score maps EasyOCR reads are exported."""
+    import torch
+
+    class DetectorGraph(torch.nn.Module):
+        def __init__(self):
+            super().__init__()
+            self.model = model
+
+        def forward(self, input):
+            return self.model(input)[0]
+
+    return DetectorGraph().eval()
+
+
+def export_model(graph, dummy, path, dynamic_axes, quantize=False):
+    """Export graph to path through a temporary file, verifying ONNX Runtime against PyTorch first."""
+    import torch
+    import onnxruntime
+    os.makedirs(os.path.dirname(path) or '.', exist_ok=True)
+    temp_path = f'{path}.{os.getpid()}.tmp'
+    try:
+        with torch.no_grad():
+            expected = graph(dummy).numpy()
+            torch.onnx.export(graph, (dummy,), temp_path, input_names=['input'], output_names=['output'],
+                              dynamic_axes=dynamic_axes, opset_version=ONNX_OPSET, do_constant_folding=True,
+                              dynamo=False)
+        session = onnxruntime.InferenceSession(temp_path, providers=['CPUExecutionProvider'])
+        actual = session.run(None, {'input': dummy.numpy()})[0]
+        error = float(np.abs(expected - actual).max())
+        if error > EXPORT_TOLERANCE:
+            raise RuntimeError(f'ONNX output differs from PyTorch by {error:.2e}')
+        del session
+
+        if quantize:
+            from onnxruntime.quantization import QuantType, quantize_dynamic
+            quantized_path = f'{temp_path}.int8'
+            quantize_dynamic(temp_path, quantized_path, weight_type=QuantType.QInt8,
+                             op_types_to_quantize=QUANTIZED_OP_TYPES)
+            os.replace(quantized_path, temp_path)
+        # Other processes only ever see complete files
+        os.replace(temp_path, path)
+    finally:
+        for leftover in (temp_path, f'{temp_path}.int8'):
+            if os.path.exists(leftover):
+                os.remove(leftover)
+
+
+def load_model(name, make_graph, dummy, dynamic_axes, quantize=False, model_class=OnnxModel):
+    """Return a model_class session for name, exporting it under ONNX_MODEL_DIR on first use."""
+    path = os.path.join(ONNX_MODEL_DIR, f"{name}{'.int8' if quantize else ''}.onnx")
+    with export_lock:
+        if not os.path.exists(path):
+            print(f"Exporting {name} to {path}")
+            export_model(make_graph(), dummy, path, dynamic_axes, quantize)
+    return model_class(path)
+
+
+def use_onnx(reader, quantize=False):
+    """Swap a float (quantize=False) EasyOCR reader's detector and recognizer for ONNX Runtime sessions.
+
+    Each model is exported once per EasyOCR version and cached; a model that fails to export keeps
+    running on PyTorch. With quantize, the recognizer's LSTM and linear layers run in int8.
+    """
+    import torch
+    import easyocr
+    from easyocr.config import imgH
+    version = easyocr.__version__
+
+    if getattr(reader, 'detect_network', 'craft') == 'craft':
+        try:
+            reader.detector = load_model(
+                f'craft_easyocr{version}', lambda: detector_graph(reader.detector), torch.rand(1, 3, 256, 256),
+                {'input': {0: 'batch', 2: 'height', 3: 'width'}, 'output': {0: 'batch', 1: 'height', 2: 'width'}},
+                model_class=OnnxDetector)
+        except Exception as e:
+            print(f"Failed to export the detector to ONNX, keeping PyTorch: {str(e)}")
+
+    # Recognizers are shared by every language of a script, and their output size is the character set
+    classes = reader.recognizer.Prediction.out_features if hasattr(reader.recognizer, 'Prediction') else None
+    if classes is None:
+        print("Custom recognizer networks are not exported to ONNX, keeping PyTorch")
+        return reader
+    try:
+        reader.recognizer = load_model(
+            f'recognizer_{reader.model_lang}_{classes}_easyocr{version}', lambda: recognizer_graph(reader.recognizer),
+            torch.rand(1, 1, imgH, 256), {'input': {0: 'batch', 3: 'width'}, 'output': {0: 'batch', 1: 'steps'}},
+            quantize=quantize)
+    except Exception as e:
+        print(f"Failed to export the recognizer to ONNX, keeping PyTorch: {str(e)}")
+    return reader
@@ -0,0 +1,132 @@
+import os
+import time
+import threading
+from functools import lru_cache
+import numpy as np
+import cv2
+
+# Fixed order steps run in, whatever order the request lists them
+STEP_ORDER = ('resize', 'grayscale', 'deskew', 'contrast', 'sharpen', 'binarize')
+
+SHARPEN_KERNEL = np.array([[0, -1, 0], [-1, 5, -1], [0, -1, 0]], dtype=np.float32)
+
+# Resolution that 'resize' scales to from the request's dpi (or DEFAULT_SOURCE_DPI when it gives none)
+TARGET_DPI = int(os.environ.get('OCR_TARGET_DPI', 300))
+# 0 leaves images without a known dpi at their size: most phone photos and scans already exceed TARGET_DPI
+DEFAULT_SOURCE_DPI = int(os.environ.get('OCR_SOURCE_DPI', 0))
+# Largest upscaled image 'resize' will produce
+MAX_RESIZE_PIXELS = int(os.environ.get('OCR_MAX_RESIZE_PIXELS', 40_000_000))
+
+# CLAHE objects keep internal buffers, so each thread gets its own
+_local = threading.local()
+
+
+def get_clahe():
+    clahe = getattr(_local, 'clahe', None)
+    if clahe is None:
+        clahe = _local.clahe = cv2.createCLAHE(clipLimit=3.0, tileGridSize=(8, 8))
+    return clahe
+
+
+def to_gray(img):
+    return img if img.ndim == 2 else cv2.cvtColor(img, cv2.COLOR_BGR2GRAY)
+
+
+def resize_step(img, context):
+    """Scale from the source resolution to TARGET_DPI; images of unknown resolution are left alone."""
+    source_dpi = context.get('dpi') or DEFAULT_SOURCE_DPI
+    if not source_dpi:
+        return img
+    scale = TARGET_DPI / float(source_dpi)
+    if abs(scale - 1.0) < 0.05:
+        return img
+    height, width = img.shape[:2]
+    if scale > 1 and height * width * scale * scale > MAX_RESIZE_PIXELS:
+        scale = (MAX_RESIZE_PIXELS / float(height * width)) ** 0.5
+    context['scale'] = context.get('scale', 1.0) * scale
+    interpolation = cv2.INTER_CUBIC if scale > 1 else cv2.INTER_AREA
+    return cv2.resize(img, None, fx=scale, fy=scale, interpolation=interpolation)
+
+
+def grayscale_step(img, context):
+    # Stay single-channel; EasyOCR expands to BGR once for the detector
+    return to_gray(img)
+
+
+def deskew_step(img, context):
+    """Rotate the page so text lines are horizontal, estimated from the foreground pixels."""
+    gray = to_gray(img)
+    _, mask = cv2.threshold(gray, 0, 255, cv2.THRESH_BINARY_INV | cv2.THRESH_OTSU)
+    points = cv2.findNonZero(mask)
+    if points is None or len(points) < 10:
+        return img
+
+    angle = cv2.minAreaRect(points)[-1]
+    # minAreaRect reports [-90, 0) or (0, 90] depending on the OpenCV version; map to the smallest rotation
+    if angle < -45:
+        angle += 90
+    elif angle > 45:
+        angle -= 90
+    if abs(angle) < 0.1 or abs(angle) > 45:
+        return img
+
+    context['deskew_angle'] = round(float(angle), 2)
+    height, width = img.shape[:2]
+    matrix = cv2.getRotationMatrix2D((width / 2, height / 2), angle, 1.0)
+    return cv2.warpAffine(img, matrix, (width, height), flags=cv2.INTER_LINEAR, borderMode=cv2.BORDER_REPLICATE)
+
+
+def contrast_step(img, context):
+    """CLAHE on luminance: directly on grayscale images, on the L channel of LAB for colour."""
+    clahe = get_clahe()
+    if img.ndim == 2:
+        return clahe.apply(img, dst=img)
+
+    lab = cv2.cvtColor(img, cv2.COLOR_BGR2LAB)
+    lightness = np.ascontiguousarray(lab[:, :, 0])
+    lab[:, :, 0] = clahe.apply(lightness, dst=lightness)
+    return cv2.cvtColor(lab, cv2.COLOR_LAB2BGR, dst=img)
+
+
+def sharpen_step(img, context):
+    return cv2.filter2D(img, -1, SHARPEN_KERNEL, dst=img)
+
+
+def binarize_step(img, context):
+    """Adaptive threshold, which copes with uneven lighting better than a global one."""
+    gray = to_gray(img)
+    return cv2.adaptiveThreshold(gray, 255, cv2.ADAPTIVE_THRESH_GAUSSIAN_C, cv2.THRESH_BINARY, 31, 15, dst=gray)
+
+
+STEPS = {
+    'resize': resize_step,
+    'grayscale': grayscale_step,
+    'deskew': deskew_step,
+    'contrast': contrast_step,
+    'sharpen': sharpen_step,
+    'binarize': binarize_step,
+}
+
+
+@lru_cache(maxsize=64)
+def compile_pipeline(steps):
+    """Resolve a tuple of step names into the ordered stages to run; unknown names are ignored."""
+    return tuple((name, STEPS[name]) for name in STEP_ORDER if name in steps)
+
+
+def run_pipeline(img, preprocessing, dpi=None):
+    """Apply preprocessing steps, modifying img in place where possible.
+
+    Returns (image, info) where info holds per-stage timings in milliseconds and anything a stage
+    measured (such as the resize scale or deskew angle).
+    """
+    context = {'dpi': dpi}
+    timings = {}
+    for name, stage in compile_pipeline(tuple(sorted(set(preprocessing or ())))):
+        start = time.perf_counter()
+        img = stage(img, context)
+        timings[name] = round((time.perf_counter() - start) * 1000, 2)
+
+    context.pop('dpi')
+    context['timings_ms'] = timings
+    return img, context
@@ -0,0 +1,153 @@
+import os
+import time
+import threading
+from collections import OrderedDict
+
+
+def estimate_reader_bytes(reader):
+    """Estimate the memory held by an EasyOCR reader from its model parameters (or ONNX model sizes)."""
+    total = 0
+    for name in ('detector', 'recognizer'):
+        model = getattr(reader, name, None)
+        if hasattr(model, 'nbytes'):
+            total += model.nbytes
+            continue
+        parameters = getattr(model, 'parameters', None)
+        if parameters is None:
+            continue
+        try:
+            total += sum(p.numel() * p.element_size() for p in parameters())
+        except Exception:
+            pass
+    return total
+
+
+class ReaderEntry:
+    def __init__(self, reader, load_seconds, size):
+        self.reader = reader
+        self.load_seconds = load_seconds
+        self.size = size
+        self.hits = 0
+        self.loaded_at = time.time()
+        self.last_used = self.loaded_at
+
+
+class ReaderPool:
+    """LRU pool of OCR readers bounded by count and memory, building each key only once."""
+
+    def __init__(self, max_readers=4, max_bytes=0):
+        self.max_readers = max_readers
+        self.max_bytes = max_bytes  # 0 disables the memory budget
+        self.entries = OrderedDict()
+        self.loading = {}  # key -> lock held while that reader is being built
+        self.lock = threading.Lock()
+        self.loads = 0
+        self.evictions = 0
+
+    def get(self, key, factory):
+        """Return the reader for key, building it with factory() if needed."""
+        with self.lock:
+            entry = self._touch(key)
+            if entry is not None:
+                return entry.reader
+            key_lock = self.loading.setdefault(key, threading.Lock())
+
+        # Only one thread builds a given key; others wait here and then find it in the pool
+        with key_lock:
+            with self.lock:
+                entry = self._touch(key)
+                if entry is not None:
+                    return entry.reader
+
+            try:
+                start_time = time.time()
+                reader = factory()
+                load_seconds = time.time() - start_time
+            finally:
+                with self.lock:
+                    self.loading.pop(key, None)
+
+            with self.lock:
+                entry = ReaderEntry(reader, load_seconds, estimate_reader_bytes(reader))
+                entry.hits = 1
+                self.entries[key] = entry
+                self.loads += 1
+                self._evict(keep=key)
+            return reader
+
+    def _touch(self, key):
+        entry = self.entries.get(key)
+        if entry is not None:
+            self.entries.move_to_end(key)
+            entry.hits += 1
+            entry.last_used = time.time()
+        return entry
+
+    def _evict(self, keep):
+        while len(self.entries) > 1 and (
+                len(self.entries) > self.max_readers or
+                (self.max_bytes and sum(e.size for e in self.entries.values()) > self.max_bytes)):
+            key = next(iter(self.entries))
+            if key == keep:
+                break
+            del self.entries[key]
+            self.evictions += 1
+            print(f"Evicted OCR reader {key} from pool")
+
+    def __len__(self):
+        return len(self.entries)
+
+    def stats(self):
+        with self.lock:
+            return {
+                'readers': len(self.entries),
+                'max_readers': self.max_readers,
+                'bytes': sum(e.size for e in self.entries.values()),
+                'max_bytes': self.max_bytes,
+                'loading': list(self.loading),
+                'loads': self.loads,
+                'evictions': self.evictions,
+                'entries': {
+                    key: {
+                        'load_seconds': round(entry.load_seconds, 3),
+                        'bytes': entry.size,
+                        'hits': entry.hits,
+                        'idle_seconds': round(time.time() - entry.last_used, 1),
+                    }
+                    for key, entry in self.entries.items()
+                },
+            }
+
+
+def merge_pool_stats(snapshots):
+    """Combine per-worker reader pool stats (pid -> stats()) into totals plus each worker's own view."""
+    return {
+        'readers': sum(stats['readers'] for stats in snapshots.values()),
+        'max_readers': sum(stats['max_readers'] for stats in snapshots.values()),
+        'bytes': sum(stats['bytes'] for stats in snapshots.values()),
+        'max_bytes': sum(stats['max_bytes'] for stats in snapshots.values()),
+        'loading': sorted({key for stats in snapshots.values() for key in stats['loading']}),
+        'loads': sum(stats['loads'] for stats in snapshots.values()),
+        'evictions': sum(stats['evictions'] for stats in snapshots.values()),
+        'workers': {str(pid): stats for pid, stats in snapshots.items()},
+    }
+
+
+def parse_preload(value):
+    """Parse a warm-up list like 'eng:standard,jpn:fast' into (language, quality) pairs."""
+    pairs = []
+    for item in (value or '').split(','):
+        item = item.strip()
+        if not item:
+            continue
+        lang, _, quality = item.partition(':')
+        pairs.append((lang.strip(), quality.strip() or 'standard'))
+    return pairs
+
+
+def create_reader_pool():
+    """Build the reader pool from environment configuration."""
+    return ReaderPool(
+        max_readers=int(os.environ.get('OCR_MAX_READERS', 4)),
+        max_bytes=int(float(os.environ.get('OCR_READER_MEMORY_MB', 0)) * 1024 * 1024),
+    )
@@ -0,0 +1,140 @@
+import os
+import json
+import time
+import sqlite3
+import hashlib
+import threading
+from collections import OrderedDict
+
+
+class OcrResultCache:
+    """Content-addressed cache of OCR responses with an in-memory LRU and an optional SQLite tier."""
+
+    def __init__(self, max_entries=256, max_bytes=64 * 1024 * 1024, db_path=None, db_max_entries=10000):
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.db_path = db_path
+        self.db_max_entries = db_max_entries
+        self.entries = OrderedDict()  # key -> serialized response
+        self.size = 0
+        self.hits = 0
+        self.disk_hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.lock = threading.Lock()
+        self.db = None
+
+        if db_path:
+            directory = os.path.dirname(db_path)
+            if directory and not os.path.exists(directory):
+                os.makedirs(directory)
+            self.db = sqlite3.connect(db_path, check_same_thread=False)
+            self.db.execute(
+                'CREATE TABLE IF NOT EXISTS ocr_results '
+                '(key TEXT PRIMARY KEY, value BLOB NOT NULL, accessed REAL NOT NULL)'
+            )
+            self.db.commit()
+
+    @property
+    def enabled(self):
+        return self.max_entries > 0 or self.db is not None
+
+    @staticmethod
+    def make_key(data, lang, quality, preprocessing, preserve_layout, **extra):
+        """Hash the image bytes together with every option that changes the OCR output."""
+        digest = hashlib.sha256(data)
+        options = {
+            'lang': lang,
+            'quality': quality,
+            'preprocessing': list(preprocessing or []),
+            'preserve_layout': bool(preserve_layout),
+        }
+        options.update(extra)
+        digest.update(json.dumps(options, sort_keys=True).encode('utf-8'))
+        return digest.hexdigest()
+
+    def get(self, key):
+        """Return the cached response for key, or None on a miss."""
+        with self.lock:
+            value = self.entries.get(key)
+            if value is not None:
+                self.entries.move_to_end(key)
+                self.hits += 1
+                return json.loads(value)
+
+            if self.db is not None:
+                row = self.db.execute('SELECT value FROM ocr_results WHERE key = ?', (key,)).fetchone()
+                if row is not None:
+                    self.db.execute('UPDATE ocr_results SET accessed = ? WHERE key = ?', (time.time(), key))
+                    self.db.commit()
+                    self.hits += 1
+                    self.disk_hits += 1
+                    # Promote to the memory tier
+                    self._store_memory(key, row[0])
+                    return json.loads(row[0])
+
+            self.misses += 1
+            return None
+
+    def put(self, key, response):
+        """Store a response in every enabled tier."""
+        value = json.dumps(response).encode('utf-8')
+        with self.lock:
+            self._store_memory(key, value)
+
+            if self.db is not None:
+                self.db.execute(
+                    'INSERT OR REPLACE INTO ocr_results (key, value, accessed) VALUES (?, ?, ?)',
+                    (key, value, time.time())
+                )
+                # Trim the persistent tier to its least recently used entries
+                overflow = self.db.execute('SELECT COUNT(*) FROM ocr_results').fetchone()[0] - self.db_max_entries
+                if overflow > 0:
+                    self.db.execute(
+                        'DELETE FROM ocr_results WHERE key IN '
+                        '(SELECT key FROM ocr_results ORDER BY accessed LIMIT ?)', (overflow,)
+                    )
+                    self.evictions += overflow
+                self.db.commit()
+
+    def _store_memory(self, key, value):
+        if self.max_entries <= 0 or len(value) > self.max_bytes:
+            return
+
+        if key in self.entries:
+            self.size -= len(self.entries.pop(key))
+        self.entries[key] = value
+        self.size += len(value)
+
+        while len(self.entries) > self.max_entries or self.size > self.max_bytes:
+            _, evicted = self.entries.popitem(last=False)
+            self.size -= len(evicted)
+            self.evictions += 1
+
+    def stats(self):
+        with self.lock:
+            lookups = self.hits + self.misses
+            stats = {
+                'entries': len(self.entries),
+                'bytes': self.size,
+                'max_entries': self.max_entries,
+                'max_bytes': self.max_bytes,
+                'hits': self.hits,
+                'disk_hits': self.disk_hits,
+                'misses': self.misses,
+                'evictions': self.evictions,
+                'hit_rate': round(self.hits / lookups, 3) if lookups else 0.0,
+            }
+            if self.db is not None:
+                stats['disk_entries'] = self.db.execute('SELECT COUNT(*) FROM ocr_results').fetchone()[0]
+            return stats
+
+
+def create_result_cache():
+    """Build the result cache from environment configuration."""
+    return OcrResultCache(
+        max_entries=int(os.environ.get('OCR_CACHE_MAX_ENTRIES', 256)),
+        max_bytes=int(float(os.environ.get('OCR_CACHE_MAX_MB', 64)) * 1024 * 1024),
+        db_path=os.environ.get('OCR_CACHE_DB') or None,
+        db_max_entries=int(os.environ.get('OCR_CACHE_DB_MAX_ENTRIES', 10000)),
+    )
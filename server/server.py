@@ -1,103 +1,287 @@
-from flask import Flask, request, jsonify
+from flask import Flask, Response, request, jsonify, stream_with_context
 from flask_cors import CORS
-import easyocr
-import numpy as np
-import cv2
 import os
 import time
 import traceback
-import re  # Add missing import for regular expressions
-from werkzeug.utils import secure_filename
+import io
+import json
+import zipfile
+import threading
 from dotenv import load_dotenv
+from werkzeug.exceptions import RequestEntityTooLarge
 from claude_service import claude_service
+from result_cache import create_result_cache
+from image_io import (InMemoryRequest, ImageDecodeError, ImageTooLargeError, MAX_UPLOAD_BYTES, MAX_REQUEST_BYTES,
+                      check_image_limits)
+from jobs import create_job_queue
+from preprocessing import STEP_ORDER as PREPROCESSING_STEPS
+from ocr_engine import (reader_pool, preload_readers, process_image_timed, process_image_group, stream_ocr,
+                        recognize_regions, process_document_page)
+from documents import DOCUMENT_WINDOW, DocumentError, is_document, page_count, spool_document, merge_pages
+from image_store import create_image_store
+from text_gate import TEXT_GATE_DEFAULT, GATE_METHODS, parse_gate
+from autoscale import AUTOSCALE_DEFAULT
+from onnx_backend import OCR_BACKEND, ONNX_AVAILABLE
+from encoding import MSGPACK_AVAILABLE, RESPONSE_FORMATS, parse_format, encode_body, compress_response
+from worker_pool import QueueFullError, create_executor
+from metrics import (StageTimer, registry as metrics_registry, ocr_stage_seconds, ocr_request_seconds,
+                     ocr_text_gate_total, http_requests_total, chat_latency_seconds, chat_first_token_seconds, chat_tokens_total)
 
 # Load environment variables
 load_dotenv()
 
 app = Flask(__name__)
-CORS(app)  # Enable CORS for all routes
+CORS(app, expose_headers=['X-OCR-Cache', 'Retry-After', 'Location', 'Server-Timing'])  # Enable CORS for all routes
+
+# Keep uploads in memory and cap the request body size
+app.request_class = InMemoryRequest
+app.config['MAX_CONTENT_LENGTH'] = MAX_REQUEST_BYTES
 
 # Initialize API key from environment variable
 CLAUDE_API_KEY = os.getenv("CLAUDE_API_KEY")
 if CLAUDE_API_KEY:
     claude_service.init_api_client(CLAUDE_API_KEY)
 
-# Initialize the OCR reader cache
-readers = {}
+# Cache of OCR responses keyed by image content and options
+result_cache = create_result_cache()
 
-def get_reader(lang, gpu=False, network_config=None):
-    """Get or create an EasyOCR reader for the specified language."""
-    try:
-        cache_key = f"{lang}_{gpu}_{network_config}"
-        
-        if cache_key not in readers:
-            # Map frontend language codes to EasyOCR language codes
-            lang_mapping = {
-                'eng': ['en'],
-                'spa': ['es'],
-                'fra': ['fr'],
-                'deu': ['de'],
-                'chi_sim': ['ch_sim'],
-                'jpn': ['ja'],
-                'kor': ['ko'],
-                'rus': ['ru']
-            }
-            
-            # Default to English if language not supported
-            ocr_lang = lang_mapping.get(lang, ['en'])
-            
-            print(f"Initializing EasyOCR reader for language: {ocr_lang}")
-            
-            # Create reader with specific configuration if provided
-            if network_config == 'fast':
-                # Use a simpler model for faster processing
-                readers[cache_key] = easyocr.Reader(ocr_lang, gpu=gpu, quantize=True, model_storage_directory='./models')
-            elif network_config == 'accurate':
-                # Use the full model for best accuracy
-                readers[cache_key] = easyocr.Reader(ocr_lang, gpu=gpu, quantize=False, 
-                                                model_storage_directory='./models')
-            else:
-                # Default configuration
-                readers[cache_key] = easyocr.Reader(ocr_lang, gpu=gpu, model_storage_directory='./models')
-            
-            print(f"Successfully initialized reader for {lang}")
-        
-        return readers[cache_key]
-    except Exception as e:
-        print(f"Error creating EasyOCR reader: {str(e)}")
-        print(traceback.format_exc())
-        raise
+# Decoded images and detections kept for region-of-interest recognition
+image_store = create_image_store()
+
+# OCR executor, created on first use so spawned worker processes never build their own
+executor = None
+executor_lock = threading.Lock()
+SERVER_MODE = os.environ.get('OCR_SERVER_MODE', 'development')  # development or production
+
+def get_executor():
+    """Return the OCR executor, creating it (and its worker processes) on first use."""
+    global executor
+    with executor_lock:
+        if executor is None:
+            executor = create_executor(production=SERVER_MODE == 'production')
+        return executor
+
+# Background OCR jobs for clients that poll instead of holding a connection open
+job_queue = create_job_queue(lambda data, options: run_ocr_cached(data, options)[0])
+
+# Send a Server-Timing header with every OCR response; otherwise only when a request asks for it
+OCR_SERVER_TIMING = os.environ.get('OCR_SERVER_TIMING', '0').lower() in ('true', '1', 't')
+
+# Batch OCR settings
+OCR_BATCH_MAX_IMAGES = int(os.environ.get('OCR_BATCH_MAX_IMAGES', 100))
+
+def get_ocr_options(form, overrides=None):
+    """Read OCR parameters from a request form, applying optional per-image overrides."""
+    overrides = overrides or {}
+    preprocessing = overrides.get('preprocessing', form.getlist('preprocessing'))
+    if isinstance(preprocessing, str):
+        preprocessing = [preprocessing]
+    preserve_layout = overrides.get('preserve_layout', form.get('preserve_layout', 'true'))
+    if not isinstance(preserve_layout, bool):
+        preserve_layout = str(preserve_layout).lower() == 'true'
+    return {
+        'lang': overrides.get('language', form.get('language', 'eng')),
+        'quality': overrides.get('quality', form.get('quality', 'standard')),  # fast, standard, or best
+        'preprocessing': list(preprocessing),  # List of preprocessing steps
+        'preserve_layout': preserve_layout,
+        'tiled': str(overrides.get('tiled', form.get('tiled', 'false'))).lower() == 'true',  # Tile very large images
+        'dpi': int(overrides.get('dpi', form.get('dpi', 0)) or 0) or None,  # Source resolution for 'resize'
+        'render_dpi': int(overrides.get('render_dpi', form.get('render_dpi', 0)) or 0) or None,  # PDF page resolution
+        # Skip recognition when a cheap check finds no likely text: heuristic, detector or off
+        'text_gate': parse_gate(overrides.get('text_gate', form.get('text_gate', TEXT_GATE_DEFAULT))),
+        # Resize so the dominant text height suits the quality setting; boxes are mapped back
+        'autoscale': str(overrides.get('autoscale', form.get('autoscale', AUTOSCALE_DEFAULT))).lower() in ('true', '1', 't'),
+        # Keep the image and detections server-side so regions can be recognized again by id
+        'keep_regions': str(overrides.get('keep_regions', form.get('keep_regions', 'false'))).lower() == 'true',
+        # Add per-region boxes, text and confidence plus the layout pass's line groups to the body
+        'structured': str(overrides.get('structured', form.get('structured', 'false'))).lower() == 'true',
+    }
+
+# Options that change the OCR output beyond the basic four; only set ones are added to the cache key
+CACHE_KEY_OPTIONS = ('tiled', 'dpi', 'render_dpi', 'text_gate', 'autoscale', 'structured')
+
+def get_cache_key(data, options):
+    """Content hash of the image plus every option that affects the result."""
+    extra = {name: options[name] for name in CACHE_KEY_OPTIONS if options.get(name)}
+    return result_cache.make_key(data, options['lang'], options['quality'], options['preprocessing'],
+                                 options['preserve_layout'], **extra)
 
-def preprocess_image(img, preprocessing=None):
-    """Apply preprocessing to an image."""
-    if preprocessing is None:
-        return img
+def document_pages(data, options):
+    """OCR every page of a PDF or TIFF upload, returning (page count, generator of (page body, stage seconds)).
     
-    processed = img.copy()
+    Pages are rendered inside the tasks, and only a window of them is in flight at once, so memory stays
+    bounded by the window rather than the page count.
+    """
+    count = page_count(data)
+    return count, spooled_pages(data, count, options)
+
+def spooled_pages(data, count, options):
+    # The upload is written to a temporary file on first use, so tasks get its path rather than its bytes,
+    # and removed when the generator finishes or is closed
+    path = spool_document(data)
+    try:
+        ocr_executor = get_executor()
+        window = DOCUMENT_WINDOW or max(ocr_executor.workers, 1)
+        yield from ocr_executor.imap(process_document_page, [(path, index, options) for index in range(count)],
+                                     window)
+    finally:
+        os.remove(path)
+
+def run_document(data, options):
+    """OCR a multi-page document into one body with per-page results; stage seconds are summed over pages."""
+    _, results = document_pages(data, options)
+    pages = []
+    stages = {}
+    for page, page_stages in results:
+        pages.append(page)
+        for stage, seconds in page_stages.items():
+            stages[stage] = stages.get(stage, 0.0) + seconds
+    print(f"Document OCR completed for {len(pages)} pages")
+    return merge_pages(pages, options['quality']), stages
+
+def record_text_gate(body):
+    """Count text gate decisions in a freshly computed body, including each page of a document."""
+    for item in body.get('pages', [body]):
+        text_gate = item.get('text_gate')
+        if text_gate is not None:
+            ocr_text_gate_total.inc(method=text_gate['method'],
+                                    result='passed' if text_gate['text_likely'] else 'skipped')
+
+def run_ocr_cached(data, options):
+    """OCR one encoded image through the result cache and executor.
     
-    if 'grayscale' in preprocessing:
-        processed = cv2.cvtColor(processed, cv2.COLOR_BGR2GRAY)
-        processed = cv2.cvtColor(processed, cv2.COLOR_GRAY2BGR)
+    Returns (body, cache status, stage seconds); cache hits have no stages. With keep_regions the cache is
+    skipped, since the response refers to an image kept for this request.
+    """
+    # Return the stored response if this exact image was already processed with the same options
+    cache_key = None
+    if result_cache.enabled and not options.get('keep_regions'):
+        cache_key = get_cache_key(data, options)
+        cached = result_cache.get(cache_key)
+        if cached is not None:
+            print("OCR result served from cache")
+            return cached, 'hit', {}
     
-    if 'contrast' in preprocessing:
-        # Convert to LAB color space where L is the luminance
-        lab = cv2.cvtColor(processed, cv2.COLOR_BGR2LAB)
-        # Apply CLAHE (Contrast Limited Adaptive Histogram Equalization) to L channel
-        clahe = cv2.createCLAHE(clipLimit=3.0, tileGridSize=(8, 8))
-        lab[:, :, 0] = clahe.apply(lab[:, :, 0])
-        # Convert back to BGR color space
-        processed = cv2.cvtColor(lab, cv2.COLOR_LAB2BGR)
+    # Decode, preprocess and recognize, on a worker process when the pool is enabled
+    kept = None
+    if is_document(data):
+        body, stages = run_document(data, options)
+    else:
+        body, stages, kept = get_executor().run(process_image_timed, data, options)
+    if kept is not None:
+        image_id = image_store.put(*kept, options)
+        if image_id is not None:
+            body['image_id'] = image_id
+    record_text_gate(body)
+    if cache_key is None:
+        return body, 'disabled', stages
     
-    if 'sharpen' in preprocessing:
-        kernel = np.array([[0, -1, 0], [-1, 5, -1], [0, -1, 0]])
-        processed = cv2.filter2D(processed, -1, kernel)
+    result_cache.put(cache_key, body)
+    return body, 'miss', stages
+
+def server_timing_requested():
+    """Whether this response should carry a Server-Timing header (opt-in per request with timing=true)."""
+    requested = request.args.get('timing', request.form.get('timing', ''))
+    return OCR_SERVER_TIMING or str(requested).lower() in ('true', '1', 't')
+
+def response_format():
+    """Format the client asked for with ?format= or a form field, else through its Accept header."""
+    return parse_format(request.args.get('format', request.form.get('format')), request.accept_mimetypes)
+
+def ocr_response(body, fmt):
+    """Encode an OCR body as JSON, packed JSON or MessagePack."""
+    data, mimetype = encode_body(body, fmt)
+    return Response(data, mimetype=mimetype)
+
+def record_ocr_timings(timer, endpoint, options, cache_status, start_time):
+    """Feed one request's stage timings, and its wall-clock time since start_time, into the latency histograms.
     
-    return processed
+    The request time also covers what no stage measures: queue wait and the round trip to a worker process.
+    """
+    labels = {'language': options['lang'], 'quality': options['quality']}
+    for stage, seconds in timer.stages.items():
+        ocr_stage_seconds.observe(seconds, stage=stage, **labels)
+    ocr_request_seconds.observe(time.time() - start_time, endpoint=endpoint, cache=cache_status, **labels)
 
 @app.route('/ocr', methods=['POST'])
 def perform_ocr():
-    temp_filepath = None
     try:
+        start_time = time.time()
+        timer = StageTimer()
+        
+        # Parsing the multipart body happens on first access to request.files
+        with timer.stage('receive'):
+            if 'file' not in request.files:
+                return jsonify({'error': 'No file part'}), 400
+            
+            file = request.files['file']
+            if file.filename == '':
+                return jsonify({'error': 'No selected file'}), 400
+            
+            data = file.read()
+        
+        # Get parameters from request
+        options = get_ocr_options(request.form)
+        lang = options['lang']
+        quality = options['quality']
+        preprocessing = options['preprocessing']
+        preserve_layout = options['preserve_layout']
+        
+        print(f"OCR request: lang={lang}, quality={quality}, preprocessing={preprocessing}, preserve_layout={preserve_layout}, tiled={options['tiled']}")
+        
+        if options['keep_regions'] and options['tiled']:
+            return jsonify({'error': 'keep_regions is not supported with tiled OCR'}), 400
+        if options['keep_regions'] and is_document(data):
+            return jsonify({'error': 'keep_regions is not supported for multi-page documents'}), 400
+        # Images are checked again as they are decoded, but PDFs and TIFFs are only ever opened page by page
+        check_image_limits(data)
+        try:
+            fmt = response_format()
+        except ValueError as e:
+            return jsonify({'error': str(e)}), 400
+        
+        body, cache_status, stages = run_ocr_cached(data, options)
+        timer.update(stages)
+        
+        with timer.stage('serialize'):
+            response = ocr_response(body, fmt)
+        response.headers['X-OCR-Cache'] = cache_status
+        
+        record_ocr_timings(timer, 'ocr', options, cache_status, start_time)
+        if server_timing_requested():
+            response.headers['Server-Timing'] = timer.server_timing()
+            response.headers['Timing-Allow-Origin'] = '*'
+        return response
+    
+    except RequestEntityTooLarge:
+        return request_too_large(None)
+    except ImageTooLargeError as e:
+        return jsonify({'error': str(e)}), 413
+    except ImageDecodeError as e:
+        return jsonify({'error': f'{str(e)} {file.filename}'}), 400
+    except DocumentError as e:
+        return jsonify({'error': str(e)}), 400
+    except QueueFullError as e:
+        return queue_full(e)
+    except Exception as e:
+        # Print detailed error information
+        print(f"Error during OCR processing: {str(e)}")
+        print(traceback.format_exc())
+        return jsonify({'error': str(e)}), 500
+
+def format_sse(event, payload):
+    """Encode one Server-Sent Event."""
+    return f"event: {event}\ndata: {json.dumps(payload)}\n\n"
+
+@app.route('/ocr/stream', methods=['POST'])
+def perform_ocr_stream():
+    """Stream OCR regions and then the laid out lines as Server-Sent Events, ending with the /ocr body.
+    
+    PDFs and TIFFs are streamed a page at a time instead: 'start' with the page count, one 'page' event
+    per page in order, then 'done' with the combined body.
+    """
+    try:
+        start_time = time.time()
         if 'file' not in request.files:
             return jsonify({'error': 'No file part'}), 400
         
@@ -105,214 +289,365 @@ def perform_ocr():
         if file.filename == '':
             return jsonify({'error': 'No selected file'}), 400
         
-        # Get parameters from request
-        lang = request.form.get('language', 'eng')
-        quality = request.form.get('quality', 'standard')  # fast, standard, or best
-        preprocessing = request.form.getlist('preprocessing')  # List of preprocessing steps
-        preserve_layout = request.form.get('preserve_layout', 'true').lower() == 'true'  # New parameter
-        
-        print(f"OCR request: lang={lang}, quality={quality}, preprocessing={preprocessing}, preserve_layout={preserve_layout}")
-        
-        # Map quality to network config
-        network_config = None
-        if quality == 'fast':
-            network_config = 'fast'
-        elif quality == 'best':
-            network_config = 'accurate'
-        
-        # Determine if GPU should be used (based on environment variable)
-        use_gpu = os.environ.get('USE_GPU', '0').lower() in ('true', '1', 't')
-        
-        # Create temp directory if it doesn't exist
-        if not os.path.exists('temp'):
-            os.makedirs('temp')
-        
-        # Save file temporarily
-        filename = secure_filename(f"{int(time.time())}_{file.filename}")
-        temp_filepath = os.path.join('temp', filename)
-        file.save(temp_filepath)
-        
-        print(f"Image saved to {temp_filepath}")
-        
-        # Read image using OpenCV
-        img = cv2.imread(temp_filepath)
-        if img is None:
-            return jsonify({'error': f'Failed to read image at {temp_filepath}'}), 400
+        options = get_ocr_options(request.form)
+        data = file.read()
+        check_image_limits(data)
+        
+        print(f"Streaming OCR request: lang={options['lang']}, quality={options['quality']}, preserve_layout={options['preserve_layout']}")
+        
+        cache_key = get_cache_key(data, options) if result_cache.enabled else None
+        cached = result_cache.get(cache_key) if cache_key is not None else None
+        if cached is not None:
+            response = Response(format_sse('done', cached), mimetype='text/event-stream')
+            response.headers['X-OCR-Cache'] = 'hit'
+            ocr_request_seconds.observe(time.time() - start_time, endpoint='stream', language=options['lang'],
+                                        quality=options['quality'], cache='hit')
+            return response
+        
+        if is_document(data):
+            count, pages = document_pages(data, options)
+            
+            def generate_pages():
+                try:
+                    yield format_sse('start', {'pages': count})
+                    results = []
+                    for page, _ in pages:
+                        results.append(page)
+                        yield format_sse('page', page)
+                    body = merge_pages(results, options['quality'])
+                    record_text_gate(body)
+                    if cache_key is not None:
+                        result_cache.put(cache_key, body)
+                    yield format_sse('done', body)
+                except QueueFullError as e:
+                    # Pages take their queue slots as they are submitted, after the response has started
+                    yield format_sse('error', {'error': str(e), 'retry_after': e.retry_after})
+                except Exception as e:
+                    print(f"Error during streaming document OCR: {str(e)}")
+                    print(traceback.format_exc())
+                    yield format_sse('error', {'error': str(e)})
+                finally:
+                    # Stops submitting pages if the client went away
+                    pages.close()
+                    ocr_request_seconds.observe(time.time() - start_time, endpoint='stream', language=options['lang'],
+                                                quality=options['quality'],
+                                                cache='miss' if cache_key is not None else 'disabled')
             
-        # Apply preprocessing if requested
-        if preprocessing:
-            img = preprocess_image(img, preprocessing)
+            response = Response(stream_with_context(generate_pages()), mimetype='text/event-stream')
+            response.headers['Cache-Control'] = 'no-cache'
+            response.headers['X-Accel-Buffering'] = 'no'
+            response.headers['X-OCR-Cache'] = 'miss' if cache_key is not None else 'disabled'
+            return response
         
-        # Get the EasyOCR reader with appropriate configuration
-        reader = get_reader(lang, gpu=use_gpu, network_config=network_config)
+        # Runs on a worker process in production mode; a full queue is rejected here with a 503
+        events = get_executor().stream(stream_ocr, data, options)
         
-        # Determine recognition parameters based on quality
-        paragraph = quality != 'fast'  # Group text into paragraphs for standard and best
-        detail = 0 if quality == 'fast' else 1  # Level of detection detail
+        def generate():
+            try:
+                for event, payload in events:
+                    if event == 'done':
+                        record_text_gate(payload)
+                        if cache_key is not None:
+                            result_cache.put(cache_key, payload)
+                    yield format_sse(event, payload)
+            except Exception as e:
+                print(f"Error during streaming OCR: {str(e)}")
+                print(traceback.format_exc())
+                yield format_sse('error', {'error': str(e)})
+            finally:
+                # Stops reading if the client went away; the worker's slot is freed when it finishes
+                events.close()
+                ocr_request_seconds.observe(time.time() - start_time, endpoint='stream', language=options['lang'],
+                                            quality=options['quality'],
+                                            cache='miss' if cache_key is not None else 'disabled')
         
-        print(f"Starting OCR with paragraph={paragraph}, detail={detail}")
+        response = Response(stream_with_context(generate()), mimetype='text/event-stream')
+        response.headers['Cache-Control'] = 'no-cache'
+        response.headers['X-Accel-Buffering'] = 'no'  # Stop reverse proxies from buffering events
+        response.headers['X-OCR-Cache'] = 'miss' if cache_key is not None else 'disabled'
+        return response
+    
+    except RequestEntityTooLarge:
+        return request_too_large(None)
+    except ImageTooLargeError as e:
+        return jsonify({'error': str(e)}), 413
+    except DocumentError as e:
+        return jsonify({'error': str(e)}), 400
+    except QueueFullError as e:
+        return queue_full(e)
+    except Exception as e:
+        print(f"Error during streaming OCR: {str(e)}")
+        print(traceback.format_exc())
+        return jsonify({'error': str(e)}), 500
+
+@app.route('/ocr/jobs', methods=['POST'])
+def submit_ocr_job():
+    """Queue an image for background OCR and return a job id to poll."""
+    try:
+        if 'file' not in request.files:
+            return jsonify({'error': 'No file part'}), 400
         
-        # Perform OCR
-        result = reader.readtext(img, paragraph=paragraph, detail=detail)
+        file = request.files['file']
+        if file.filename == '':
+            return jsonify({'error': 'No selected file'}), 400
         
-        print(f"OCR completed with {len(result)} text regions detected")
+        options = get_ocr_options(request.form)
+        data = file.read()
         
-        # Format the results based on whether layout preservation is enabled
-        if preserve_layout and len(result) > 1:
-            # Improved spatial analysis for better layout preservation
-            
-            # Sort boxes by vertical position (top to bottom)
-            boxes_with_positions = []
-            for box in result:
-                # Each box contains coordinates: [[top-left, top-right, bottom-right, bottom-left], text, confidence]
-                if len(box) >= 2:
-                    # Get the bounding box center Y position and height
-                    top_y = min(point[1] for point in box[0])
-                    bottom_y = max(point[1] for point in box[0])
-                    height = bottom_y - top_y
-                    center_y = top_y + height/2
-                    left_x = min(point[0] for point in box[0])
-                    
-                    boxes_with_positions.append({
-                        'box': box,
-                        'top': top_y,
-                        'bottom': bottom_y,
-                        'center_y': center_y,
-                        'height': height,
-                        'left': left_x,
-                        'text': box[1]
-                    })
-            
-            # Sort boxes by top Y position
-            sorted_boxes = sorted(boxes_with_positions, key=lambda x: x['top'])
-            
-            # Group boxes into lines based on overlap
-            lines = []
-            current_line = [sorted_boxes[0]]
-            line_bottom = sorted_boxes[0]['bottom']
-            
-            for i in range(1, len(sorted_boxes)):
-                current_box = sorted_boxes[i]
-                # If this box's top is above the previous line's bottom or they overlap significantly,
-                # add it to the current line
-                vertical_overlap = min(line_bottom, current_box['bottom']) - current_box['top']
-                overlap_ratio = vertical_overlap / current_box['height'] if current_box['height'] > 0 else 0
-                
-                if overlap_ratio > 0.25:  # They belong to the same line if 25% overlap
-                    current_line.append(current_box)
-                    line_bottom = max(line_bottom, current_box['bottom'])
-                else:
-                    # Start a new line
-                    lines.append(current_line)
-                    current_line = [current_box]
-                    line_bottom = current_box['bottom']
-            
-            # Add the last line
-            if current_line:
-                lines.append(current_line)
-            
-            # For each line, sort elements from left to right and join with spaces
-            text_lines = []
-            for line in lines:
-                # Sort by left x-coordinate
-                sorted_line = sorted(line, key=lambda x: x['left'])
-                
-                # Calculate average character width to determine spacing
-                avg_char_width = 0
-                total_width = 0
-                total_chars = 0
-                
-                for box in sorted_line:
-                    width = max(p[0] for p in box['box'][0]) - min(p[0] for p in box['box'][0])
-                    chars = len(box['text'])
-                    if chars > 0:
-                        total_width += width
-                        total_chars += chars
-                
-                if total_chars > 0:
-                    avg_char_width = total_width / total_chars
-                
-                # Join text with appropriate spacing
-                line_text = ""
-                last_right = 0
-                
-                for i, box in enumerate(sorted_line):
-                    if i > 0:
-                        # Calculate gap between this box and previous one
-                        left = min(p[0] for p in box['box'][0])
-                        gap = left - last_right
-                        
-                        # Add spaces based on gap size
-                        spaces = int(gap / (avg_char_width * 0.7)) if avg_char_width > 0 else 1
-                        line_text += " " * max(1, min(spaces, 8))  # Limit to reasonable number
-                    
-                    line_text += box['text']
-                    last_right = max(p[0] for p in box['box'][0])
-                
-                text_lines.append(line_text)
-            
-            # Join lines with newlines, preserving paragraph structure
-            text = "\n".join(text_lines)
-            
-            # Preserve multiple newlines for paragraph separation
-            text = re.sub(r'\n{3,}', '\n\n', text)
-            
-        elif paragraph:
-            # In paragraph mode, join the text blocks with spaces
-            text = " ".join([block[1] for block in result])
+        # Reject oversized images now rather than failing the job later
+        check_image_limits(data)
+        
+        job_id = job_queue.submit(data, options)
+        print(f"Queued OCR job {job_id}: lang={options['lang']}, quality={options['quality']}")
+        
+        response = jsonify(job_queue.get(job_id))
+        response.headers['Location'] = f'/ocr/jobs/{job_id}'
+        return response, 202
+    
+    except RequestEntityTooLarge:
+        return request_too_large(None)
+    except ImageTooLargeError as e:
+        return jsonify({'error': str(e)}), 413
+    except QueueFullError as e:
+        return queue_full(e)
+    except Exception as e:
+        print(f"Error submitting OCR job: {str(e)}")
+        print(traceback.format_exc())
+        return jsonify({'error': str(e)}), 500
+
+@app.route('/ocr/jobs/<job_id>', methods=['GET'])
+def get_ocr_job(job_id):
+    """Return the status of a job, and its result once finished."""
+    job = job_queue.get(job_id)
+    if job is None:
+        return jsonify({'error': 'Job not found'}), 404
+    return jsonify(job)
+
+@app.route('/ocr/jobs/<job_id>', methods=['DELETE'])
+@app.route('/ocr/jobs/<job_id>/cancel', methods=['POST'])
+def cancel_ocr_job(job_id):
+    """Cancel a job that has not started yet."""
+    job = job_queue.cancel(job_id)
+    if job is None:
+        return jsonify({'error': 'Job not found'}), 404
+    if job['status'] != 'cancelled':
+        return jsonify(dict(job, error=f"Job is already {job['status']}")), 409
+    return jsonify(job)
+
+def parse_region_boxes(boxes, shape, scale=1.0):
+    """Split client polygons into EasyOCR's horizontal [x_min, x_max, y_min, y_max] and free four-point lists.
+    
+    Polygons are in the coordinates /ocr reported and are multiplied by scale to land on the stored image.
+    """
+    height, width = shape[:2]
+    horizontal_list = []
+    free_list = []
+    for box in boxes:
+        points = [(min(max(int(round(x * scale)), 0), width), min(max(int(round(y * scale)), 0), height))
+                  for x, y in box]
+        if len(points) != 4:
+            raise ValueError('Each box must have four [x, y] points')
+        xs = sorted(set(x for x, _ in points))
+        ys = sorted(set(y for _, y in points))
+        if len(xs) <= 2 and len(ys) <= 2:
+            # Axis-aligned boxes take the horizontal path, which crops without warping
+            horizontal_list.append([xs[0], xs[-1], ys[0], ys[-1]])
         else:
-            # In non-paragraph mode, add spaces and line breaks
-            text = ""
-            for detection in result:
-                text += detection[1] + " "
-                if detection[1].endswith(('.', '?', '!')):
-                    text += "\n"
-        
-        # Calculate average confidence - safely handle different result structures
+            free_list.append([list(point) for point in points])
+    return horizontal_list, free_list
+
+@app.route('/ocr/images/<image_id>/recognize', methods=['POST'])
+def recognize_image_regions(image_id):
+    """Re-run recognition only on chosen regions of an image kept by /ocr with keep_regions=true."""
+    try:
+        entry = image_store.get(image_id)
+        if entry is None:
+            return jsonify({'error': 'Image not found or expired'}), 404
+        
+        data = request.get_json(silent=True) or {}
+        options = dict(entry.options)
+        options['lang'] = data.get('language', options['lang'])
+        options['quality'] = data.get('quality', options['quality'])
+        options['preserve_layout'] = bool(data.get('preserve_layout', options['preserve_layout']))
+        
+        # Regions are picked by their index in the detections list and/or given as new polygons
+        detected = entry.horizontal_list + entry.free_list
+        horizontal_list = []
+        free_list = []
+        for region_id in data.get('regions', []):
+            if not isinstance(region_id, int) or not 0 <= region_id < len(detected):
+                return jsonify({'error': f'Unknown region id {region_id}'}), 400
+            if region_id < len(entry.horizontal_list):
+                horizontal_list.append(entry.horizontal_list[region_id])
+            else:
+                free_list.append(entry.free_list[region_id - len(entry.horizontal_list)])
         try:
-            # Try to extract confidence scores if they exist
-            confidences = []
-            for box in result:
-                if len(box) > 2 and box[2] is not None:  # Check if confidence exists
-                    confidences.append(box[2])
-            
-            # Calculate average confidence if we have valid scores
-            confidence = sum(confidences) / len(confidences) if confidences else 0.5
-            print(f"Calculated confidence: {confidence}")
-        except Exception as e:
-            # Fallback to a medium confidence if calculation fails
-            print(f"Warning: Could not calculate confidence: {str(e)}")
-            confidence = 0.5
+            extra_horizontal, extra_free = parse_region_boxes(data.get('boxes', []), entry.image.shape, entry.scale)
+        except (TypeError, ValueError) as e:
+            return jsonify({'error': f'Invalid boxes: {str(e)}'}), 400
+        horizontal_list += extra_horizontal
+        free_list += extra_free
+        if not horizontal_list and not free_list:
+            return jsonify({'error': 'No regions or boxes given'}), 400
+        try:
+            fmt = response_format()
+        except ValueError as e:
+            return jsonify({'error': str(e)}), 400
         
-        # Clean up
-        if os.path.exists(temp_filepath):
-            os.remove(temp_filepath)
+        print(f"Region OCR request {image_id}: {len(horizontal_list) + len(free_list)} regions, lang={options['lang']}, quality={options['quality']}")
         
-        return jsonify({
-            'text': text.strip(),
-            'confidence': confidence,
-            'words': len(result),
-            'engine': 'easyocr',
-            'quality': quality
-        })
+        body = get_executor().run(recognize_regions, entry.image, horizontal_list, free_list, options, entry.scale)
+        body['image_id'] = image_id
+        return ocr_response(body, fmt)
     
+    except QueueFullError as e:
+        return queue_full(e)
     except Exception as e:
-        # Print detailed error information
-        print(f"Error during OCR processing: {str(e)}")
+        print(f"Error during region OCR: {str(e)}")
         print(traceback.format_exc())
+        return jsonify({'error': str(e)}), 500
+
+@app.route('/ocr/images/<image_id>', methods=['DELETE'])
+def delete_ocr_image(image_id):
+    """Release an image kept for region recognition before it expires."""
+    if not image_store.delete(image_id):
+        return jsonify({'error': 'Image not found or expired'}), 404
+    return jsonify({'image_id': image_id, 'deleted': True})
+
+def read_batch_uploads(files):
+    """Expand uploaded files (images or zip archives of images) into (filename, bytes) pairs."""
+    uploads = []
+    for file in files:
+        if file.filename == '':
+            continue
+        data = file.read()
+        if zipfile.is_zipfile(io.BytesIO(data)):
+            with zipfile.ZipFile(io.BytesIO(data)) as archive:
+                for info in sorted(archive.infolist(), key=lambda i: i.filename):
+                    if info.is_dir():
+                        continue
+                    # Check the declared size so a zip bomb is never inflated
+                    if info.file_size > MAX_UPLOAD_BYTES:
+                        raise ImageTooLargeError(f'{info.filename} exceeds maximum upload size of {MAX_UPLOAD_BYTES} bytes')
+                    uploads.append((info.filename, archive.read(info)))
+        else:
+            uploads.append((file.filename, data))
+    return uploads
+
+@app.route('/ocr/batch', methods=['POST'])
+def perform_ocr_batch():
+    """Run many images through OCR, grouping them so each reader is used for one batched pass."""
+    try:
+        start_time = time.time()
+        files = request.files.getlist('files') or request.files.getlist('file')
+        if not files:
+            return jsonify({'error': 'No file part'}), 400
+        
+        # Optional per-image overrides, a JSON list aligned with the uploaded images
+        try:
+            overrides = json.loads(request.form.get('options', '[]'))
+        except ValueError:
+            return jsonify({'error': 'options must be valid JSON'}), 400
+        if not isinstance(overrides, list) or not all(item is None or isinstance(item, dict) for item in overrides):
+            return jsonify({'error': 'options must be a JSON list of objects, one per image'}), 400
+        
+        uploads = read_batch_uploads(files)
+        if not uploads:
+            return jsonify({'error': 'No selected file'}), 400
+        if len(uploads) > OCR_BATCH_MAX_IMAGES:
+            return jsonify({'error': f'Too many images in batch (max {OCR_BATCH_MAX_IMAGES})'}), 400
+        try:
+            fmt = response_format()
+        except ValueError as e:
+            return jsonify({'error': str(e)}), 400
+        
+        print(f"Batch OCR request: {len(uploads)} images")
+        
+        responses = [None] * len(uploads)
+        cache_keys = [None] * len(uploads)
+        cache_hits = 0
+        groups = {}
+        for index, (filename, data) in enumerate(uploads):
+            try:
+                options = get_ocr_options(request.form, overrides[index] if index < len(overrides) else None)
+            except (TypeError, ValueError) as e:
+                return jsonify({'error': f'Invalid options for image {index}: {str(e)}'}), 400
+            
+            if result_cache.enabled:
+                cache_keys[index] = get_cache_key(data, options)
+                cached = result_cache.get(cache_keys[index])
+                if cached is not None:
+                    cached['filename'] = filename
+                    responses[index] = cached
+                    cache_hits += 1
+                    continue
+            
+            key = (options['lang'], options['quality'], tuple(options['preprocessing']), options['tiled'], options['dpi'])
+            groups.setdefault(key, []).append((index, options))
+        
+        # Each group shares one reader; groups run in parallel when worker processes are available
+        members = list(groups.values())
+        group_results = get_executor().run_many(process_image_group, [
+            ([uploads[index][1] for index, _ in group], [options for _, options in group])
+            for group in members
+        ])
         
-        # Clean up on error
-        if temp_filepath and os.path.exists(temp_filepath):
-            os.remove(temp_filepath)
+        for group, results in zip(members, group_results):
+            for (index, _), response in zip(group, results):
+                record_text_gate(response)
+                if 'error' not in response and cache_keys[index] is not None:
+                    result_cache.put(cache_keys[index], response)
+                responses[index] = dict(response, filename=uploads[index][0])
         
+        elapsed = time.time() - start_time
+        
+        response = ocr_response({
+            'results': responses,
+            'images': len(uploads),
+            'cache_hits': cache_hits,
+            'elapsed': round(elapsed, 3),
+            'images_per_second': round(len(uploads) / elapsed, 2) if elapsed > 0 else None
+        }, fmt)
+        if not result_cache.enabled:
+            cache_status = 'disabled'
+        else:
+            cache_status = 'hit' if cache_hits == len(uploads) else 'miss'
+        # Labelled with the request-level language and quality; per-image overrides may differ
+        defaults = get_ocr_options(request.form)
+        ocr_request_seconds.observe(time.time() - start_time, endpoint='batch', language=defaults['lang'],
+                                    quality=defaults['quality'], cache=cache_status)
+        return response
+    
+    except RequestEntityTooLarge:
+        return request_too_large(None)
+    except ImageTooLargeError as e:
+        return jsonify({'error': str(e)}), 413
+    except QueueFullError as e:
+        return queue_full(e)
+    except Exception as e:
+        print(f"Error during batch OCR processing: {str(e)}")
+        print(traceback.format_exc())
         return jsonify({'error': str(e)}), 500
 
+@app.errorhandler(413)
+def request_too_large(e):
+    return jsonify({'error': f'Request exceeds maximum size of {app.config["MAX_CONTENT_LENGTH"]} bytes'}), 413
+
+def queue_full(e):
+    response = jsonify({'error': str(e)})
+    response.headers['Retry-After'] = str(e.retry_after)
+    return response, 503
+
 @app.route('/health', methods=['GET'])
 def health_check():
     return jsonify({
         'status': 'healthy', 
         'version': '1.0.0',
-        'gpu_available': os.environ.get('USE_GPU', '0').lower() in ('true', '1', 't')
+        'gpu_available': os.environ.get('USE_GPU', '0').lower() in ('true', '1', 't'),
+        'result_cache': result_cache.stats(),
+        'executor': get_executor().stats(),
+        'jobs': job_queue.stats(),
+        'region_images': image_store.stats()
     })
 
 @app.route('/info', methods=['GET'])
@@ -328,21 +663,86 @@ def server_info():
             'kor': 'Korean',
             'rus': 'Russian'
         },
-        'preprocessing_options': ['grayscale', 'contrast', 'sharpen'],
+        'preprocessing_options': list(PREPROCESSING_STEPS),
         'quality_options': ['fast', 'standard', 'best'],
+        'text_gate_options': ['off'] + list(GATE_METHODS),
+        'text_gate_default': TEXT_GATE_DEFAULT,
+        'autoscale_default': AUTOSCALE_DEFAULT,
+        'response_formats': [fmt for fmt in RESPONSE_FORMATS if fmt != 'msgpack' or MSGPACK_AVAILABLE],
+        'reader_pool': reader_pool_stats(),
+        'executor': get_executor().stats(),
+        'ocr_backend': OCR_BACKEND,
+        'onnx_available': ONNX_AVAILABLE,
         'version': '1.0.0'
     })
 
+@app.after_request
+def count_request(response):
+    http_requests_total.inc(endpoint=request.endpoint or 'unknown', status=response.status_code)
+    return response
+
+@app.after_request
+def compress(response):
+    """Gzip buffered JSON, MessagePack and text responses for clients that send Accept-Encoding: gzip."""
+    return compress_response(response, request.accept_encodings)
+
+def reader_pool_stats():
+    """Reader pool stats where the readers live: the workers' latest snapshots in process mode, else this process."""
+    executor = get_executor()
+    if executor.pool is not None:
+        return executor.reader_pool_stats()
+    return reader_pool.stats()
+
+metrics_registry.gauge('ocr_queue_depth', 'OCR requests admitted to the executor and not yet finished',
+                       lambda: get_executor().stats()['pending'])
+metrics_registry.gauge('ocr_queue_capacity', 'Maximum pending OCR requests before 503s',
+                       lambda: get_executor().stats()['max_pending'])
+metrics_registry.gauge('ocr_jobs_queued', 'Background OCR jobs waiting to run', lambda: job_queue.stats()['queued'])
+metrics_registry.gauge('ocr_reader_pool_size', 'EasyOCR readers loaded across OCR processes',
+                       lambda: reader_pool_stats()['readers'])
+metrics_registry.gauge('ocr_reader_pool_bytes', 'Estimated memory held by loaded readers',
+                       lambda: reader_pool_stats()['bytes'])
+metrics_registry.gauge('ocr_result_cache_hit_rate', 'OCR result cache hit rate',
+                       lambda: result_cache.stats()['hit_rate'])
+
+@app.route('/metrics', methods=['GET'])
+def metrics():
+    """Prometheus text exposition of latency histograms, queue depth and pool sizes."""
+    return Response(metrics_registry.render(), mimetype='text/plain; version=0.0.4')
+
+def record_chat_metrics(metadata, elapsed):
+    """Record chat latency and token usage reported by ClaudeService."""
+    if not metadata or 'error' in metadata:
+        return
+    # Cache hits are timed separately and cost no tokens
+    source = 'cache' if metadata.get('cache') else metadata.get('source', 'unknown')
+    chat_latency_seconds.observe(elapsed, source=source, model=metadata.get('model', ''))
+    if metadata.get('time_to_first_token') is not None:
+        chat_first_token_seconds.observe(metadata['time_to_first_token'], source=source, model=metadata.get('model', ''))
+    usage = {} if source == 'cache' else metadata.get('usage') or {}
+    for direction in ('input', 'output'):
+        tokens = usage.get(f'{direction}_tokens')
+        if tokens:
+            chat_tokens_total.inc(tokens, source=source, direction=direction)
+
 # Chat-related endpoints
 @app.route('/chat/health', methods=['GET'])
 def chat_health():
     """Check the status of the chat service"""
     api_available = claude_service.init_api_client(CLAUDE_API_KEY)
-    local_available = claude_service.load_local_model() if not claude_service.model_loaded else True
+    # Never load the model inside the request; start a background load and report its state
+    local_state = claude_service.start_loading_local_model()
+    local_available = local_state in ('not_loaded', 'loading', 'ready')
     
     return jsonify({
         'api_available': api_available,
         'local_available': local_available,
+        'local_state': local_state,
+        'local_error': claude_service.model_error,
+        'api_clients': claude_service.clients.stats(),
+        'local_sessions': claude_service.sessions.stats(),
+        'local_generation': claude_service.local_generation_stats(),
+        'response_cache': claude_service.response_cache.stats(),
         'status': 'healthy' if api_available or local_available else 'degraded'
     })
 
@@ -350,20 +750,21 @@ def chat_health():
 def chat_message():
     """Process a chat message and return a response"""
     try:
-        data = request.json
+        data = request.get_json(silent=True)
         if not data:
             return jsonify({'error': 'No data provided'}), 400
             
         messages = data.get('messages', [])
         api_key = data.get('api_key')
         use_local = data.get('use_local', False)
+        conversation_id = data.get('conversation_id')  # Lets the local model reuse this chat's KV cache
+        use_cache = data.get('cache', True)  # Set to false to always generate a fresh response
         
-        # If API key is provided in the request, initialize the client with it
-        if api_key and not use_local:
-            claude_service.init_api_client(api_key)
-        
-        # Generate response
-        response, metadata = claude_service.generate_response(messages, use_local=use_local)
+        # A key in the request selects (or creates) its cached client; otherwise the server key is used
+        start_time = time.time()
+        response, metadata = claude_service.generate_response(messages, use_local=use_local, api_key=api_key,
+                                                              conversation_id=conversation_id, use_cache=use_cache)
+        record_chat_metrics(metadata, time.time() - start_time)
         
         return jsonify({
             'message': response,
@@ -375,9 +776,45 @@ def chat_message():
         print(traceback.format_exc())
         return jsonify({'error': str(e)}), 500
 
+@app.route('/chat/stream', methods=['POST'])
+def chat_stream():
+    """Stream a chat response as Server-Sent Events: 'token' events, then 'done' with the message and metadata."""
+    data = request.get_json(silent=True)
+    if not data:
+        return jsonify({'error': 'No data provided'}), 400
+    
+    messages = data.get('messages', [])
+    api_key = data.get('api_key')
+    use_local = data.get('use_local', False)
+    conversation_id = data.get('conversation_id')
+    use_cache = data.get('cache', True)
+    
+    def generate():
+        start_time = time.time()
+        try:
+            for event, payload in claude_service.stream_response(messages, use_local=use_local, api_key=api_key,
+                                                                 conversation_id=conversation_id, use_cache=use_cache):
+                if event == 'token':
+                    yield format_sse('token', {'text': payload})
+                elif event == 'done':
+                    response, metadata = payload
+                    record_chat_metrics(metadata, time.time() - start_time)
+                    yield format_sse('done', {'message': response, 'metadata': metadata})
+                else:
+                    yield format_sse('error', {'error': payload})
+        except Exception as e:
+            print(f"Error in chat stream endpoint: {str(e)}")
+            print(traceback.format_exc())
+            yield format_sse('error', {'error': str(e)})
+    
+    response = Response(stream_with_context(generate()), mimetype='text/event-stream')
+    response.headers['Cache-Control'] = 'no-cache'
+    response.headers['X-Accel-Buffering'] = 'no'
+    return response
+
 if __name__ == '__main__':
     # Create needed directories
-    for directory in ['temp', 'models']:
+    for directory in ['models']:
         if not os.path.exists(directory):
             os.makedirs(directory)
             print(f"Created directory: {directory}")
@@ -393,4 +830,29 @@ if __name__ == '__main__':
     import sys
     sys.stdout.flush()
     
-    app.run(debug=True, host='0.0.0.0', port=port)
+    # Resume jobs persisted before a restart now instead of on the first job request; worker processes
+    # import this module too, so only the serving process starts the job threads
+    if SERVER_MODE == 'production' or os.environ.get('WERKZEUG_RUN_MAIN') == 'true':
+        job_queue.start()
+    
+    # Warm the local chat model in the background so the first local message does not wait for it
+    if os.environ.get('LOCAL_MODEL_PRELOAD', '0').lower() in ('true', '1', 't'):
+        if SERVER_MODE == 'production' or os.environ.get('WERKZEUG_RUN_MAIN') == 'true':
+            claude_service.start_loading_local_model()
+    
+    if SERVER_MODE == 'production':
+        # Production: waitress handles HTTP on threads while OCR runs on the worker pool
+        from waitress import serve
+        
+        ocr_executor = get_executor()
+        print(f"OCR executor: {ocr_executor.stats()}")
+        if ocr_executor.pool is None:
+            preload_readers()
+        
+        serve(app, host='0.0.0.0', port=port, threads=int(os.environ.get('HTTP_THREADS', 16)))
+    else:
+        # Skip the warm-up in the reloader's watcher process; only the serving child needs readers
+        if os.environ.get('WERKZEUG_RUN_MAIN') == 'true':
+            preload_readers()
+        
+        app.run(debug=True, host='0.0.0.0', port=port)
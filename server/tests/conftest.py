@@ -0,0 +1,121 @@
+import os
+import sys
+
+# The server modules import each other as top-level modules, the way app.py runs them
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import cv2
+import numpy as np
+import pytest
+
+# Horizontal boxes ([x_min, x_max, y_min, y_max]) the fake reader detects: two words on one line and one below
+FAKE_BOXES = [[10, 60, 10, 30], [80, 150, 12, 30], [10, 90, 50, 70]]
+
+
+class FakeReader:
+    """Stands in for easyocr.Reader: detects fixed boxes and reads each one as w<x>_<y> (f<x>_<y> when free).
+
+    Like EasyOCR on the CPU, recognize returns horizontal boxes before free ones.
+    """
+
+    def __init__(self, boxes=FAKE_BOXES, free_boxes=()):
+        self.boxes = boxes
+        self.free_boxes = free_boxes
+        self.calls = []
+
+    def detect(self, img, **kwargs):
+        self.calls.append('detect')
+        return [list(self.boxes)], [list(self.free_boxes)]
+
+    def recognize(self, img, horizontal_list, free_list, paragraph=False, detail=1, **kwargs):
+        from easyocr.utils import get_paragraph
+        self.calls.append('recognize')
+        result = [([[x0, y0], [x1, y0], [x1, y1], [x0, y1]], f'w{x0}_{y0}', 0.9)
+                  for x0, x1, y0, y1 in horizontal_list]
+        result += [(box, f'f{box[0][0]}_{box[0][1]}', 0.8) for box in free_list]
+        if paragraph:
+            result = get_paragraph(result)
+        if detail == 0:
+            result = [region[1] for region in result]
+        return result
+
+    def readtext(self, img, paragraph=False, detail=1, **kwargs):
+        self.calls.append('readtext')
+        return self.recognize(img, list(self.boxes), list(self.free_boxes), paragraph=paragraph, detail=detail)
+
+    def readtext_batched(self, images, paragraph=False, detail=1, **kwargs):
+        return [self.readtext(img, paragraph=paragraph, detail=detail) for img in images]
+
+
+@pytest.fixture
+def fake_reader(monkeypatch):
+    pytest.importorskip('easyocr')
+    import ocr_engine
+    reader = FakeReader()
+    monkeypatch.setattr(ocr_engine, 'get_reader', lambda *args, **kwargs: reader)
+    return reader
+
+
+@pytest.fixture
+def app_module(monkeypatch, fake_reader):
+    """The Flask server module with a fresh result cache and the fake reader."""
+    import server
+    from result_cache import create_result_cache
+    monkeypatch.setattr(server, 'result_cache', create_result_cache())
+    return server
+
+
+@pytest.fixture
+def client(app_module):
+    return app_module.app.test_client()
+
+
+def encode_png(img):
+    ok, encoded = cv2.imencode('.png', img)
+    assert ok
+    return encoded.tobytes()
+
+
+@pytest.fixture
+def page_png():
+    return encode_png(np.full((120, 200, 3), 255, dtype=np.uint8))
+
+
+class CharTokenizer:
+    """Character-level tokenizer for the tiny local model; pads on the left like decoder-only chat models."""
+
+    pad_token_id = 0
+    eos_token_id = 2
+
+    def encode(self, text):
+        return [1] + [3 + ord(char) % 61 for char in text]
+
+    def __call__(self, text, return_tensors='pt', padding=False):
+        import torch
+        rows = [self.encode(item) for item in ([text] if isinstance(text, str) else text)]
+        width = max(len(row) for row in rows)
+        input_ids = [[self.pad_token_id] * (width - len(row)) + row for row in rows]
+        attention_mask = [[0] * (width - len(row)) + [1] * len(row) for row in rows]
+        return {'input_ids': torch.tensor(input_ids), 'attention_mask': torch.tensor(attention_mask)}
+
+    def decode(self, ids, skip_special_tokens=False):
+        return ''.join(chr(ord('a') + (int(token) - 3) % 26) for token in ids if int(token) > 2)
+
+
+@pytest.fixture
+def local_service(monkeypatch):
+    """A ClaudeService whose local model is a tiny randomly initialized Llama with greedy decoding."""
+    torch = pytest.importorskip('torch')
+    transformers = pytest.importorskip('transformers')
+    import claude_service
+    torch.manual_seed(0)
+    config = transformers.LlamaConfig(vocab_size=64, hidden_size=16, intermediate_size=32, num_hidden_layers=2,
+                                      num_attention_heads=2, num_key_value_heads=2, max_position_embeddings=1024,
+                                      pad_token_id=0, bos_token_id=1, eos_token_id=2)
+    monkeypatch.setattr(claude_service, 'LOCAL_GENERATION_ARGS', {'max_new_tokens': 6, 'do_sample': False})
+    service = claude_service.ClaudeService()
+    service.local_model = transformers.LlamaForCausalLM(config).eval()
+    service.local_tokenizer = CharTokenizer()
+    service.model_loaded = True
+    service.model_state = claude_service.MODEL_READY
+    return service
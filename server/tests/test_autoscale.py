@@ -0,0 +1,40 @@
+import io
+import numpy as np
+import autoscale
+from autoscale import autoscale_image, choose_scale, unscale_box, unscale_result
+
+
+def test_choose_scale_leaves_text_near_the_target_alone():
+    assert choose_scale(None, (600, 800), 'standard') == 1.0
+    assert choose_scale(22, (600, 800), 'standard') == 1.0
+    assert choose_scale(12, (600, 800), 'standard') == 2.0
+    assert choose_scale(4, (600, 800), 'standard') == autoscale.AUTOSCALE_MAX_UPSCALE
+
+
+def test_autoscale_returns_the_exact_factor(monkeypatch):
+    monkeypatch.setattr(autoscale, 'estimate_text_height', lambda img: 17.0)
+    img = np.full((300, 400, 3), 255, dtype=np.uint8)
+    scaled, scale, info = autoscale_image(img, 'standard')
+    assert scale == 24 / 17.0
+    assert info == {'text_height': 17.0, 'scale': round(24 / 17.0, 3)}
+    assert scaled.shape[:2] == (round(300 * scale), round(400 * scale))
+
+
+def test_unscale_result_keeps_bare_strings():
+    assert unscale_result(['text'], 2.0) == ['text']
+    assert unscale_result([([[10, 20]], 'a', 0.9)], 2.0) == [[[[5, 10]], 'a', 0.9]]
+    assert unscale_box([[30, 60]], 1 / 3) == [[90, 180]]
+
+
+def test_ocr_boxes_are_unscaled_with_the_exact_factor(client, fake_reader, page_png, monkeypatch):
+    import ocr_engine
+    fake_reader.boxes = [[1000, 1200, 300, 330]]
+    third = 1 / 3
+    monkeypatch.setattr(ocr_engine, 'autoscale_image',
+                        lambda img, quality: (img, third, {'text_height': 72.0, 'scale': round(third, 3)}))
+    response = client.post('/ocr', data={'file': (io.BytesIO(page_png), 'page.png'), 'autoscale': 'true',
+                                         'structured': 'true'}, content_type='multipart/form-data')
+    body = response.get_json()
+    assert body['autoscale']['scale'] == 0.333
+    # Dividing by the rounded 0.333 would put the box at x=3003
+    assert body['regions'][0]['box'][0] == [3000, 900]
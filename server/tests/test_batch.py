@@ -0,0 +1,56 @@
+import io
+import json
+import zipfile
+import cv2
+import numpy as np
+import pytest
+
+
+def post_batch(client, files, **form):
+    form['files'] = [(io.BytesIO(data), name) for name, data in files]
+    return client.post('/ocr/batch', data=form, content_type='multipart/form-data')
+
+
+def test_batch_keeps_upload_order_and_caches(client, fake_reader, page_png):
+    wide = cv2.imencode('.png', np.full((100, 300, 3), 255, dtype=np.uint8))[1].tobytes()
+    archive = io.BytesIO()
+    with zipfile.ZipFile(archive, 'w') as zf:
+        zf.writestr('b.png', page_png)
+        zf.writestr('a.png', wide)
+    response = post_batch(client, [('first.png', page_png), ('pages.zip', archive.getvalue())])
+    assert response.status_code == 200
+    body = response.get_json()
+    assert body['images'] == 3 and body['cache_hits'] == 0
+    # Zip members are read in name order after the files before them
+    assert [result['filename'] for result in body['results']] == ['first.png', 'a.png', 'b.png']
+    # Standard quality groups the fake reader's three regions into two paragraphs
+    assert all(result['words'] == 2 for result in body['results'])
+
+    again = post_batch(client, [('first.png', page_png)]).get_json()
+    assert again['cache_hits'] == 1 and again['results'][0]['filename'] == 'first.png'
+
+
+def test_batch_applies_per_image_overrides(client, page_png):
+    response = post_batch(client, [('one.png', page_png), ('two.png', page_png)],
+                          options=json.dumps([{'quality': 'fast'}, {'structured': True}]))
+    first, second = response.get_json()['results']
+    assert first['quality'] == 'fast' and 'regions' not in first
+    assert second['quality'] == 'standard' and len(second['regions']) == 3
+
+
+def test_batch_reports_undecodable_images(client, page_png):
+    first, second = post_batch(client, [('ok.png', page_png), ('bad.png', b'not an image')]).get_json()['results']
+    assert first['words'] == 2
+    assert 'error' in second and second['filename'] == 'bad.png'
+
+
+def test_batch_limit(client, app_module, page_png, monkeypatch):
+    monkeypatch.setattr(app_module, 'OCR_BATCH_MAX_IMAGES', 1)
+    assert post_batch(client, [('a.png', page_png), ('b.png', page_png)]).status_code == 400
+
+
+@pytest.mark.parametrize('options', ['{not json', '{"quality": "fast"}', '["fast"]', '[{"dpi": "high"}]'])
+def test_batch_rejects_invalid_options(client, page_png, options):
+    response = post_batch(client, [('one.png', page_png)], options=options)
+    assert response.status_code == 400
+    assert 'error' in response.get_json()
@@ -0,0 +1,47 @@
+from chat_cache import ChatResponseCache
+
+
+def question(text, history=()):
+    return list(history) + [{'role': 'user', 'content': text}]
+
+
+def test_exact_tier_normalizes_whitespace():
+    cache = ChatResponseCache(max_entries=4)
+    cache.put('model', question('What is  OCR?'), 'Reading text.', {'source': 'api'})
+    response, metadata = cache.get('model', question(' What is OCR? '))
+    assert response == 'Reading text.' and metadata['cache'] == 'exact'
+    assert cache.get('other-model', question('What is OCR?')) is None
+
+
+def test_errors_are_not_cached():
+    cache = ChatResponseCache(max_entries=4)
+    cache.put('model', question('hi'), 'Error', {'error': 'timeout'})
+    cache.put('model', question('hello'), 'Error', {})
+    assert cache.stats()['entries'] == 0
+
+
+class StubApiService:
+    """Counts API calls instead of making them."""
+
+    def __init__(self, service):
+        self.calls = []
+        service.generate_response_api = self.generate
+
+    def generate(self, messages, api_key=None):
+        self.calls.append(api_key)
+        return f'answer for {api_key}', {'source': 'api'}
+
+
+def test_api_responses_are_scoped_to_the_key():
+    from claude_service import ClaudeService
+    service = ClaudeService()
+    service.response_cache = ChatResponseCache(max_entries=8)
+    api = StubApiService(service)
+    messages = question('Summarize the document')
+
+    assert service.generate_response(messages, api_key='key-a')[0] == 'answer for key-a'
+    assert service.generate_response(messages, api_key='key-a')[1]['cache'] == 'exact'
+    assert service.generate_response(messages, api_key='key-b')[0] == 'answer for key-b'
+    # Without any key there is nothing to serve from the cache
+    assert service.generate_response(messages)[0] == 'answer for None'
+    assert api.calls == ['key-a', 'key-b', None]
@@ -0,0 +1,62 @@
+from chat_sessions import SessionCache, common_prefix_length
+
+
+class FakeCache:
+    """Stands in for a transformers cache: only its length matters here, and it holds no tensors."""
+
+    layers = []
+
+    def __init__(self, length):
+        self.length = length
+
+    def get_seq_length(self):
+        return self.length
+
+    def crop(self, max_length):
+        self.length = max_length if max_length >= 0 else self.length + max_length
+
+
+def test_common_prefix_length():
+    assert common_prefix_length([1, 2, 3], [1, 2, 4]) == 2
+    assert common_prefix_length([1, 2], [1, 2, 3]) == 2
+    assert common_prefix_length([], [1]) == 0
+
+
+def test_session_cache_evicts_least_recently_used():
+    sessions = SessionCache(max_sessions=2)
+    for name in ('a', 'b', 'c'):
+        sessions.store(name, [1], FakeCache(1))
+    assert sessions.take('a') is None
+    assert sessions.take('b') is not None
+    # Taking a cache hands it to one request; the next turn stores it again
+    assert sessions.take('b') is None
+    stats = sessions.stats()
+    assert stats['evictions'] == 1 and stats['hits'] == 1 and stats['misses'] == 2
+
+
+def test_take_crops_to_the_shared_prefix(local_service):
+    local_service.sessions.store('chat', [1, 5, 6, 7, 8], FakeCache(5))
+    cache, reused = local_service.take_session_cache('chat', [1, 5, 6, 9, 10, 11])
+    assert reused == 3 and cache.get_seq_length() == 3
+
+    # At least one prompt token is always prefilled
+    local_service.sessions.store('chat', [1, 5, 6], FakeCache(3))
+    cache, reused = local_service.take_session_cache('chat', [1, 5, 6])
+    assert reused == 2 and cache.get_seq_length() == 2
+
+    local_service.sessions.store('chat', [1, 5], FakeCache(2))
+    assert local_service.take_session_cache('chat', [4, 5]) == (None, 0)
+
+
+def test_next_turn_reuses_the_kv_cache(local_service):
+    first = [{'role': 'user', 'content': 'hello there'}]
+    reply, metadata = local_service.generate_local_single(first, 'chat')
+    assert metadata['cached_tokens'] == 0
+
+    second = first + [{'role': 'assistant', 'content': reply}, {'role': 'user', 'content': 'and again'}]
+    reused_reply, metadata = local_service.generate_local_single(second, 'chat')
+    assert metadata['cached_tokens'] > len(local_service.format_local_prompt(first)) // 2
+    fresh_reply, fresh = local_service.generate_local_single(second, None)
+    assert reused_reply == fresh_reply
+    assert fresh['cached_tokens'] == 0
+    assert local_service.sessions.stats()['reused_tokens'] == metadata['cached_tokens']
@@ -0,0 +1,115 @@
+import json
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+import pytest
+
+
+def sse(event, data):
+    return f'event: {event}\ndata: {json.dumps(data)}\n\n'
+
+
+def messages_stream(words):
+    """A Messages API streaming body that sends each word as its own text delta."""
+    message = {'id': 'msg_1', 'type': 'message', 'role': 'assistant', 'model': 'stub', 'content': [],
+               'stop_reason': None, 'stop_sequence': None, 'usage': {'input_tokens': 7, 'output_tokens': 0}}
+    body = sse('message_start', {'type': 'message_start', 'message': message})
+    body += sse('content_block_start', {'type': 'content_block_start', 'index': 0,
+                                        'content_block': {'type': 'text', 'text': ''}})
+    for word in words:
+        body += sse('content_block_delta', {'type': 'content_block_delta', 'index': 0,
+                                            'delta': {'type': 'text_delta', 'text': word}})
+    body += sse('content_block_stop', {'type': 'content_block_stop', 'index': 0})
+    body += sse('message_delta', {'type': 'message_delta', 'delta': {'stop_reason': 'end_turn', 'stop_sequence': None},
+                                  'usage': {'output_tokens': len(words)}})
+    body += sse('message_stop', {'type': 'message_stop'})
+    return body.encode('utf-8')
+
+
+class StubMessagesHandler(BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'  # keep-alive, so a reused client shows up as one connection
+
+    def do_POST(self):
+        request = json.loads(self.rfile.read(int(self.headers['Content-Length'])))
+        self.server.requests.append({'path': self.path, 'api_key': self.headers.get('x-api-key'),
+                                     'connection': self.client_address, 'body': request})
+        body = messages_stream(['Hello', ' from', ' the stub'])
+        self.send_response(200)
+        self.send_header('Content-Type', 'text/event-stream')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, *args):
+        pass
+
+
+@pytest.fixture
+def stub_api(monkeypatch):
+    pytest.importorskip('anthropic')
+    server = ThreadingHTTPServer(('127.0.0.1', 0), StubMessagesHandler)
+    server.requests = []
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    monkeypatch.setenv('CLAUDE_API_BASE_URL', f'http://127.0.0.1:{server.server_port}')
+    yield server
+    server.shutdown()
+    server.server_close()
+
+
+@pytest.fixture
+def chat_client(monkeypatch, stub_api):
+    import server
+    from claude_service import ClaudeService
+    monkeypatch.setattr(server, 'claude_service', ClaudeService())
+    return server.app.test_client()
+
+
+def read_events(response):
+    events = []
+    for block in response.get_data(as_text=True).strip().split('\n\n'):
+        lines = dict(line.split(': ', 1) for line in block.split('\n'))
+        events.append((lines['event'], json.loads(lines['data'])))
+    return events
+
+
+def test_chat_stream_sends_tokens_then_done(chat_client, stub_api):
+    response = chat_client.post('/chat/stream', json={
+        'messages': [{'role': 'system', 'content': 'Be brief.'}, {'role': 'user', 'content': 'Hi'}],
+        'api_key': 'key-a'})
+    assert response.mimetype == 'text/event-stream'
+    events = read_events(response)
+    assert events[:-1] == [('token', {'text': 'Hello'}), ('token', {'text': ' from'}),
+                           ('token', {'text': ' the stub'})]
+    event, done = events[-1]
+    assert event == 'done'
+    assert done['message'] == 'Hello from the stub'
+    assert done['metadata']['streamed'] is True
+    assert done['metadata']['usage'] == {'input_tokens': 7, 'output_tokens': 3}
+
+    request = stub_api.requests[0]
+    assert request['path'] == '/v1/messages' and request['api_key'] == 'key-a'
+    assert request['body']['stream'] is True and request['body']['system'] == 'Be brief.'
+
+
+def test_chat_stream_reuses_the_client_per_key(chat_client, stub_api):
+    import server
+    for _ in range(2):
+        events = read_events(chat_client.post('/chat/stream', json={
+            'messages': [{'role': 'user', 'content': 'Hi'}], 'api_key': 'key-a', 'cache': False}))
+        assert events[-1][0] == 'done'
+    stats = server.claude_service.clients.stats()
+    assert stats['created'] == 1 and stats['hits'] == 1
+    # The second request went over the first one's pooled connection
+    assert stub_api.requests[0]['connection'] == stub_api.requests[1]['connection']
+
+    read_events(chat_client.post('/chat/stream', json={
+        'messages': [{'role': 'user', 'content': 'Hi'}], 'api_key': 'key-b', 'cache': False}))
+    assert server.claude_service.clients.stats()['created'] == 2
+    assert stub_api.requests[2]['api_key'] == 'key-b'
+
+
+def test_chat_endpoints_reject_non_json_bodies(client):
+    for path in ('/chat/stream', '/chat/message'):
+        response = client.post(path, data='not json', content_type='text/plain')
+        assert response.status_code == 400
+        assert response.get_json() == {'error': 'No data provided'}
@@ -0,0 +1,102 @@
+import io
+import os
+import pytest
+from werkzeug.datastructures import MultiDict
+import documents
+from documents import DocumentError, is_document, merge_pages, page_count, render_page, spool_document
+
+
+def make_tiff(pages=3, size=(200, 120)):
+    from PIL import Image
+    frames = [Image.new('RGB', size, (255, 255, 255)) for _ in range(pages)]
+    buffer = io.BytesIO()
+    frames[0].save(buffer, format='TIFF', save_all=True, append_images=frames[1:], dpi=(150, 150))
+    return buffer.getvalue()
+
+
+def make_pdf(pages=2):
+    pypdfium2 = pytest.importorskip('pypdfium2')
+    pdf = pypdfium2.PdfDocument.new()
+    for _ in range(pages):
+        pdf.new_page(144, 72)
+    buffer = io.BytesIO()
+    pdf.save(buffer)
+    return buffer.getvalue()
+
+
+def test_tiff_pages_from_bytes_and_path(tmp_path):
+    data = make_tiff()
+    assert is_document(data)
+    assert page_count(data) == 3
+    path = tmp_path / 'scan.tiff'
+    path.write_bytes(data)
+    img, dpi = render_page(str(path), 2)
+    assert img.shape == (120, 200, 3) and dpi == 150
+
+
+def test_pdf_pages_render_at_the_requested_dpi():
+    data = make_pdf()
+    path = spool_document(data)
+    try:
+        assert page_count(path) == 2
+        img, dpi = render_page(path, 1, dpi=144)
+        # 144x72 points at 144 dpi
+        assert img.shape[:2] == (144, 288) and dpi == 144
+    finally:
+        os.remove(path)
+
+
+def test_page_limit(monkeypatch):
+    monkeypatch.setattr(documents, 'DOCUMENT_MAX_PAGES', 2)
+    with pytest.raises(DocumentError):
+        page_count(make_tiff(pages=3))
+
+
+def test_spool_document_uses_the_configured_directory(tmp_path, monkeypatch):
+    monkeypatch.setattr(documents, 'DOCUMENT_TMPDIR', str(tmp_path))
+    path = spool_document(b'%PDF-1.7')
+    assert os.path.dirname(path) == str(tmp_path)
+    with open(path, 'rb') as file:
+        assert file.read() == b'%PDF-1.7'
+
+
+def test_merge_pages():
+    pages = [{'text': 'one', 'confidence': 0.8, 'words': 2}, {'text': '', 'confidence': 0, 'words': 0},
+             {'text': 'three', 'confidence': 0.6, 'words': 1}]
+    body = merge_pages(pages, 'standard')
+    assert body['text'] == 'one\n\n\n\nthree'
+    assert body['confidence'] == pytest.approx(0.7)
+    assert body['words'] == 3 and body['page_count'] == 3
+
+
+def test_ocr_document_pages_share_one_spooled_file(client, tmp_path, monkeypatch):
+    monkeypatch.setattr(documents, 'DOCUMENT_TMPDIR', str(tmp_path))
+    data = make_tiff()
+    response = client.post('/ocr', data={'file': (io.BytesIO(data), 'scan.tiff')}, content_type='multipart/form-data')
+    assert response.status_code == 200
+    body = response.get_json()
+    assert body['page_count'] == 3
+    assert [page['page'] for page in body['pages']] == [1, 2, 3]
+    assert os.listdir(tmp_path) == []
+
+
+def test_unread_document_stream_leaves_no_file(app_module, tmp_path, monkeypatch):
+    monkeypatch.setattr(documents, 'DOCUMENT_TMPDIR', str(tmp_path))
+    options = app_module.get_ocr_options(MultiDict())
+    count, pages = app_module.document_pages(make_tiff(), options)
+    assert count == 3 and os.listdir(tmp_path) == []
+    next(pages)
+    assert len(os.listdir(tmp_path)) == 1
+    pages.close()
+    assert os.listdir(tmp_path) == []
+
+
+@pytest.mark.parametrize('path', ['/ocr', '/ocr/stream', '/ocr/jobs'])
+def test_document_upload_size_limit(client, monkeypatch, path):
+    import image_io
+    monkeypatch.setattr(image_io, 'MAX_UPLOAD_BYTES', 1024)
+    data = make_pdf()
+    data += b'%' * (2048 - len(data))
+    response = client.post(path, data={'file': (io.BytesIO(data), 'big.pdf')}, content_type='multipart/form-data')
+    assert response.status_code == 413
+    assert 'maximum upload size' in response.get_json()['error']
@@ -0,0 +1,96 @@
+import base64
+import gzip
+import io
+import json
+import numpy as np
+import pytest
+from werkzeug.datastructures import MIMEAccept
+from encoding import MSGPACK_AVAILABLE, encode_body, pack_lines, pack_regions, parse_format
+
+
+REGIONS = [{'box': [[10, 10], [60, 10], [60, 30], [10, 30]], 'text': 'hello', 'confidence': 0.9},
+           {'box': [[80, 12], [150, 12], [150, 30], [80, 30]], 'text': 'world'}]
+
+
+def test_pack_regions_is_columnar():
+    packed = pack_regions(REGIONS)
+    assert packed['count'] == 2 and packed['box_dtype'] == 'int16'
+    boxes = np.frombuffer(packed['boxes'], dtype='<i2').reshape(2, 4, 2)
+    assert boxes.tolist() == [region['box'] for region in REGIONS]
+    confidences = np.frombuffer(packed['confidences'], dtype='<f4')
+    assert confidences[0] == pytest.approx(0.9) and np.isnan(confidences[1])
+    assert packed['texts'] == ['hello', 'world']
+
+
+def test_pack_regions_widens_large_coordinates():
+    packed = pack_regions([{'box': [[0, 0], [40000, 0], [40000, 10], [0, 10]], 'text': 'wide'}])
+    assert packed['box_dtype'] == 'int32'
+    assert np.frombuffer(packed['boxes'], dtype='<i4')[2] == 40000
+
+
+def test_pack_lines_offsets():
+    packed = pack_lines([{'text': 'hello world', 'regions': [0, 1]}, {'text': 'next', 'regions': [2]}])
+    assert np.frombuffer(packed['offsets'], dtype='<i4').tolist() == [0, 2, 3]
+    assert np.frombuffer(packed['regions'], dtype='<i4').tolist() == [0, 1, 2]
+
+
+def test_packed_json_base64_encodes_arrays():
+    data, mimetype = encode_body({'text': 'hello world', 'regions': REGIONS}, 'packed')
+    assert mimetype == 'application/json'
+    body = json.loads(data)
+    assert base64.b64decode(body['regions']['boxes']) == pack_regions(REGIONS)['boxes']
+
+
+def test_msgpack_keeps_raw_bytes():
+    msgpack = pytest.importorskip('msgpack')
+    data, mimetype = encode_body({'text': 'hi', 'pages': [{'text': 'hi', 'regions': REGIONS}]}, 'msgpack')
+    assert mimetype == 'application/msgpack'
+    body = msgpack.unpackb(data, raw=False)
+    assert body['pages'][0]['regions']['boxes'] == pack_regions(REGIONS)['boxes']
+
+
+def test_parse_format():
+    assert parse_format('PACKED') == 'packed'
+    with pytest.raises(ValueError):
+        parse_format('xml')
+    assert parse_format(None, MIMEAccept([('*/*', 1)])) == 'json'
+    if MSGPACK_AVAILABLE:
+        assert parse_format(None, MIMEAccept([('application/msgpack', 1)])) == 'msgpack'
+
+
+def test_structured_ocr_response_formats(client, page_png):
+    def post(**form):
+        form['file'] = (io.BytesIO(page_png), 'page.png')
+        return client.post('/ocr', data=dict(form, structured='true', preserve_layout='true'),
+                           content_type='multipart/form-data', headers={'Accept-Encoding': 'gzip'})
+
+    body = post().get_json()
+    assert [region['text'] for region in body['regions']] == ['w10_10', 'w80_12', 'w10_50']
+    assert body['lines'][0]['regions'] == [0, 1]
+    assert body['lines'][0]['text'].split() == ['w10_10', 'w80_12']
+
+    packed = post(format='packed')
+    data = gzip.decompress(packed.get_data()) if packed.headers.get('Content-Encoding') == 'gzip' else packed.get_data()
+    assert json.loads(data)['regions']['texts'] == ['w10_10', 'w80_12', 'w10_50']
+    assert post(format='xml').status_code == 400
+
+
+def test_structured_boxes_are_on_the_uploaded_image(client, fake_reader, page_png, monkeypatch):
+    import ocr_engine
+    # Boxes the reader finds on the image after resize (dpi 150 -> 300, x2) and autoscale (x1.5)
+    fake_reader.boxes = [[30, 180, 30, 90]]
+    monkeypatch.setattr(ocr_engine, 'autoscale_image',
+                        lambda img, quality: (img, 1.5, {'text_height': 16.0, 'scale': 1.5}))
+    form = {'preprocessing': 'resize', 'dpi': '150', 'autoscale': 'true', 'structured': 'true'}
+
+    def post(path, **extra):
+        data = dict(form, file=(io.BytesIO(page_png), 'page.png'), **extra)
+        return client.post(path, data=data, content_type='multipart/form-data')
+
+    body = post('/ocr', keep_regions='true').get_json()
+    assert body['regions'][0]['box'] == [[10, 10], [60, 10], [60, 30], [10, 30]]
+    assert body['detections'] == [body['regions'][0]['box']]
+    assert body['image_size'] == [200, 120]
+
+    streamed = post('/ocr/stream').get_data(as_text=True).split('event: done\ndata: ')[1]
+    assert json.loads(streamed)['regions'][0]['box'] == body['regions'][0]['box']
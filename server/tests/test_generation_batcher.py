@@ -0,0 +1,56 @@
+import threading
+import pytest
+from generation_batcher import GenerationBatcher
+
+
+def test_concurrent_requests_share_a_batch():
+    release = threading.Event()
+    batches = []
+
+    def run_batch(items):
+        if not batches:
+            # Hold the first call so the next requests queue up behind it
+            release.wait(10)
+        batches.append(list(items))
+        return [item * 2 for item in items]
+
+    batcher = GenerationBatcher(run_batch, max_batch_size=3, max_wait=0.5)
+    first = batcher.submit(0)
+    while batcher.stats()['batches'] == 0:
+        pass
+    futures = [batcher.submit(item) for item in (1, 2, 3, 4)]
+    release.set()
+    assert first.result(10) == 0
+    assert [future.result(10) for future in futures] == [2, 4, 6, 8]
+    assert batches == [[0], [1, 2, 3], [4]]
+    assert batcher.stats()['batch_sizes'] == {1: 2, 3: 1}
+
+
+def test_failed_batch_fails_every_request():
+    def run_batch(items):
+        raise RuntimeError('out of memory')
+
+    batcher = GenerationBatcher(run_batch, max_wait=0)
+    with pytest.raises(RuntimeError, match='out of memory'):
+        batcher.submit('prompt').result(10)
+
+
+def conversations():
+    return [([{'role': 'user', 'content': 'hi'}], None),
+            ([{'role': 'user', 'content': 'a much longer question'}], None)]
+
+
+def test_local_batch_counts_tokens_per_row(local_service):
+    results = local_service.run_local_batch(conversations())
+    assert len(results) == 2
+    for response, metadata in results:
+        assert isinstance(response, str)
+        assert metadata['batch_size'] == 2
+        assert 0 < metadata['usage']['output_tokens'] <= 6
+    assert results[0][1]['usage']['input_tokens'] < results[1][1]['usage']['input_tokens']
+
+
+def test_local_batch_without_eos_token(local_service):
+    local_service.local_model.generation_config.eos_token_id = None
+    results = local_service.run_local_batch(conversations())
+    assert [metadata['usage']['output_tokens'] for _, metadata in results] == [6, 6]
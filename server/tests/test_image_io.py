@@ -0,0 +1,70 @@
+import io
+import cv2
+import numpy as np
+import pytest
+from werkzeug.test import EnvironBuilder
+import image_io
+from image_io import ImageTooLargeError, InMemoryRequest, check_image_limits, decode_image, get_image_size
+
+
+@pytest.fixture
+def image():
+    img = np.full((30, 70, 3), 255, dtype=np.uint8)
+    img[10:20, 5:60] = 0
+    return img
+
+
+@pytest.mark.parametrize('ext', ['.png', '.jpg', '.bmp', '.webp'])
+def test_image_size_is_read_from_the_header(image, ext):
+    data = cv2.imencode(ext, image)[1].tobytes()
+    assert get_image_size(data) == (70, 30)
+    # Only the header is needed
+    assert get_image_size(data[:64] if ext != '.jpg' else data[:1024]) == (70, 30)
+
+
+def test_gif_and_unknown_headers():
+    assert get_image_size(b'GIF89a' + (640).to_bytes(2, 'little') + (480).to_bytes(2, 'little')) == (640, 480)
+    assert get_image_size(b'\x89PNG\r\n\x1a\n') is None
+    assert get_image_size(b'not an image') is None
+
+
+def test_limits_reject_before_decoding(image, monkeypatch):
+    data = cv2.imencode('.png', image)[1].tobytes()
+    monkeypatch.setattr(image_io, 'MAX_IMAGE_PIXELS', 70 * 30 - 1)
+    with pytest.raises(ImageTooLargeError, match='70x30'):
+        check_image_limits(data)
+    monkeypatch.setattr(image_io, 'MAX_IMAGE_PIXELS', 70 * 30)
+    check_image_limits(data)
+    monkeypatch.setattr(image_io, 'MAX_UPLOAD_BYTES', len(data) - 1)
+    with pytest.raises(ImageTooLargeError, match='upload size'):
+        check_image_limits(data)
+
+
+def test_decode_from_memory(image, monkeypatch):
+    data = cv2.imencode('.png', image)[1].tobytes()
+    assert np.array_equal(decode_image(data), image)
+    assert decode_image(b'') is None
+    assert decode_image(b'not an image') is None
+
+    # Formats whose header is not sniffed are checked once decoded
+    tiff = cv2.imencode('.tiff', image)[1].tobytes()
+    assert get_image_size(tiff) is None
+    monkeypatch.setattr(image_io, 'MAX_IMAGE_PIXELS', 100)
+    with pytest.raises(ImageTooLargeError):
+        decode_image(tiff)
+
+
+def test_uploads_stay_in_memory():
+    builder = EnvironBuilder(method='POST', data={'file': (io.BytesIO(b'x' * 600_000), 'page.png')})
+    request = InMemoryRequest(builder.get_environ())
+    upload = request.files['file']
+    assert isinstance(upload.stream, io.BytesIO)
+    assert len(upload.read()) == 600_000
+
+
+def test_ocr_rejects_oversized_images(client, image, monkeypatch):
+    monkeypatch.setattr(image_io, 'MAX_IMAGE_PIXELS', 100)
+    data = cv2.imencode('.png', image)[1].tobytes()
+    response = client.post('/ocr', data={'file': (io.BytesIO(data), 'page.png')}, content_type='multipart/form-data')
+    assert response.status_code == 413
+    assert 'exceeds the maximum' in response.get_json()['error']
@@ -0,0 +1,86 @@
+import io
+import time
+import threading
+from jobs import OcrJobQueue
+
+
+def wait_for(queue, job_id, status, timeout=10):
+    deadline = time.time() + timeout
+    while time.time() < deadline:
+        job = queue.get(job_id)
+        if job['status'] == status:
+            return job
+        time.sleep(0.01)
+    raise AssertionError(f'job {job_id} never reached {status}: {queue.get(job_id)}')
+
+
+def test_job_runs_and_drops_its_image():
+    queue = OcrJobQueue(lambda data, options: {'text': data.decode()}, workers=1)
+    job_id = queue.submit(b'hello', {})
+    assert wait_for(queue, job_id, 'done')['result'] == {'text': 'hello'}
+    assert queue.jobs[job_id].data is None
+
+
+def test_only_queued_jobs_cancel():
+    started = threading.Event()
+    release = threading.Event()
+
+    def runner(data, options):
+        started.set()
+        release.wait(10)
+        return {'text': ''}
+
+    queue = OcrJobQueue(runner, workers=1)
+    running = queue.submit(b'a', {})
+    assert started.wait(10)
+    waiting = queue.submit(b'b', {})
+    assert queue.cancel(waiting)['status'] == 'cancelled'
+    assert queue.cancel(running)['status'] == 'running'
+    assert queue.cancel('missing') is None
+    release.set()
+    wait_for(queue, running, 'done')
+    assert queue.get(waiting)['status'] == 'cancelled'
+
+
+def test_failed_job_reports_error():
+    def runner(data, options):
+        raise ValueError('bad image')
+
+    queue = OcrJobQueue(runner, workers=1)
+    job_id = queue.submit(b'a', {})
+    assert wait_for(queue, job_id, 'failed')['error'] == 'bad image'
+
+
+def test_persisted_jobs_are_restored(tmp_path):
+    path = str(tmp_path / 'jobs.db')
+    queue = OcrJobQueue(lambda data, options: {'text': 'done'}, workers=1, db_path=path)
+    job_id = queue.submit(b'a', {'lang': 'en'})
+    wait_for(queue, job_id, 'done')
+    # No workers, so this job is still queued when the process "stops"
+    stopped = OcrJobQueue(lambda data, options: {}, workers=0, db_path=path)
+    queued_id = stopped.submit(b'queued', {'lang': 'en'})
+
+    restored = OcrJobQueue(lambda data, options: {'text': data.decode()}, workers=1, db_path=path)
+    restored.start()
+    # The queued job runs without any job request touching the queue first
+    deadline = time.time() + 10
+    while restored.jobs[queued_id].status != 'done' and time.time() < deadline:
+        time.sleep(0.01)
+    assert restored.jobs[queued_id].result == {'text': 'queued'}
+    assert restored.get(job_id)['result'] == {'text': 'done'}
+
+
+def test_cancel_finished_job_is_a_conflict(client, app_module, page_png, monkeypatch):
+    monkeypatch.setattr(app_module, 'job_queue', OcrJobQueue(lambda data, options: app_module.run_ocr_cached(
+        data, options)[0], workers=1))
+    response = client.post('/ocr/jobs', data={'file': (io.BytesIO(page_png), 'page.png')},
+                           content_type='multipart/form-data')
+    assert response.status_code == 202
+    job_id = response.get_json()['job_id']
+    assert response.headers['Location'] == f'/ocr/jobs/{job_id}'
+    wait_for(app_module.job_queue, job_id, 'done')
+
+    response = client.delete(f'/ocr/jobs/{job_id}')
+    assert response.status_code == 409
+    assert response.get_json()['error'] == 'Job is already done'
+    assert client.post('/ocr/jobs/missing/cancel').status_code == 404
@@ -0,0 +1,157 @@
+"""layout.layout_text must reproduce the original per-box layout pass exactly.
+
+The reference implementation and the synthetic pages are also used by benchmarks/bench_layout.py.
+"""
+import re
+import random
+from layout import layout_text
+
+
+def legacy_layout_text(result):
+    """The original pure-Python layout pass from perform_ocr, kept as the reference."""
+    # Improved spatial analysis for better layout preservation
+
+    # Sort boxes by vertical position (top to bottom)
+    boxes_with_positions = []
+    for box in result:
+        # Each box contains coordinates: [[top-left, top-right, bottom-right, bottom-left], text, confidence]
+        if len(box) >= 2:
+            # Get the bounding box center Y position and height
+            top_y = min(point[1] for point in box[0])
+            bottom_y = max(point[1] for point in box[0])
+            height = bottom_y - top_y
+            center_y = top_y + height/2
+            left_x = min(point[0] for point in box[0])
+
+            boxes_with_positions.append({
+                'box': box,
+                'top': top_y,
+                'bottom': bottom_y,
+                'center_y': center_y,
+                'height': height,
+                'left': left_x,
+                'text': box[1]
+            })
+
+    # Sort boxes by top Y position
+    sorted_boxes = sorted(boxes_with_positions, key=lambda x: x['top'])
+
+    # Group boxes into lines based on overlap
+    lines = []
+    current_line = [sorted_boxes[0]]
+    line_bottom = sorted_boxes[0]['bottom']
+
+    for i in range(1, len(sorted_boxes)):
+        current_box = sorted_boxes[i]
+        # If this box's top is above the previous line's bottom or they overlap significantly,
+        # add it to the current line
+        vertical_overlap = min(line_bottom, current_box['bottom']) - current_box['top']
+        overlap_ratio = vertical_overlap / current_box['height'] if current_box['height'] > 0 else 0
+
+        if overlap_ratio > 0.25:  # They belong to the same line if 25% overlap
+            current_line.append(current_box)
+            line_bottom = max(line_bottom, current_box['bottom'])
+        else:
+            # Start a new line
+            lines.append(current_line)
+            current_line = [current_box]
+            line_bottom = current_box['bottom']
+
+    # Add the last line
+    if current_line:
+        lines.append(current_line)
+
+    # For each line, sort elements from left to right and join with spaces
+    text_lines = []
+    for line in lines:
+        # Sort by left x-coordinate
+        sorted_line = sorted(line, key=lambda x: x['left'])
+
+        # Calculate average character width to determine spacing
+        avg_char_width = 0
+        total_width = 0
+        total_chars = 0
+
+        for box in sorted_line:
+            width = max(p[0] for p in box['box'][0]) - min(p[0] for p in box['box'][0])
+            chars = len(box['text'])
+            if chars > 0:
+                total_width += width
+                total_chars += chars
+
+        if total_chars > 0:
+            avg_char_width = total_width / total_chars
+
+        # Join text with appropriate spacing
+        line_text = ""
+        last_right = 0
+
+        for i, box in enumerate(sorted_line):
+            if i > 0:
+                # Calculate gap between this box and previous one
+                left = min(p[0] for p in box['box'][0])
+                gap = left - last_right
+
+                # Add spaces based on gap size
+                spaces = int(gap / (avg_char_width * 0.7)) if avg_char_width > 0 else 1
+                line_text += " " * max(1, min(spaces, 8))  # Limit to reasonable number
+
+            line_text += box['text']
+            last_right = max(p[0] for p in box['box'][0])
+
+        text_lines.append(line_text)
+
+    # Join lines with newlines, preserving paragraph structure
+    text = "\n".join(text_lines)
+
+    # Preserve multiple newlines for paragraph separation
+    text = re.sub(r'\n{3,}', '\n\n', text)
+    return text
+
+
+def synthetic_regions(count, seed, float_coords=False):
+    """Build a page of text regions laid out in rows, with jitter, overlaps and degenerate boxes."""
+    rng = random.Random(seed)
+    words = ['invoice', 'total', '42', 'Lorem', 'ipsum', 'dolor', '', 'x', 'quarterly', 'Q3-2024', '$1,299.00']
+    result = []
+    y = 10
+    while len(result) < count:
+        height = rng.choice([0, 8, 12, 14, 20, 32]) if rng.random() < 0.05 else rng.choice([12, 14, 18, 24])
+        x = rng.randint(0, 40)
+        for _ in range(rng.randint(1, 12)):
+            if len(result) >= count:
+                break
+            text = rng.choice(words)
+            width = max(1, len(text)) * rng.randint(5, 12)
+            top = y + rng.randint(-4, 4)
+            bottom = top + height + rng.randint(-2, 2) if height else top
+            left, right = x, x + width
+            if float_coords:
+                left, right = left + rng.random(), right + rng.random()
+                top, bottom = top + rng.random(), max(top, bottom + rng.random())
+            result.append(([[left, top], [right, top], [right, bottom], [left, bottom]], text, rng.random()))
+            x = right + rng.randint(-5, 120)
+        y += height + rng.randint(-6, 30)
+    rng.shuffle(result)
+    return result
+
+
+def golden_set():
+    cases = [synthetic_regions(size, seed, float_coords)
+             for size in (2, 3, 10, 50, 200, 1000)
+             for seed in range(5)
+             for float_coords in (False, True)]
+    # Hand-written edge cases: identical tops, zero-height boxes, nested boxes and empty text
+    cases.append([([[0, 0], [10, 0], [10, 10], [0, 10]], 'a', 0.9), ([[20, 0], [30, 0], [30, 10], [20, 10]], 'b', 0.9)])
+    cases.append([([[0, 5], [10, 5], [10, 5], [0, 5]], 'flat', 0.9), ([[0, 0], [10, 0], [10, 10], [0, 10]], 'tall', 0.9),
+                  ([[15, 4], [25, 4], [25, 4], [15, 4]], 'flat2', 0.9)])
+    cases.append([([[0, 0], [100, 0], [100, 50], [0, 50]], 'outer', 0.9), ([[10, 10], [20, 10], [20, 20], [10, 20]], 'inner', 0.9),
+                  ([[5, 60], [9, 60], [9, 70], [5, 70]], '', 0.9), ([[40, 61], [90, 61], [90, 69], [40, 69]], 'tail', 0.9)])
+    return cases
+
+
+def test_layout_matches_the_original_implementation():
+    cases = golden_set()
+    assert len(cases) == 63
+    for index, result in enumerate(cases):
+        assert layout_text(result) == legacy_layout_text(result), f'golden case {index} ({len(result)} regions)'
@@ -0,0 +1,78 @@
+import io
+import time
+from metrics import MetricsRegistry, ocr_request_seconds, ocr_stage_seconds
+from worker_pool import OcrExecutor
+
+
+def test_histogram_renders_cumulative_buckets():
+    registry = MetricsRegistry()
+    histogram = registry.histogram('latency_seconds', 'Request latency', labels=('endpoint',), buckets=(1.0, 0.1))
+    for value in (0.05, 0.5, 2.0):
+        histogram.observe(value, endpoint='ocr')
+    histogram.observe(0.1, endpoint='batch')
+    assert registry.render().splitlines() == [
+        '# HELP latency_seconds Request latency',
+        '# TYPE latency_seconds histogram',
+        'latency_seconds_bucket{endpoint="batch",le="0.1"} 1',
+        'latency_seconds_bucket{endpoint="batch",le="1.0"} 1',
+        'latency_seconds_bucket{endpoint="batch",le="+Inf"} 1',
+        'latency_seconds_sum{endpoint="batch"} 0.1',
+        'latency_seconds_count{endpoint="batch"} 1',
+        'latency_seconds_bucket{endpoint="ocr",le="0.1"} 1',
+        'latency_seconds_bucket{endpoint="ocr",le="1.0"} 2',
+        'latency_seconds_bucket{endpoint="ocr",le="+Inf"} 3',
+        'latency_seconds_sum{endpoint="ocr"} 2.55',
+        'latency_seconds_count{endpoint="ocr"} 3',
+    ]
+
+
+def test_counter_and_gauge_exposition():
+    registry = MetricsRegistry()
+    counter = registry.counter('tokens_total', 'Tokens', labels=('model',))
+    counter.inc(3, model='a "quoted"\nname')
+    registry.gauge('queue_depth', 'Queued tasks', lambda: 4)
+    registry.gauge('broken', 'Never rendered', lambda: 1 / 0)
+    assert registry.render() == (
+        '# HELP tokens_total Tokens\n'
+        '# TYPE tokens_total counter\n'
+        'tokens_total{model="a \\"quoted\\"\\nname"} 3\n'
+        '# HELP queue_depth Queued tasks\n'
+        '# TYPE queue_depth gauge\n'
+        'queue_depth 4\n'
+    )
+
+
+class SlowExecutor(OcrExecutor):
+    """Inline executor whose tasks wait before they start, like a request queued behind others."""
+
+    def run(self, fn, *args):
+        time.sleep(0.2)
+        return super().run(fn, *args)
+
+
+def test_request_latency_is_wall_clock(client, app_module, monkeypatch, page_png):
+    monkeypatch.setattr(app_module, 'get_executor', lambda: SlowExecutor())
+    key = ('ocr', 'eng', 'standard', 'miss')
+    before = ocr_request_seconds.series.get(key, [None, 0.0, 0])[1:]
+    stages_before = {k: v[1] for k, v in ocr_stage_seconds.series.items()}
+
+    response = client.post('/ocr', data={'file': (io.BytesIO(page_png), 'page.png'), 'quality': 'standard'},
+                           content_type='multipart/form-data')
+    assert response.status_code == 200
+    total, count = ocr_request_seconds.series[key][1:]
+    assert count == before[1] + 1
+    request_seconds = total - before[0]
+    stage_seconds = sum(v[1] - stages_before.get(k, 0.0) for k, v in ocr_stage_seconds.series.items())
+    # The queue wait is in no stage but is part of the request
+    assert request_seconds >= stage_seconds + 0.2
+
+
+def test_metrics_endpoint(client, page_png):
+    client.post('/ocr', data={'file': (io.BytesIO(page_png), 'page.png'), 'language': 'deu'},
+                content_type='multipart/form-data')
+    response = client.get('/metrics')
+    assert response.mimetype == 'text/plain'
+    text = response.get_data(as_text=True)
+    assert '# TYPE ocr_request_seconds histogram' in text
+    assert 'ocr_request_seconds_count{endpoint="ocr",language="deu",quality="standard",cache="miss"} 1' in text
+    assert 'ocr_stage_seconds_bucket{stage="decode",language="deu",quality="standard",le="+Inf"} 1' in text
@@ -0,0 +1,34 @@
+import threading
+
+
+def test_concurrent_first_requests_start_one_load(monkeypatch):
+    import claude_service
+    monkeypatch.setattr(claude_service, 'LOCAL_MODEL_AVAILABLE', True)
+    service = claude_service.ClaudeService()
+    release = threading.Event()
+    loads = []
+
+    def load():
+        loads.append(threading.current_thread().name)
+        release.wait(5)
+        service.model_state = claude_service.MODEL_READY
+
+    service.load_local_model = load
+    start = threading.Barrier(8)
+
+    def request():
+        start.wait()
+        service.start_loading_local_model()
+
+    threads = [threading.Thread(target=request) for _ in range(8)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert service.model_state == claude_service.MODEL_LOADING
+    release.set()
+    for thread in threading.enumerate():
+        if thread.name == 'local-model-load':
+            thread.join()
+    assert len(loads) == 1
+    assert service.start_loading_local_model() == claude_service.MODEL_READY
@@ -0,0 +1,90 @@
+import os
+import types
+import pytest
+
+torch = pytest.importorskip('torch')
+pytest.importorskip('onnxruntime')
+pytest.importorskip('easyocr')
+from easyocr.craft import CRAFT
+from easyocr.model.model import Model
+import onnx_backend
+from onnx_backend import OnnxDetector, OnnxModel, parse_backend, use_onnx
+
+
+def make_reader(detect_network='craft'):
+    """An EasyOCR reader's models with random weights, so no model files are downloaded."""
+    torch.manual_seed(0)
+    detector = CRAFT().eval() if detect_network == 'craft' else None
+    return types.SimpleNamespace(detector=detector, recognizer=Model(1, 256, 256, 97).eval(),
+                                 model_lang='english', detect_network=detect_network)
+
+
+@pytest.fixture(scope='module')
+def exported(tmp_path_factory):
+    """One reader exported to ONNX, with the PyTorch models it replaced."""
+    model_dir = str(tmp_path_factory.mktemp('onnx'))
+    original = onnx_backend.ONNX_MODEL_DIR
+    onnx_backend.ONNX_MODEL_DIR = model_dir
+    try:
+        reader = make_reader()
+        torch_models = (reader.detector, reader.recognizer)
+        use_onnx(reader)
+    finally:
+        onnx_backend.ONNX_MODEL_DIR = original
+    return reader, torch_models, model_dir
+
+
+def test_exported_models_match_pytorch(exported):
+    reader, (detector, recognizer), _ = exported
+    assert isinstance(reader.detector, OnnxDetector) and isinstance(reader.recognizer, OnnxModel)
+    assert reader.detector.nbytes > 0
+    # Batch and image sizes differ from the export input
+    image = torch.rand(2, 3, 320, 480)
+    lines = torch.rand(3, 1, 64, 300)
+    with torch.no_grad():
+        score, feature = reader.detector(image)
+        assert feature is None
+        assert torch.allclose(score, detector(image)[0], atol=1e-4)
+        assert torch.allclose(reader.recognizer(lines, None), recognizer(lines, None), atol=1e-4)
+
+
+def test_exported_models_are_reused(exported, monkeypatch):
+    _, _, model_dir = exported
+    monkeypatch.setattr(onnx_backend, 'ONNX_MODEL_DIR', model_dir)
+    monkeypatch.setattr(onnx_backend, 'export_model', lambda *args, **kwargs: pytest.fail('exported again'))
+    reader = use_onnx(make_reader())
+    assert isinstance(reader.detector, OnnxDetector) and isinstance(reader.recognizer, OnnxModel)
+
+
+def test_failed_exports_keep_pytorch(tmp_path, monkeypatch):
+    monkeypatch.setattr(onnx_backend, 'ONNX_MODEL_DIR', str(tmp_path))
+    monkeypatch.setattr(onnx_backend, 'EXPORT_TOLERANCE', -1.0)  # every export disagrees with PyTorch
+    reader = make_reader(detect_network='dbnet18')
+    recognizer = reader.recognizer
+    use_onnx(reader)
+    assert reader.recognizer is recognizer and reader.detector is None
+    # Nothing partial is left for another process to load
+    assert os.listdir(tmp_path) == []
+
+
+def test_custom_recognizers_stay_on_pytorch(tmp_path, monkeypatch):
+    monkeypatch.setattr(onnx_backend, 'ONNX_MODEL_DIR', str(tmp_path))
+    reader = make_reader(detect_network='dbnet18')
+    reader.recognizer = torch.nn.Identity()
+    assert use_onnx(reader).recognizer is reader.recognizer
+    assert os.listdir(tmp_path) == []
+
+
+def test_quantized_recognizer(tmp_path, monkeypatch):
+    monkeypatch.setattr(onnx_backend, 'ONNX_MODEL_DIR', str(tmp_path))
+    reader = use_onnx(make_reader(detect_network='dbnet18'), quantize=True)
+    assert isinstance(reader.recognizer, OnnxModel)
+    assert [name for name in os.listdir(tmp_path) if name.endswith('.int8.onnx')]
+    assert reader.recognizer(torch.rand(1, 1, 64, 200)).shape[-1] == 97
+
+
+def test_parse_backend(monkeypatch):
+    assert parse_backend('ONNX') == 'onnx'
+    assert parse_backend('tensorrt') == 'torch'
+    monkeypatch.setattr(onnx_backend, 'ONNX_AVAILABLE', False)
+    assert parse_backend('onnx') == 'torch'
@@ -0,0 +1,67 @@
+import cv2
+import numpy as np
+import pytest
+import preprocessing
+from preprocessing import compile_pipeline, run_pipeline
+
+
+def reference_preprocess(img, steps):
+    """The copy-per-step preprocessing the pipeline replaced."""
+    processed = img.copy()
+    if 'grayscale' in steps:
+        processed = cv2.cvtColor(cv2.cvtColor(processed, cv2.COLOR_BGR2GRAY), cv2.COLOR_GRAY2BGR)
+    if 'contrast' in steps:
+        lab = cv2.cvtColor(processed, cv2.COLOR_BGR2LAB)
+        lab[:, :, 0] = cv2.createCLAHE(clipLimit=3.0, tileGridSize=(8, 8)).apply(lab[:, :, 0])
+        processed = cv2.cvtColor(lab, cv2.COLOR_LAB2BGR)
+    if 'sharpen' in steps:
+        processed = cv2.filter2D(processed, -1, np.array([[0, -1, 0], [-1, 5, -1], [0, -1, 0]]))
+    return processed
+
+
+@pytest.fixture
+def page():
+    rng = np.random.default_rng(0)
+    img = np.full((90, 160, 3), 230, dtype=np.uint8)
+    cv2.putText(img, 'Invoice 42', (5, 50), cv2.FONT_HERSHEY_SIMPLEX, 1.0, (40, 30, 20), 2)
+    return np.clip(img + rng.integers(-12, 12, img.shape), 0, 255).astype(np.uint8)
+
+
+@pytest.mark.parametrize('steps', [['contrast'], ['sharpen'], ['sharpen', 'contrast']])
+def test_colour_steps_match_the_old_preprocessing(page, steps):
+    expected = reference_preprocess(page, steps)
+    processed, _ = run_pipeline(page.copy(), steps)
+    assert np.array_equal(processed, expected)
+
+
+def test_grayscale_stays_single_channel(page):
+    processed, _ = run_pipeline(page.copy(), ['grayscale'])
+    assert processed.ndim == 2
+    assert np.array_equal(processed, reference_preprocess(page, ['grayscale'])[:, :, 0])
+
+
+def test_steps_modify_the_image_in_place(page):
+    img = page.copy()
+    processed, info = run_pipeline(img, ['sharpen', 'contrast'])
+    assert processed is img
+    assert set(info['timings_ms']) == {'contrast', 'sharpen'}
+
+
+def test_pipelines_are_compiled_once_in_a_fixed_order():
+    compile_pipeline.cache_clear()
+    stages = compile_pipeline(('binarize', 'grayscale', 'unknown'))
+    assert [name for name, _ in stages] == ['grayscale', 'binarize']
+    compile_pipeline(('binarize', 'grayscale', 'unknown'))
+    assert compile_pipeline.cache_info().hits == 1
+
+
+def test_resize_needs_a_source_dpi(page, monkeypatch):
+    processed, info = run_pipeline(page, ['resize'])
+    assert processed.shape == page.shape and 'scale' not in info
+
+    processed, info = run_pipeline(page, ['resize'], dpi=150)
+    assert processed.shape[:2] == (180, 320) and info['scale'] == 2.0
+
+    monkeypatch.setattr(preprocessing, 'DEFAULT_SOURCE_DPI', 600)
+    processed, info = run_pipeline(page, ['resize'])
+    assert processed.shape[:2] == (45, 80) and info['scale'] == 0.5
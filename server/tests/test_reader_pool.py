@@ -0,0 +1,55 @@
+import threading
+import time
+from reader_pool import ReaderPool, parse_preload
+
+
+class SizedModel:
+    def __init__(self, nbytes):
+        self.nbytes = nbytes
+
+
+class SizedReader:
+    def __init__(self, nbytes):
+        self.detector = SizedModel(nbytes)
+
+
+def test_least_recently_used_reader_is_evicted():
+    pool = ReaderPool(max_readers=2)
+    for key in ('en', 'ja', 'en', 'fr'):
+        pool.get(key, lambda: object())
+    assert list(pool.entries) == ['en', 'fr']
+    assert pool.stats()['evictions'] == 1 and pool.stats()['loads'] == 3
+
+
+def test_memory_budget_keeps_the_newest_reader():
+    pool = ReaderPool(max_readers=10, max_bytes=150)
+    pool.get('a', lambda: SizedReader(100))
+    pool.get('b', lambda: SizedReader(100))
+    assert list(pool.entries) == ['b']
+    # A reader over the whole budget is still kept, alone
+    pool.get('c', lambda: SizedReader(500))
+    assert list(pool.entries) == ['c'] and pool.stats()['bytes'] == 500
+
+
+def test_concurrent_requests_build_a_reader_once():
+    pool = ReaderPool()
+    builds = []
+
+    def factory():
+        builds.append(1)
+        time.sleep(0.1)
+        return object()
+
+    readers = []
+    threads = [threading.Thread(target=lambda: readers.append(pool.get('en', factory))) for _ in range(4)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert len(builds) == 1
+    assert len({id(reader) for reader in readers}) == 1
+
+
+def test_parse_preload():
+    assert parse_preload('eng:fast, jpn ,') == [('eng', 'fast'), ('jpn', 'standard')]
+    assert parse_preload(None) == []
@@ -0,0 +1,40 @@
+import io
+import pytest
+
+
+def keep_regions(client, page_png):
+    response = client.post('/ocr', data={'file': (io.BytesIO(page_png), 'page.png'), 'keep_regions': 'true'},
+                           content_type='multipart/form-data')
+    assert response.status_code == 200
+    return response.get_json()['image_id']
+
+
+def test_parse_region_boxes_splits_and_scales(app_module):
+    horizontal, free = app_module.parse_region_boxes(
+        [[[10, 10], [60, 10], [60, 30], [10, 30]], [[0, 5], [40, 0], [45, 20], [5, 25]]], (100, 100), scale=2.0)
+    assert horizontal == [[20, 100, 20, 60]]
+    # Points are clamped to the image after scaling
+    assert free == [[[0, 10], [80, 0], [90, 40], [10, 50]]]
+    with pytest.raises(ValueError):
+        app_module.parse_region_boxes([[[0, 0], [1, 1]]], (100, 100))
+
+
+def test_recognize_reads_only_chosen_regions(client, fake_reader, page_png):
+    image_id = keep_regions(client, page_png)
+    fake_reader.calls.clear()
+    response = client.post(f'/ocr/images/{image_id}/recognize',
+                           json={'regions': [1], 'boxes': [[[10, 50], [90, 50], [90, 70], [10, 70]]]})
+    assert response.status_code == 200
+    body = response.get_json()
+    assert body['image_id'] == image_id
+    assert [region['text'] for region in body['regions']] == ['w80_12', 'w10_50']
+    assert 'detect' not in fake_reader.calls
+
+
+def test_recognize_rejects_unknown_regions(client, page_png):
+    image_id = keep_regions(client, page_png)
+    assert client.post(f'/ocr/images/{image_id}/recognize', json={'regions': [9]}).status_code == 400
+    assert client.post(f'/ocr/images/{image_id}/recognize', json={}).status_code == 400
+    assert client.post('/ocr/images/missing/recognize', json={'regions': [0]}).status_code == 404
+    assert client.delete(f'/ocr/images/{image_id}').status_code == 200
+    assert client.post(f'/ocr/images/{image_id}/recognize', json={'regions': [0]}).status_code == 404
@@ -0,0 +1,45 @@
+from werkzeug.datastructures import MultiDict
+from result_cache import OcrResultCache
+
+
+def test_key_depends_on_content_and_options():
+    key = OcrResultCache.make_key(b'image', 'en', 'standard', ['denoise'], True)
+    assert key == OcrResultCache.make_key(b'image', 'en', 'standard', ['denoise'], True)
+    assert key != OcrResultCache.make_key(b'other', 'en', 'standard', ['denoise'], True)
+    assert key != OcrResultCache.make_key(b'image', 'ja', 'standard', ['denoise'], True)
+    assert key != OcrResultCache.make_key(b'image', 'en', 'fast', ['denoise'], True)
+    assert key != OcrResultCache.make_key(b'image', 'en', 'standard', [], True)
+    assert key != OcrResultCache.make_key(b'image', 'en', 'standard', ['denoise'], False)
+    assert key != OcrResultCache.make_key(b'image', 'en', 'standard', ['denoise'], True, tiled=True)
+
+
+def test_lru_evicts_oldest_and_counts_hits():
+    cache = OcrResultCache(max_entries=2)
+    cache.put('a', {'text': 'a'})
+    cache.put('b', {'text': 'b'})
+    assert cache.get('a') == {'text': 'a'}
+    cache.put('c', {'text': 'c'})
+    assert cache.get('b') is None
+    assert cache.get('a') == {'text': 'a'}
+    stats = cache.stats()
+    assert stats['hits'] == 2 and stats['misses'] == 1 and stats['evictions'] == 1
+
+
+def test_sqlite_tier_survives_restart(tmp_path):
+    path = str(tmp_path / 'cache.db')
+    OcrResultCache(max_entries=1, db_path=path).put('key', {'text': 'kept'})
+    assert OcrResultCache(max_entries=1, db_path=path).get('key') == {'text': 'kept'}
+
+
+def test_disabled_cache():
+    assert not OcrResultCache(max_entries=0).enabled
+
+
+def test_ocr_options_change_the_server_cache_key(app_module):
+    options = app_module.get_ocr_options(MultiDict())
+    key = app_module.get_cache_key(b'image', options)
+    for name, value in (('tiled', True), ('text_gate', 'heuristic'), ('autoscale', True), ('structured', True),
+                        ('dpi', 300), ('render_dpi', 150)):
+        assert app_module.get_cache_key(b'image', dict(options, **{name: value})) != key, name
+    # Options that never reach the OCR output share the entry
+    assert app_module.get_cache_key(b'image', dict(options, keep_regions=True)) == key
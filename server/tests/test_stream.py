@@ -0,0 +1,73 @@
+import io
+import json
+import cv2
+import numpy as np
+import pytest
+
+
+def read_events(response):
+    """(event, payload) pairs from a Server-Sent Events body."""
+    events = []
+    for block in response.get_data(as_text=True).strip().split('\n\n'):
+        lines = dict(line.split(': ', 1) for line in block.split('\n'))
+        events.append((lines['event'], json.loads(lines['data'])))
+    return events
+
+
+def post(client, path, data, **form):
+    form['file'] = (io.BytesIO(data), 'page.png')
+    return client.post(path, data=form, content_type='multipart/form-data')
+
+
+def test_stream_lines_match_done_text(client, page_png):
+    events = read_events(post(client, '/ocr/stream', page_png, quality='standard', preserve_layout='true'))
+    kinds = [event for event, _ in events]
+    assert kinds[0] == 'start' and kinds[-1] == 'done'
+    assert kinds.count('region') == 3
+    lines = [payload['text'] for event, payload in events if event == 'line']
+    done = events[-1][1]
+    assert lines == ['w10_10 w80_12', 'w10_50']
+    assert '\n'.join(lines) == done['text']
+
+
+def test_stream_done_matches_ocr(client, page_png):
+    streamed = read_events(post(client, '/ocr/stream', page_png, quality='standard', preserve_layout='true'))[-1][1]
+    response = post(client, '/ocr', page_png, quality='standard', preserve_layout='true')
+    assert response.headers['X-OCR-Cache'] == 'hit'
+    assert response.get_json() == streamed
+
+
+@pytest.mark.parametrize('quality', ['fast', 'standard', 'best'])
+def test_structured_stream_done_matches_ocr_with_free_boxes(client, app_module, fake_reader, quality):
+    # A free box above a horizontal one: recognize reports the horizontal box first
+    fake_reader.boxes = [[10, 90, 200, 220], [100, 180, 202, 220]]
+    fake_reader.free_boxes = [[[10, 100], [80, 95], [82, 115], [12, 120]]]
+    page = cv2.imencode('.png', np.full((260, 200, 3), 255, dtype=np.uint8))[1].tobytes()
+    streamed = read_events(post(client, '/ocr/stream', page, quality=quality, structured='true'))[-1][1]
+    assert [region['text'] for region in streamed['regions']] == ['f10_100', 'w10_200', 'w100_202']
+
+    app_module.result_cache.entries.clear()
+    fresh = post(client, '/ocr', page, quality=quality, structured='true')
+    assert fresh.headers['X-OCR-Cache'] == 'miss'
+    assert fresh.get_json() == streamed
+
+
+def test_stream_honours_tiled(client, app_module, fake_reader, page_png):
+    events = read_events(post(client, '/ocr/stream', page_png, tiled='true'))
+    assert 'readtext' in fake_reader.calls
+    streamed = events[-1][1]
+
+    # The streamed body was cached under tiled=true, so /ocr must return exactly what tiled OCR produces
+    hit = post(client, '/ocr', page_png, tiled='true')
+    assert hit.headers['X-OCR-Cache'] == 'hit'
+    app_module.result_cache.entries.clear()
+    fresh = post(client, '/ocr', page_png, tiled='true')
+    assert fresh.headers['X-OCR-Cache'] == 'miss'
+    assert fresh.get_json() == streamed == hit.get_json()
+
+
+def test_stream_cache_key_separates_tiled(client, fake_reader, page_png):
+    read_events(post(client, '/ocr/stream', page_png))
+    assert 'readtext' not in fake_reader.calls
+    response = post(client, '/ocr', page_png, tiled='true')
+    assert response.headers['X-OCR-Cache'] == 'miss'
@@ -0,0 +1,56 @@
+import cv2
+import numpy as np
+import pytest
+from text_gate import check_text, parse_gate
+
+
+def render(text, scale=1.0, thickness=2, size=(300, 400), inverted=False):
+    background, ink = (30, 230) if inverted else (255, 0)
+    img = np.full(size + (3,), background, dtype=np.uint8)
+    cv2.putText(img, text, (20, size[0] // 2), cv2.FONT_HERSHEY_SIMPLEX, scale, (ink,) * 3, thickness)
+    return img
+
+
+@pytest.mark.parametrize('text', ['OK', 'Hi', 'hello', 'Submit', 'Total: 42', 'Hello World'])
+def test_short_words_pass(text):
+    result = check_text(render(text), 'heuristic')
+    assert result['text_likely'], result
+
+
+@pytest.mark.parametrize('text', ['OK', 'hello'])
+def test_light_on_dark_and_large_pages_pass(text):
+    assert check_text(render(text, inverted=True), 'heuristic')['text_likely']
+    # Small text on a page that is downscaled before the check
+    assert check_text(render(text, scale=3, thickness=6, size=(1200, 1600)), 'heuristic')['text_likely']
+
+
+def blank():
+    return np.full((300, 400, 3), 255, dtype=np.uint8)
+
+
+def gradient():
+    return np.tile(np.linspace(0, 255, 400, dtype=np.uint8), (300, 1))[..., None].repeat(3, axis=2)
+
+
+def blurred_noise():
+    noise = np.random.default_rng(0).integers(0, 255, (300, 400, 3), dtype=np.uint8)
+    return cv2.GaussianBlur(noise, (0, 0), 8)
+
+
+def ring():
+    img = blank()
+    cv2.circle(img, (200, 150), 40, (0, 0, 0), 3)
+    return img
+
+
+@pytest.mark.parametrize('make', [blank, gradient, blurred_noise, ring])
+def test_images_without_text_are_skipped(make):
+    result = check_text(make(), 'heuristic')
+    assert not result['text_likely'], result
+
+
+def test_parse_gate():
+    assert parse_gate('true') == 'heuristic'
+    assert parse_gate('Detector') == 'detector'
+    assert parse_gate('off') is None
+    assert parse_gate(None) is None
@@ -0,0 +1,70 @@
+import numpy as np
+from tiling import iter_tiles, merge_tile_results, readtext_tiled, tile_starts
+
+
+def test_tiles_overlap_and_end_at_the_edge():
+    assert tile_starts(500, 600, 200) == [0]
+    assert tile_starts(1000, 600, 200) == [0, 400]
+    assert tile_starts(1500, 600, 200) == [0, 400, 800, 900]
+    tiles = list(iter_tiles((1000, 700), 600, 200))
+    assert tiles == [(0, 0, 600, 600), (100, 0, 700, 600), (0, 400, 600, 1000), (100, 400, 700, 1000)]
+
+
+def box(x0, y0, x1, y1):
+    return [[x0, y0], [x1, y0], [x1, y1], [x0, y1]]
+
+
+def test_merge_drops_text_cut_off_at_a_seam():
+    regions = [(box(380, 100, 470, 130), 'seam', 0.9),
+               (box(400, 100, 470, 130), 'am', 0.95),  # the same word, cut off by the next tile
+               (box(100, 100, 200, 130), 'left', 0.8),
+               (box(100, 160, 200, 190), 'below', 0.8)]
+    merged = merge_tile_results(regions)
+    assert [region[1] for region in merged] == ['left', 'seam', 'below']
+
+
+def test_merge_keeps_the_more_confident_of_equal_boxes():
+    merged = merge_tile_results([(box(0, 0, 50, 20), 'low', 0.4), (box(0, 0, 50, 20), 'high', 0.9)])
+    assert [region[1] for region in merged] == ['high']
+
+
+class PageReader:
+    """Reads words placed on a page from whichever tile view it is given, clipping them at the tile edge."""
+
+    def __init__(self, page, words):
+        self.page = page
+        self.words = words
+        self.tiles = []
+
+    def readtext(self, img, paragraph=False, detail=1, **kwargs):
+        # Tiles are views into the page, so their offset follows from the data pointers
+        offset = img.ctypes.data - self.page.ctypes.data
+        y0, x0 = offset // self.page.strides[0], (offset % self.page.strides[0]) // self.page.strides[1]
+        height, width = img.shape[:2]
+        self.tiles.append((x0, y0))
+        regions = []
+        for (bx0, by0, bx1, by1), text in self.words:
+            cx0, cy0 = max(bx0, x0), max(by0, y0)
+            cx1, cy1 = min(bx1, x0 + width), min(by1, y0 + height)
+            if cx0 < cx1 and cy0 < cy1:
+                clipped = (cx1 - cx0) < (bx1 - bx0)
+                regions.append((box(cx0 - x0, cy0 - y0, cx1 - x0, cy1 - y0), text[:2] if clipped else text, 0.9))
+        return regions
+
+
+def test_readtext_tiled_maps_tiles_back_to_the_page():
+    page = np.zeros((1000, 1000, 3), dtype=np.uint8)
+    words = [((380, 100, 470, 130), 'seam'), ((100, 100, 200, 130), 'left'), ((550, 700, 650, 730), 'lower')]
+    reader = PageReader(page, words)
+    result = readtext_tiled(reader, page, tile_size=600, overlap=200, workers=2)
+    assert sorted(reader.tiles) == [(0, 0), (0, 400), (400, 0), (400, 400)]
+    assert result == [(box(100, 100, 200, 130), 'left', 0.9), (box(380, 100, 470, 130), 'seam', 0.9),
+                      (box(550, 700, 650, 730), 'lower', 0.9)]
+    assert readtext_tiled(reader, page, detail=0, tile_size=600, overlap=200) == ['left', 'seam', 'lower']
+
+
+def test_small_images_are_read_whole():
+    page = np.zeros((300, 400, 3), dtype=np.uint8)
+    reader = PageReader(page, [((10, 10, 50, 30), 'word')])
+    assert readtext_tiled(reader, page, tile_size=600, overlap=200) == [(box(10, 10, 50, 30), 'word', 0.9)]
+    assert reader.tiles == [(0, 0)]
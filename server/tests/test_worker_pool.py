@@ -0,0 +1,120 @@
+import io
+import os
+import pytest
+from worker_pool import OcrExecutor, QueueFullError
+from reader_pool import merge_pool_stats
+
+
+def test_queue_full_reports_retry_after():
+    executor = OcrExecutor(workers=0, max_pending=2)
+    executor.acquire(2)
+    with pytest.raises(QueueFullError) as error:
+        executor.run(len, 'abc')
+    assert error.value.retry_after >= 1
+    assert executor.stats()['rejected'] == 1
+    executor.release(2)
+    assert executor.run(len, 'abc') == 3
+
+
+def test_merge_pool_stats_sums_workers():
+    worker = {'readers': 1, 'max_readers': 3, 'bytes': 100, 'max_bytes': 1000, 'loading': ['en_fast'],
+              'loads': 2, 'evictions': 1, 'entries': []}
+    merged = merge_pool_stats({11: worker, 12: dict(worker, loading=[])})
+    assert merged['readers'] == 2
+    assert merged['bytes'] == 200
+    assert merged['loads'] == 4
+    assert merged['loading'] == ['en_fast']
+    assert set(merged['workers']) == {'11', '12'}
+
+
+def test_process_pool_collects_worker_reader_stats():
+    pytest.importorskip('easyocr')
+    executor = OcrExecutor(workers=1)
+    try:
+        assert executor.reader_pool_stats()['workers'] == {}
+        pid = executor.run(os.getpid)
+        stats = executor.reader_pool_stats()
+        assert pid != os.getpid()
+        assert list(stats['workers']) == [str(pid)]
+        assert stats['readers'] == 0
+    finally:
+        executor.shutdown()
+
+
+def test_imap_takes_slots_only_while_iterating():
+    executor = OcrExecutor(workers=0, max_pending=1)
+    results = executor.imap(len, [('a',), ('bb',), ('ccc',)], window=3)
+    # Nothing is reserved before the first result is asked for, so other work still fits
+    assert executor.stats()['pending'] == 0
+    assert executor.run(len, 'abcd') == 4
+    assert next(results) == 1
+    results.close()
+    assert executor.stats()['pending'] == 0
+
+
+def test_imap_raises_queue_full_when_iterated():
+    executor = OcrExecutor(workers=0, max_pending=1)
+    executor.acquire()
+    results = executor.imap(len, [('a',)], window=1)
+    with pytest.raises(QueueFullError):
+        next(results)
+    executor.release()
+    assert executor.stats()['pending'] == 0
+
+
+def test_process_imap_releases_slots_when_closed_early():
+    pytest.importorskip('easyocr')
+    executor = OcrExecutor(workers=1, max_pending=4)
+    try:
+        results = executor.imap(abs, [(-index,) for index in range(6)], window=2)
+        assert executor.stats()['pending'] == 0
+        assert [next(results), next(results)] == [0, 1]
+        assert executor.stats()['pending'] == 1  # the next page is already submitted
+        results.close()
+        assert executor.stats()['pending'] == 0
+        assert list(executor.imap(abs, [(-index,) for index in range(6)], window=2)) == list(range(6))
+        assert executor.stats()['pending'] == 0
+    finally:
+        executor.shutdown()
+
+
+def test_ocr_returns_503_with_retry_after_when_full(client, app_module, page_png, monkeypatch):
+    executor = OcrExecutor(workers=0, max_pending=1)
+    monkeypatch.setattr(app_module, 'executor', executor)
+    executor.acquire()
+    response = client.post('/ocr', data={'file': (io.BytesIO(page_png), 'page.png')},
+                           content_type='multipart/form-data')
+    assert response.status_code == 503
+    assert int(response.headers['Retry-After']) >= 1
+    executor.release()
+    response = client.post('/ocr', data={'file': (io.BytesIO(page_png), 'page.png')},
+                           content_type='multipart/form-data')
+    assert response.status_code == 200
+
+
+def test_inline_stream_holds_its_slot_until_closed():
+    executor = OcrExecutor(workers=0, max_pending=1)
+    items = executor.stream(range, 3)
+    with pytest.raises(QueueFullError):
+        executor.stream(range, 3)
+    assert next(items) == 0
+    items.close()
+    assert executor.stats()['pending'] == 0
+    assert list(executor.stream(range, 3)) == [0, 1, 2]
+    assert executor.stats()['pending'] == 0
+
+
+def test_process_stream_runs_on_a_worker():
+    pytest.importorskip('easyocr')
+    executor = OcrExecutor(workers=1, max_pending=1)
+    try:
+        items = executor.stream(range, 3)
+        with pytest.raises(QueueFullError):
+            executor.stream(range, 3)
+        assert list(items) == [0, 1, 2]
+        assert len(executor.reader_pool_stats()['workers']) == 1
+        with pytest.raises(ValueError):
+            list(executor.stream(int, 'x'))
+        assert executor.stats()['pending'] == 0
+    finally:
+        executor.shutdown()
@@ -0,0 +1,142 @@
+import os
+import numpy as np
+import cv2
+from preprocessing import to_gray
+
+# Gate applied when a request does not choose one: off, heuristic or detector
+TEXT_GATE_DEFAULT = os.environ.get('OCR_TEXT_GATE', 'off').lower()
+
+# The check runs on a copy whose longest side is at most this many pixels
+TEXT_GATE_MAX_SIDE = int(os.environ.get('OCR_TEXT_GATE_MAX_SIDE', 1024))
+# Heuristic thresholds: share of edge pixels, and character-like blobs lined up in runs. The defaults only
+# skip clear negatives, images with almost no edges or with no run of character-like blobs at all
+TEXT_GATE_MIN_EDGE_DENSITY = float(os.environ.get('OCR_TEXT_GATE_MIN_EDGE_DENSITY', 0.00005))
+TEXT_GATE_MIN_REGIONS = int(os.environ.get('OCR_TEXT_GATE_MIN_REGIONS', 1))
+# Detector threshold: boxes the detector must find on the downscaled copy
+TEXT_GATE_MIN_BOXES = int(os.environ.get('OCR_TEXT_GATE_MIN_BOXES', 1))
+
+GATE_METHODS = ('heuristic', 'detector')
+
+# Character candidates are at least this tall on the downscaled copy, and at most this share of its height
+MIN_CHAR_HEIGHT = 4
+MAX_CHAR_HEIGHT_RATIO = 0.3
+# Small text blurs into word-sized blobs when downscaled, so candidates may be several times wider than tall
+MAX_CHAR_ASPECT = 5.0
+# Edge pixels inside a candidate's box, relative to its perimeter, for it to count as outlined
+MIN_EDGE_SUPPORT = 0.3
+# Characters a run needs before its candidates count towards TEXT_GATE_MIN_REGIONS
+MIN_CHAIN = 2
+# A lone candidate at least this many times wider than tall is taken for a word whose letters merged
+MIN_WORD_ASPECT = 2.0
+# Past this many candidates the image is busy enough that the recognizer should decide
+MAX_CANDIDATES = 2000
+
+
+def parse_gate(value):
+    """Normalize a requested gate to 'heuristic', 'detector' or None."""
+    value = str(value or '').lower()
+    if value in ('true', '1', 't', 'on'):
+        return 'heuristic'
+    return value if value in GATE_METHODS else None
+
+
+def downscale(img, max_side=TEXT_GATE_MAX_SIDE):
+    gray = to_gray(img)
+    height, width = gray.shape
+    scale = max_side / float(max(height, width))
+    if scale < 1:
+        gray = cv2.resize(gray, None, fx=scale, fy=scale, interpolation=cv2.INTER_AREA)
+    return gray
+
+
+def candidate_boxes(gray):
+    """Boxes of dark-on-light and light-on-dark blobs that stand out from their surroundings."""
+    boxes = []
+    for polarity, offset in ((cv2.THRESH_BINARY_INV, 15), (cv2.THRESH_BINARY, -15)):
+        # Local thresholding ignores smooth shading, so only sharp, contrasting shapes become components
+        mask = cv2.adaptiveThreshold(gray, 255, cv2.ADAPTIVE_THRESH_MEAN_C, polarity, 31, offset)
+        _, _, stats, _ = cv2.connectedComponentsWithStats(mask, connectivity=8)
+        boxes.append(stats[1:, :4])
+    return np.concatenate(boxes)
+
+
+def character_boxes(gray, edges):
+    """Boxes of blobs shaped like characters and outlined by edges."""
+    boxes = candidate_boxes(gray)
+    x, y, w, h = boxes[:, 0], boxes[:, 1], boxes[:, 2], boxes[:, 3]
+    aspect = w / np.maximum(h, 1)
+    shaped = ((h >= MIN_CHAR_HEIGHT) & (h <= gray.shape[0] * MAX_CHAR_HEIGHT_RATIO)
+              & (aspect >= 0.1) & (aspect <= MAX_CHAR_ASPECT))
+
+    # Glyphs have sharp outlines; soft blobs in photos have few edge pixels along their perimeter
+    # Canny puts edges on either side of the contrast step, so thin strokes are measured with a one pixel margin
+    edges = cv2.integral((edges > 0).astype(np.uint8))
+    x0 = np.maximum(x - 1, 0)
+    y0 = np.maximum(y - 1, 0)
+    x1 = np.minimum(x + w + 1, gray.shape[1])
+    y1 = np.minimum(y + h + 1, gray.shape[0])
+    edge_pixels = edges[y1, x1] - edges[y0, x1] - edges[y1, x0] + edges[y0, x0]
+    outlined = edge_pixels >= MIN_EDGE_SUPPORT * 2 * (w + h)
+    return boxes[shaped & outlined]
+
+
+def text_runs(boxes):
+    """The boxes that line up with similar neighbours in runs of at least MIN_CHAIN, as characters in text do."""
+
+    x, y, w, h = (boxes[:, i].astype(np.float32) for i in range(4))
+    center_y = y + h / 2
+    # Neighbours have a similar height, overlap vertically and are within two heights horizontally, without
+    # one sitting inside the other the way a ring's hole sits inside the ring
+    similar = np.maximum(h[:, None], h[None, :]) <= 1.5 * np.minimum(h[:, None], h[None, :])
+    aligned = np.abs(center_y[:, None] - center_y[None, :]) <= 0.5 * np.minimum(h[:, None], h[None, :])
+    gap = np.maximum(x[None, :] - (x + w)[:, None], x[:, None] - (x + w)[None, :])
+    near = ((gap <= 2 * np.maximum(h[:, None], h[None, :]))
+            & (gap > -0.5 * np.minimum(w[:, None], w[None, :])))
+    neighbours = similar & aligned & near
+
+    group = np.arange(len(boxes))
+    for i, j in zip(*np.nonzero(np.triu(neighbours))):
+        root_i, root_j = find_root(group, i), find_root(group, j)
+        group[max(root_i, root_j)] = min(root_i, root_j)
+    roots = np.array([find_root(group, i) for i in range(len(boxes))])
+    _, inverse, sizes = np.unique(roots, return_inverse=True, return_counts=True)
+    # A short word whose letters ran together is a run on its own
+    return boxes[(sizes[inverse] >= MIN_CHAIN) | (w >= MIN_WORD_ASPECT * h)]
+
+
+def character_regions(gray, edges):
+    """Count character-like blobs that sit in runs of text."""
+    boxes = character_boxes(gray, edges)
+    if len(boxes) > MAX_CANDIDATES:
+        return len(boxes)
+    return len(text_runs(boxes))
+
+
+def find_root(group, i):
+    while group[i] != i:
+        group[i] = group[group[i]]
+        i = group[i]
+    return i
+
+
+def check_text(img, method, reader=None):
+    """Cheaply decide whether an image likely holds text, returning a dict with 'text_likely' and what was measured.
+
+    The check errs towards running OCR; only images that clearly lack text are reported as empty.
+    """
+    gray = downscale(img)
+    if method == 'detector':
+        horizontal_list, free_list = reader.detect(gray)
+        boxes = len(horizontal_list[0]) + len(free_list[0])
+        return {'method': method, 'text_likely': boxes >= TEXT_GATE_MIN_BOXES, 'boxes': boxes}
+
+    edges = cv2.Canny(gray, 50, 150)
+    density = cv2.countNonZero(edges) / float(edges.size)
+    # Blank and smoothly shaded images are rejected on edges alone, before any component analysis
+    regions = character_regions(gray, edges) if density >= TEXT_GATE_MIN_EDGE_DENSITY else 0
+    return {
+        'method': method,
+        'text_likely': density >= TEXT_GATE_MIN_EDGE_DENSITY and regions >= TEXT_GATE_MIN_REGIONS,
+        'edge_density': round(density, 5),
+        'regions': regions
+    }
@@ -0,0 +1,113 @@
+import os
+from concurrent.futures import ThreadPoolExecutor
+from easyocr.utils import get_paragraph
+
+# Tile geometry for very large images; the overlap should exceed the tallest expected line of text
+TILE_SIZE = int(os.environ.get('OCR_TILE_SIZE', 1280))
+TILE_OVERLAP = int(os.environ.get('OCR_TILE_OVERLAP', 160))
+TILE_WORKERS = int(os.environ.get('OCR_TILE_WORKERS', 2))
+# Boxes sharing more than this share of the smaller box's area are treated as the same text
+DUPLICATE_OVERLAP = 0.5
+GRID_CELL = 256
+
+
+def tile_starts(length, tile_size, overlap):
+    """Start offsets along one axis so consecutive tiles overlap and the last tile ends at the edge."""
+    if length <= tile_size:
+        return [0]
+    step = max(1, tile_size - overlap)
+    starts = list(range(0, length - tile_size, step))
+    starts.append(length - tile_size)
+    return starts
+
+
+def iter_tiles(shape, tile_size=TILE_SIZE, overlap=TILE_OVERLAP):
+    """Yield (x0, y0, x1, y1) tile rectangles covering an image of the given shape."""
+    height, width = shape[:2]
+    for y0 in tile_starts(height, tile_size, overlap):
+        for x0 in tile_starts(width, tile_size, overlap):
+            yield x0, y0, min(x0 + tile_size, width), min(y0 + tile_size, height)
+
+
+def _bounds(box):
+    xs = [p[0] for p in box]
+    ys = [p[1] for p in box]
+    return min(xs), min(ys), max(xs), max(ys)
+
+
+def _area(bounds):
+    return max(0, bounds[2] - bounds[0]) * max(0, bounds[3] - bounds[1])
+
+
+def merge_tile_results(regions):
+    """Drop regions detected twice in tile overlaps.
+
+    When two regions overlap by more than DUPLICATE_OVERLAP of the smaller one, the larger region is
+    kept, since the smaller one is usually the same text cut off at a tile edge; equal sizes keep the
+    more confident one.
+    """
+    ranked = sorted(regions, key=lambda r: (_area(_bounds(r[0])), r[2] if len(r) > 2 else 0), reverse=True)
+    kept = []
+    kept_bounds = []
+    grid = {}  # Coarse spatial index so each region is only compared with its neighbours
+    for region in ranked:
+        bounds = _bounds(region[0])
+        area = _area(bounds)
+        cells = [(cx, cy)
+                 for cx in range(int(bounds[0]) // GRID_CELL, int(bounds[2]) // GRID_CELL + 1)
+                 for cy in range(int(bounds[1]) // GRID_CELL, int(bounds[3]) // GRID_CELL + 1)]
+        candidates = {index for cell in cells for index in grid.get(cell, ())}
+
+        duplicate = False
+        for index in candidates:
+            other = kept_bounds[index]
+            ix = min(bounds[2], other[2]) - max(bounds[0], other[0])
+            iy = min(bounds[3], other[3]) - max(bounds[1], other[1])
+            if ix <= 0 or iy <= 0:
+                continue
+            smaller = min(area, _area(other))
+            if smaller > 0 and ix * iy / smaller > DUPLICATE_OVERLAP:
+                duplicate = True
+                break
+        if not duplicate:
+            for cell in cells:
+                grid.setdefault(cell, []).append(len(kept))
+            kept.append(region)
+            kept_bounds.append(bounds)
+
+    # Restore reading order (top to bottom, then left to right)
+    order = sorted(range(len(kept)), key=lambda i: (kept_bounds[i][1], kept_bounds[i][0]))
+    return [kept[i] for i in order]
+
+
+def readtext_tiled(reader, img, paragraph=False, detail=1, tile_size=TILE_SIZE, overlap=TILE_OVERLAP,
+                   workers=TILE_WORKERS, **kwargs):
+    """Run reader.readtext over overlapping tiles and merge the regions back into page coordinates.
+
+    Tiles are views into img, so only the detector's per-tile buffers are allocated; peak memory
+    grows with tile size and worker count rather than with the page size.
+    """
+    tiles = list(iter_tiles(img.shape, tile_size, overlap))
+    if len(tiles) == 1:
+        return reader.readtext(img, paragraph=paragraph, detail=detail, **kwargs)
+
+    def recognize_tile(tile):
+        x0, y0, x1, y1 = tile
+        # Regions are recognized individually so they can be de-duplicated before grouping
+        regions = reader.readtext(img[y0:y1, x0:x1], paragraph=False, detail=1, **kwargs)
+        return [([[p[0] + x0, p[1] + y0] for p in box], text, confidence)
+                for box, text, confidence in regions]
+
+    print(f"Tiled OCR: {len(tiles)} tiles of {tile_size}px with {overlap}px overlap")
+
+    with ThreadPoolExecutor(max_workers=max(1, workers)) as pool:
+        regions = [region for tile_regions in pool.map(recognize_tile, tiles) for region in tile_regions]
+
+    result = merge_tile_results(regions)
+
+    if paragraph:
+        # Group the merged regions into paragraphs the same way readtext(paragraph=True) does
+        result = get_paragraph(result)
+    if detail == 0:
+        return [region[1] for region in result]
+    return result
@@ -0,0 +1,324 @@
+import os
+import math
+import time
+import queue
+import threading
+import multiprocessing
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from reader_pool import merge_pool_stats
+
+
+class QueueFullError(RuntimeError):
+    """Raised when the OCR queue is at capacity and a request should be retried later."""
+
+    def __init__(self, retry_after):
+        super().__init__(f'OCR queue is full, retry after {retry_after}s')
+        self.retry_after = retry_after
+
+
+def init_worker(threads, pin_cpus, counter, preload):
+    """Process initializer: cap per-worker thread pools and optionally pin the worker to its own cores."""
+    # Spawn has already imported server.py, and with it torch and cv2, so thread environment variables
+    # would come too late for them; their pools are capped by the calls below instead. OMP_NUM_THREADS
+    # is still set because ONNX Runtime sessions, created later, size their thread pool from it.
+    os.environ['OMP_NUM_THREADS'] = str(threads)
+
+    import cv2
+    cv2.setNumThreads(threads)
+    try:
+        import torch
+        torch.set_num_threads(threads)
+        torch.set_num_interop_threads(1)
+    except (ImportError, RuntimeError):
+        pass
+
+    if pin_cpus and hasattr(os, 'sched_setaffinity'):
+        with counter.get_lock():
+            index = counter.value
+            counter.value += 1
+        cpus = sorted(os.sched_getaffinity(0))
+        start = (index * threads) % len(cpus)
+        os.sched_setaffinity(0, [cpus[(start + i) % len(cpus)] for i in range(min(threads, len(cpus)))])
+
+    if preload:
+        import ocr_engine
+        ocr_engine.preload_readers(blocking=True)
+
+
+def run_task(fn, args):
+    """Worker-side wrapper: run fn(*args) and return it with this worker's pid and reader pool stats.
+
+    The readers live in the workers, so the parent only learns about them through these snapshots.
+    """
+    import ocr_engine
+    return fn(*args), os.getpid(), ocr_engine.reader_pool.stats()
+
+
+def run_stream_task(fn, args, events):
+    """Worker-side wrapper for a generator: put each item fn(*args) yields on events, then None.
+
+    Returns like run_task, with None as the result, so the parent still gets this worker's stats.
+    """
+    import ocr_engine
+    try:
+        for item in fn(*args):
+            events.put(item)
+    finally:
+        events.put(None)
+    return None, os.getpid(), ocr_engine.reader_pool.stats()
+
+
+class StreamedTask:
+    """Iterator over a streamed task's items; closing it (or running out) calls on_close once."""
+
+    def __init__(self, items, on_close=None):
+        self.items = iter(items)
+        self.on_close = on_close
+
+    def __iter__(self):
+        return self
+
+    def __next__(self):
+        try:
+            return next(self.items)
+        except BaseException:
+            self.close()
+            raise
+
+    def close(self):
+        if hasattr(self.items, 'close'):
+            self.items.close()
+        on_close, self.on_close = self.on_close, None
+        if on_close is not None:
+            on_close()
+
+
+class OcrExecutor:
+    """Runs OCR tasks inline or on a process pool, rejecting work once max_pending tasks are in flight."""
+
+    def __init__(self, workers=0, threads_per_worker=1, max_pending=64, pin_cpus=False):
+        self.workers = workers
+        self.threads_per_worker = threads_per_worker
+        self.max_pending = max_pending
+        self.pin_cpus = pin_cpus
+        self.pending = 0
+        self.completed = 0
+        self.rejected = 0
+        self.restarts = 0
+        self.busy_seconds = 0.0
+        self.worker_stats = {}  # pid -> reader pool stats returned with that worker's latest task
+        self.lock = threading.Lock()
+        self.context = multiprocessing.get_context('spawn')
+        self.manager = None  # started on the first stream, to carry its items back from the worker
+        self.pool = self._create_pool() if workers > 0 else None
+
+    def _create_pool(self):
+        # Spawn rather than fork so workers never inherit the parent's torch/OpenMP thread state
+        context = self.context
+        counter = context.Value('i', 0)
+        return ProcessPoolExecutor(
+            max_workers=self.workers,
+            mp_context=context,
+            initializer=init_worker,
+            initargs=(self.threads_per_worker, self.pin_cpus, counter, True),
+        )
+
+    def retry_after(self):
+        """Estimate how many seconds it takes to drain the current queue."""
+        average = self.busy_seconds / self.completed if self.completed else 1.0
+        seconds = average * self.pending / max(self.workers, 1)
+        return max(1, min(60, math.ceil(seconds)))
+
+    def acquire(self, count=1):
+        """Reserve queue slots for work run outside the executor (e.g. streaming responses)."""
+        with self.lock:
+            if self.pending + count > self.max_pending:
+                self.rejected += 1
+                raise QueueFullError(self.retry_after())
+            self.pending += count
+
+    def release(self, count=1, elapsed=0.0):
+        with self.lock:
+            self.pending -= count
+            self.completed += count
+            self.busy_seconds += elapsed
+
+    def _handle_broken_pool(self, pool):
+        # A worker died (e.g. OOM killed); replace the pool once so later requests still work
+        with self.lock:
+            if self.pool is pool:
+                self.restarts += 1
+                self.worker_stats.clear()
+                self.pool = self._create_pool()
+
+    def _unwrap(self, outcome):
+        result, pid, stats = outcome
+        with self.lock:
+            self.worker_stats[pid] = stats
+        return result
+
+    def reader_pool_stats(self):
+        """Reader pool stats per worker, as of each worker's latest task, with totals across workers."""
+        with self.lock:
+            snapshots = dict(self.worker_stats)
+        return merge_pool_stats(snapshots)
+
+    def run(self, fn, *args):
+        """Run fn(*args) and return its result, or raise QueueFullError if the queue is full."""
+        return self.run_many(fn, [args])[0]
+
+    def run_many(self, fn, arg_list):
+        """Run fn once per argument tuple, in parallel when a process pool is available."""
+        arg_list = list(arg_list)
+        self.acquire(len(arg_list))
+
+        start_time = time.time()
+        try:
+            pool = self.pool
+            if pool is None:
+                return [fn(*args) for args in arg_list]
+            try:
+                futures = [pool.submit(run_task, fn, args) for args in arg_list]
+                return [self._unwrap(future.result()) for future in futures]
+            except BrokenProcessPool:
+                self._handle_broken_pool(pool)
+                raise
+        finally:
+            self.release(len(arg_list), time.time() - start_time)
+
+    def imap(self, fn, arg_list, window):
+        """Return a generator of fn(*args) per argument tuple, in order, with at most window tasks in flight.
+        
+        Each task takes its queue slot just before it is submitted and gives it back once its result is
+        taken, so a generator that is never iterated holds no slots; QueueFullError is raised by the
+        generator when a task cannot get one. Later tasks are only submitted as earlier results are taken.
+        """
+        return self._imap(fn, list(arg_list), max(1, window))
+
+    def _imap(self, fn, arg_list, window):
+        futures = deque()  # (future, submit time)
+        pool = self.pool
+        try:
+            for args in arg_list:
+                if pool is None:
+                    yield self.run(fn, *args)
+                    continue
+                if len(futures) >= window:
+                    yield self._take(futures)
+                self.acquire()
+                try:
+                    futures.append((pool.submit(run_task, fn, args), time.time()))
+                except BaseException:
+                    self._drop(1)
+                    raise
+            while futures:
+                yield self._take(futures)
+        except BrokenProcessPool:
+            self._handle_broken_pool(pool)
+            raise
+        finally:
+            # Pages not yet started are dropped when the consumer stops early
+            for future, _ in futures:
+                future.cancel()
+            self._drop(len(futures))
+
+    def stream(self, fn, *args):
+        """Run the generator function fn(*args), on a worker when pooled, and return a StreamedTask of its items.
+        
+        The queue slot is taken here, so QueueFullError is raised before any item is read. It is held until
+        the task finishes on a worker, or until the StreamedTask is exhausted or closed when run inline.
+        """
+        self.acquire()
+        start_time = time.time()
+        pool = self.pool
+        released = threading.Lock()
+
+        def release_once(_=None):
+            # Called when the items run out or are closed and again by a worker's callback; only the first counts
+            if released.acquire(blocking=False):
+                self.release(elapsed=time.time() - start_time)
+
+        try:
+            if pool is None:
+                return StreamedTask(fn(*args), release_once)
+            events = self._event_queue()
+            future = pool.submit(run_stream_task, fn, args, events)
+        except BaseException:
+            release_once()
+            raise
+        future.add_done_callback(release_once)
+        return StreamedTask(self._stream_items(pool, future, events, release_once))
+
+    def _stream_items(self, pool, future, events, release_once):
+        try:
+            while True:
+                try:
+                    item = events.get(timeout=1.0)
+                except queue.Empty:
+                    # The worker puts None last, so an empty queue after it finished means it died
+                    if future.done():
+                        self._unwrap(future.result())
+                        return
+                    continue
+                if item is None:
+                    self._unwrap(future.result())
+                    return
+                yield item
+        except BrokenProcessPool:
+            self._handle_broken_pool(pool)
+            raise
+        finally:
+            # A consumer that stops early leaves the slot to the callback, held until the worker is done
+            if future.done():
+                release_once()
+
+    def _event_queue(self):
+        with self.lock:
+            if self.manager is None:
+                self.manager = self.context.Manager()
+            return self.manager.Queue()
+
+    def _take(self, futures):
+        future, submitted = futures.popleft()
+        try:
+            return self._unwrap(future.result())
+        finally:
+            self.release(elapsed=time.time() - submitted)
+
+    def _drop(self, count):
+        # Give back slots of tasks that never completed
+        with self.lock:
+            self.pending -= count
+
+    def stats(self):
+        with self.lock:
+            return {
+                'mode': 'process' if self.pool is not None else 'inline',
+                'workers': self.workers,
+                'threads_per_worker': self.threads_per_worker,
+                'pending': self.pending,
+                'max_pending': self.max_pending,
+                'completed': self.completed,
+                'rejected': self.rejected,
+                'restarts': self.restarts,
+            }
+
+    def shutdown(self):
+        if self.pool is not None:
+            self.pool.shutdown(wait=False, cancel_futures=True)
+        if self.manager is not None:
+            self.manager.shutdown()
+
+
+def create_executor(production=False):
+    """Build the OCR executor from environment configuration."""
+    threads = int(os.environ.get('OCR_WORKER_THREADS', 1))
+    default_workers = max(1, (os.cpu_count() or 1) // threads) if production else 0
+    return OcrExecutor(
+        workers=int(os.environ.get('OCR_WORKERS', default_workers)),
+        threads_per_worker=threads,
+        max_pending=int(os.environ.get('OCR_MAX_QUEUE', 64)),
+        pin_cpus=os.environ.get('OCR_PIN_CPUS', '0').lower() in ('true', '1', 't'),
+    )
@@ -169,4 +169,104 @@ export class OcrService {
             throw new Error('Failed to process image with EasyOCR. Is the server running?');
         }
     }
+
+    /**
+     * Process image with EasyOCR server, streaming regions as they are recognized and then the laid out lines
+     */
+    static async processWithEasyOCRStream(
+        imageFile: File,
+        language: string,
+        quality: string = 'standard',
+        preprocessing: string[] = [],
+        progressCallback: (progress: OcrProgress) => void,
+        preserveLayout: boolean = true,
+        partialTextCallback: (text: string) => void = () => {}
+    ): Promise<OcrResult> {
+        progressCallback({ progress: 0.1, status: 'uploading' });
+
+        const formData = new FormData();
+        formData.append('file', imageFile);
+        formData.append('language', language);
+        formData.append('quality', quality);
+        formData.append('preserve_layout', preserveLayout.toString());
+        preprocessing.forEach(step => {
+            formData.append('preprocessing', step);
+        });
+
+        // EventSource only supports GET, so read the event stream from a fetch response body
+        const response = await fetch(`${this.SERVER_URL}/ocr/stream`, {
+            method: 'POST',
+            body: formData
+        });
+        if (!response.ok || !response.body) {
+            throw new Error('Failed to process image with EasyOCR. Is the server running?');
+        }
+
+        const reader = response.body.getReader();
+        const decoder = new TextDecoder();
+        const lines: string[] = [];
+        const regionTexts: string[] = [];
+        let totalRegions = 0;
+        let buffer = '';
+        let finalData: any = null;
+
+        const handleEvent = (event: string, data: any) => {
+            switch (event) {
+                case 'start':
+                    totalRegions = data.regions;
+                    progressCallback({ progress: 0.2, status: 'processing' });
+                    break;
+                case 'region':
+                    regionTexts.push(data.text);
+                    if (totalRegions > 0) {
+                        progressCallback({ progress: 0.2 + 0.75 * regionTexts.length / totalRegions, status: 'recognizing' });
+                    }
+                    // Laid out lines only arrive once every region is recognized
+                    partialTextCallback(regionTexts.join(' '));
+                    break;
+                case 'line':
+                    lines[data.index] = data.text;
+                    partialTextCallback(lines.join('\n'));
+                    break;
+                case 'done':
+                    finalData = data;
+                    break;
+                case 'error':
+                    throw new Error(data.error);
+            }
+        };
+
+        while (true) {
+            const { done, value } = await reader.read();
+            if (done) break;
+            buffer += decoder.decode(value, { stream: true });
+
+            // Events are separated by a blank line
+            let separator = buffer.indexOf('\n\n');
+            while (separator !== -1) {
+                const chunk = buffer.slice(0, separator);
+                buffer = buffer.slice(separator + 2);
+                const event = chunk.match(/^event: (.*)$/m)?.[1] || 'message';
+                const data = chunk.match(/^data: (.*)$/m)?.[1];
+                if (data) {
+                    handleEvent(event, JSON.parse(data));
+                }
+                separator = buffer.indexOf('\n\n');
+            }
+        }
+
+        if (!finalData) {
+            throw new Error('EasyOCR stream ended before the result was complete.');
+        }
+        progressCallback({ progress: 1, status: 'completed' });
+
+        const processedText = TextProcessor.improveText(finalData.text, preserveLayout);
+
+        return {
+            text: processedText,
+            confidence: finalData.confidence || 0,
+            engine: finalData.engine || 'easyocr',
+            words: finalData.words || processedText.split(/\s+/).length
+        };
+    }
 }